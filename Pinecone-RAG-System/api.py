@@ -1,23 +1,50 @@
 # FastAPI Backend for RAG System
 # Serves the RAG pipeline as a REST API for React frontend
 
+import os
+import json
+import time
+import asyncio
+from functools import partial
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Dict, Any
 import uvicorn
 
+import metrics
+from cache import normalize_text
+
 # Import the RAG pipeline
-from rag_llamaindex import query_books, NAMESPACES
+from rag_llamaindex import (
+    query_books, query_books_stream, query_books_batch, get_cache_stats, warmup,
+    warmup_status, NAMESPACES, PIPELINE_PROFILES, BATCH_MAX_QUESTIONS
+)
 
 # ============================================================================
 # API SETUP
 # ============================================================================
 
+# Warm up clients, retrievers and the concept graph in the background at
+# startup; /ready reports 503 until that has finished
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ON_STARTUP:
+        asyncio.get_running_loop().run_in_executor(None, warmup)
+    yield
+
+
 app = FastAPI(
     title="AI Books RAG API",
     description="Production RAG API for querying AI/ML technical books",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware for React frontend
@@ -36,12 +63,176 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ============================================================================
+# CONCURRENCY
+# ============================================================================
+
+# The RAG pipeline is synchronous (Pinecone, OpenAI and Cohere SDK calls), so
+# it runs on a dedicated bounded executor instead of the event loop. Requests
+# beyond PIPELINE_MAX_CONCURRENCY wait in a bounded queue; once that is full
+# new requests get 503 instead of piling up latency for everyone.
+PIPELINE_MAX_CONCURRENCY = int(os.getenv("PIPELINE_MAX_CONCURRENCY", "16"))
+PIPELINE_MAX_QUEUE = int(os.getenv("PIPELINE_MAX_QUEUE", "64"))
+PIPELINE_QUEUE_TIMEOUT_SECONDS = float(os.getenv("PIPELINE_QUEUE_TIMEOUT_SECONDS", "30"))
+
+# Identical requests arriving while one is running share its result
+# instead of each running the pipeline (see SingleFlight)
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "true").lower() == "true"
+
+pipeline_pool = ThreadPoolExecutor(
+    max_workers=PIPELINE_MAX_CONCURRENCY, thread_name_prefix="pipeline"
+)
+
+
+class AdmissionLimiter:
+    """
+    Caps in-flight pipeline executions and the queue waiting for a slot.
+
+    A request is admitted immediately while fewer than max_concurrent are
+    running, waits (up to queue_timeout seconds) while fewer than max_queue
+    are waiting, and is rejected with 503 otherwise.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503, detail="Server busy, try again shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503, detail="Timed out waiting for a free pipeline slot",
+                headers={"Retry-After": "1"}
+            )
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected
+        }
+
+
+admission = AdmissionLimiter(
+    PIPELINE_MAX_CONCURRENCY, PIPELINE_MAX_QUEUE, PIPELINE_QUEUE_TIMEOUT_SECONDS
+)
+
+
+async def run_pipeline(func, *args, **kwargs):
+    """Run a blocking pipeline call on the pipeline executor under admission control."""
+    async with admission.slot():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pipeline_pool, partial(func, *args, **kwargs))
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent pipeline executions.
+
+    The first request for a key (the leader) runs the pipeline; requests for
+    the same key arriving before it finishes (followers) await the leader's
+    result, or its exception, without taking a pipeline slot. If the leader
+    is cancelled (its client went away), the first follower takes over as
+    leader and the rest follow it. Nothing is kept once the leader finishes -
+    repeats after that are the answer cache's job.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._in_flight = {}  # key -> asyncio.Future of the leader's result
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: tuple, func, *args, **kwargs) -> tuple:
+        """
+        run_pipeline(func, ...) once per key across concurrent callers.
+
+        Returns:
+            (result, leader) - the result is shared, so callers must not mutate it
+        """
+        if not self.enabled:
+            return await run_pipeline(func, *args, **kwargs), True
+
+        future = self._in_flight.get(key)
+        while future is not None:
+            # wait (not await): a follower that goes away must not cancel the
+            # leader's result, and a cancelled leader must not cancel followers
+            await asyncio.wait({future})
+            if not future.cancelled():
+                self.coalesced += 1
+                return future.result(), False
+            future = self._in_flight.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark the exception retrieved even if no follower ever awaits it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = future
+        self.leaders += 1
+        try:
+            result = await run_pipeline(func, *args, **kwargs)
+            future.set_result(result)
+            return result, True
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._in_flight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
+
+
+coalescer = SingleFlight(REQUEST_COALESCING)
+
+
+def coalescing_key(endpoint: str, question: str, options: dict) -> tuple:
+    """Normalized question + category + every pipeline option that changes the answer."""
+    return (endpoint, normalize_text(question), tuple(sorted(options.items())))
+
+
 # ============================================================================
 # REQUEST/RESPONSE MODELS
 # ============================================================================
 
-class QueryRequest(BaseModel):
-    question: str
+class QueryOptions(BaseModel):
     category: Optional[str] = "all"
     top_k: Optional[int] = 5
     use_rerank: Optional[bool] = True
@@ -50,6 +241,17 @@ class QueryRequest(BaseModel):
     use_multi_query: Optional[bool] = True  # Generate multiple query variations
     use_hyde: Optional[bool] = True  # Use HyDE for better embedding match
     use_graph: Optional[bool] = True  # Use knowledge graph for concept expansion
+    bypass_cache: Optional[bool] = False  # Skip the semantic answer cache for this request
+    include_timings: Optional[bool] = False  # Return per-stage timing spans in the response
+    profile: Optional[str] = None  # fast | balanced | thorough - caps which stages run
+    max_latency_ms: Optional[int] = None  # Latency budget; optional stages are dropped to fit
+    context_token_budget: Optional[int] = None  # Prompt context tokens (0 = every chunk in full)
+
+class QueryRequest(QueryOptions):
+    question: str
+
+class BatchQueryRequest(QueryOptions):
+    questions: List[str]  # Answered with the same options (at most BATCH_MAX_QUESTIONS)
 
 class Source(BaseModel):
     source: str
@@ -70,9 +272,27 @@ class QueryResponse(BaseModel):
     concepts_found: Optional[List[str]] = []  # Concepts detected in query
     hybrid_search: bool
     reranked: bool
+    reranker: Optional[str] = None  # reranker that ran: "cohere", or "mmr" (local fallback)
+    stage_cache: Optional[Dict[str, bool]] = None  # LLM stage -> served from memo cache
+    answer_cache_hit: Optional[bool] = False  # Answer served from the semantic cache
+    answer_cache_similarity: Optional[float] = None  # Similarity to the cached question
+    timings: Optional[Dict[str, Any]] = None  # Stage spans and candidate counts (include_timings)
+    namespaces_searched: Optional[List[str]] = None  # Namespaces the router selected
+    profile: Optional[str] = None  # Profile the request ran with
+    skipped_stages: Optional[List[str]] = []  # Requested stages the planner skipped
+    estimated_latency_ms: Optional[int] = None  # Planner's latency estimate
+    context_packing: Optional[Dict[str, Any]] = None  # Context tokens before/after packing
     response: str
     sources: List[Source]
 
+class BatchQueryError(BaseModel):
+    question: str
+    error: str
+
+class BatchQueryResponse(BaseModel):
+    results: List[Union[QueryResponse, BatchQueryError]]  # One per question, in order
+    timings: Dict[str, Any]  # Batch total, phases, per-stage stats, shared calls
+
 class NamespaceInfo(BaseModel):
     id: str
     description: str
@@ -81,6 +301,55 @@ class NamespaceInfo(BaseModel):
 # API ENDPOINTS
 # ============================================================================
 
+def pipeline_options(request: QueryOptions) -> dict:
+    """Pipeline keyword arguments (everything but the question) of a request."""
+    return {
+        "namespace": request.category,
+        "top_k": request.top_k,
+        "use_rerank": request.use_rerank,
+        "use_hybrid": request.use_hybrid,
+        "use_query_rewrite": request.use_query_rewrite,
+        "use_multi_query": request.use_multi_query,
+        "use_hyde": request.use_hyde,
+        "use_graph": request.use_graph,
+        "use_answer_cache": not request.bypass_cache,
+        "profile": request.profile,
+        "max_latency_ms": request.max_latency_ms,
+        "context_token_budget": request.context_token_budget
+    }
+
+
+def validate_request(request: QueryOptions):
+    """Reject unknown categories and profiles with 400."""
+    if request.category not in NAMESPACES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid category. Choose from: {list(NAMESPACES.keys())}"
+        )
+    if request.profile is not None and request.profile not in PIPELINE_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid profile. Choose from: {list(PIPELINE_PROFILES.keys())}"
+        )
+
+
+async def coalesced_query(endpoint: str, request: QueryRequest) -> dict:
+    """
+    query_books for a request, run once for identical concurrent requests.
+
+    The leader's trace goes to the metrics; each follower is counted as a
+    coalesced request. Returns a copy that echoes the caller's own question.
+    """
+    options = pipeline_options(request)
+    key = coalescing_key("query_books", request.question, options)
+    result, leader = await coalescer.run(key, query_books, question=request.question, **options)
+    if leader:
+        metrics.observe_trace(endpoint, result["timings"])
+    else:
+        metrics.COALESCED_REQUESTS.labels(endpoint).inc()
+    return {**result, "question": request.question}
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -91,6 +360,16 @@ async def root():
     }
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness check: 200 once warmup has finished, 503 before or if it failed"""
+    status = warmup_status()
+    if not status["ready"] and (not WARMUP_ON_STARTUP or "error" in status):
+        # Warm up on the probe when startup warmup is off, or retry after a failure
+        status = await asyncio.get_running_loop().run_in_executor(None, warmup)
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
 @app.get("/namespaces", response_model=List[NamespaceInfo])
 async def get_namespaces():
     """Get available book categories/namespaces"""
@@ -112,30 +391,127 @@ async def query(request: QueryRequest):
     - **use_hybrid**: Enable hybrid BM25 + vector search (default: true)
     - **use_query_rewrite**: Enable LLM query expansion (default: true)
     - **use_graph**: Enable knowledge graph concept expansion (default: true)
+    - **bypass_cache**: Skip the semantic answer cache (default: false)
+    - **include_timings**: Return per-stage timing spans (default: false)
+    - **profile**: fast, balanced or thorough - caps which stages run (default: flags only)
+    - **max_latency_ms**: Latency budget; optional stages are skipped to fit it
+    - **context_token_budget**: Prompt context tokens; chunks are merged, deduped and packed to fit
+    """
+    try:
+        validate_request(request)
+
+        # Call the RAG pipeline with enhanced retrieval (off the event loop);
+        # identical concurrent requests share one execution
+        result = await coalesced_query("query", request)
+        if not request.include_timings:
+            result = {k: v for k, v in result.items() if k != "timings"}
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    """
+    Streaming version of /query as Server-Sent Events
+
+    Takes the same body as /query and emits:
+    - **sources**: response metadata and sources, as soon as reranking finishes
+    - **token**: `{"delta": ...}` for each piece of the answer
+    - **done**: full answer and timings, including `ttfb_ms` (time to the first event);
+      stage spans are included under `trace` when `include_timings` is set
+    - **error**: `{"detail": ...}` if the pipeline fails mid-stream
+    """
+    validate_request(request)
+
+    async def event_stream():
+        started = time.perf_counter()
+        ttfb_ms = None
+        loop = asyncio.get_running_loop()
+        events = query_books_stream(question=request.question, **pipeline_options(request))
+        step = None
+        try:
+            async with admission.slot():
+                while True:
+                    # Each step of the synchronous generator runs on the pipeline executor
+                    step = pipeline_pool.submit(next, events, None)
+                    event = await asyncio.wrap_future(step)
+                    if event is None:
+                        break
+                    if ttfb_ms is None:
+                        ttfb_ms = round((time.perf_counter() - started) * 1000, 1)
+                        metrics.TIME_TO_FIRST_BYTE.observe(ttfb_ms / 1000)
+                    data = event["data"]
+                    if event["event"] == "done":
+                        timings = {**data["timings"], "ttfb_ms": ttfb_ms}
+                        metrics.observe_trace("query_stream", timings.pop("trace"))
+                        if request.include_timings:
+                            timings["trace"] = data["timings"]["trace"]
+                        data = {**data, "timings": timings}
+                    yield f"event: {event['event']}\ndata: {json.dumps(data)}\n\n"
+        except HTTPException as e:
+            yield f"event: error\ndata: {json.dumps({'detail': e.detail})}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        finally:
+            # Also on client disconnect: stop the generator (and its LLM
+            # stream) once the step still running on the executor returns
+            def close_events():
+                if step is not None:
+                    futures_wait([step])
+                events.close()
+            await loop.run_in_executor(pipeline_pool, close_events)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_batch(request: BatchQueryRequest):
+    """
+    Answer a list of questions in one request
+
+    Takes the /query options (applied to every question) with `questions`
+    instead of `question`. Questions are embedded in bulk, identical
+    retrievals are shared, reranks run with bounded concurrency and answers
+    are generated in parallel. The batch holds one pipeline slot.
+
+    - **results**: one /query response per question, in order, or
+      `{"question", "error"}` for a question that failed
+    - **timings**: batch total, phases, per-stage count/p50/max, answer cache
+      hits, and embedding/retrieval calls made vs requested; per-question
+      spans are included in each result when `include_timings` is set
     """
     try:
-        # Validate category
-        if request.category not in NAMESPACES:
+        validate_request(request)
+        if not request.questions or len(request.questions) > BATCH_MAX_QUESTIONS:
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid category. Choose from: {list(NAMESPACES.keys())}"
+                detail=f"Send between 1 and {BATCH_MAX_QUESTIONS} questions"
             )
 
-        # Call the RAG pipeline with enhanced retrieval
-        result = query_books(
-            question=request.question,
-            namespace=request.category,
-            top_k=request.top_k,
-            use_rerank=request.use_rerank,
-            use_hybrid=request.use_hybrid,
-            use_query_rewrite=request.use_query_rewrite,
-            use_multi_query=request.use_multi_query,
-            use_hyde=request.use_hyde,
-            use_graph=request.use_graph
+        batch = await run_pipeline(
+            query_books_batch, questions=request.questions, **pipeline_options(request)
         )
 
-        return result
+        # Repeated questions share one answer (and timings); observe each once
+        traces = {id(r["timings"]): r["timings"] for r in batch["results"] if "timings" in r}
+        for timings in traces.values():
+            metrics.observe_trace("query_batch", timings)
+        if not request.include_timings:
+            batch["results"] = [
+                {k: v for k, v in result.items() if k != "timings"} for result in batch["results"]
+            ]
+        return batch
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -148,12 +524,33 @@ async def ask_simple(question: str, category: str = "all"):
     Example: POST /ask?question=how do I implement RAG&category=llm
     """
     try:
-        result = query_books(question=question, namespace=category)
-        return result
+        result = await coalesced_query("ask", QueryRequest(question=question, category=category))
+        return {k: v for k, v in result.items() if k != "timings"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss metrics for the embedding, LLM stage and answer caches"""
+    return get_cache_stats()
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics: stage/namespace latency histograms, candidate counts, cache hit rates"""
+    body, content_type = metrics.render(get_cache_stats(), admission.stats())
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/pipeline/stats")
+async def pipeline_stats():
+    """Admission control counters (running, queued, admitted, rejected) and coalesced requests"""
+    return {**admission.stats(), "coalescing": coalescer.stats()}
+
+
 # ============================================================================
 # RUN SERVER
 # ============================================================================
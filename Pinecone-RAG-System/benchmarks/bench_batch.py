@@ -0,0 +1,113 @@
+# Benchmark: query_books_batch vs the same questions through query_books
+# Runs a set of questions (with some repeats, as in an evaluation set or a
+# FAQ import) once as concurrent single queries and once as one batch, against
+# the local stand-ins in benchmarks/fakes.py, and reports wall time, Pinecone
+# calls and the batch's own timing summary
+#
+# Usage: python benchmarks/bench_batch.py [--questions 32] [--repeats 8]
+#            [--concurrency 8] [--profile balanced]
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep benchmark runs out of the persistent embedding cache
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+# ... and write the taxonomy-only concept graph outside the tree
+os.environ["CONCEPT_GRAPH_PATH"] = os.path.join(tempfile.gettempdir(), "rag_bench_concept_graph.json")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import rag_llamaindex as rag
+import fakes
+from bench_pipeline import make_questions, reset_caches
+
+
+class CountingIndex:
+    """Pinecone index wrapper counting query calls."""
+
+    def __init__(self, index):
+        self._index = index
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def query(self, *args, **kwargs):
+        with self._lock:
+            self.queries += 1
+        return self._index.query(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._index, name)
+
+
+def run_single(questions: list, concurrency: int, options: dict) -> list:
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda q: rag.query_books(q, **options), questions))
+
+
+def sources(result: dict) -> list:
+    return [(s["source"], s["page"]) for s in result.get("sources", [])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch query benchmark")
+    parser.add_argument("--questions", type=int, default=32, help="Distinct questions")
+    parser.add_argument("--repeats", type=int, default=8, help="Extra copies of random questions")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent single queries")
+    parser.add_argument("--profile", default=None, help="fast, balanced or thorough")
+    parser.add_argument("--namespace", default="all")
+    parser.add_argument("--docs", type=int, default=1000, help="Synthetic chunks per namespace")
+    args = parser.parse_args()
+
+    fakes.install(rag, fakes.FakeConfig(docs_per_namespace=args.docs, jitter=0.2))
+    rag.corpus_bm25_index = None
+    index = CountingIndex(rag.pinecone_index)
+    rag.pinecone_index = index
+    rag.invalidate_retrievers()
+
+    rng = random.Random(0)
+    questions = make_questions(args.questions)
+    questions += [rng.choice(questions).upper() for _ in range(args.repeats)]
+    rng.shuffle(questions)
+    options = {"namespace": args.namespace, "profile": args.profile, "use_answer_cache": False}
+
+    devnull = open(os.devnull, "w")
+    rows = []
+    for label, run in [
+        (f"query_books x{args.concurrency}", lambda: run_single(questions, args.concurrency, options)),
+        ("query_books_batch", lambda: rag.query_books_batch(questions, **options)["results"]),
+    ]:
+        reset_caches()
+        index.queries = 0
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(devnull):
+            results = run()
+        rows.append((label, (time.perf_counter() - start) * 1000, index.queries, results))
+
+    # Timing summary of a second, traced batch run
+    reset_caches()
+    with contextlib.redirect_stdout(devnull):
+        summary = rag.query_books_batch(questions, **options)["timings"]
+
+    print(f"{len(questions)} questions ({args.questions} distinct), namespace '{args.namespace}', "
+          f"profile {args.profile or 'default'}")
+    print("-" * 64)
+    print(f"{'run':<24} {'wall ms':>9} {'ms/question':>12} {'pinecone calls':>15}")
+    for label, wall_ms, queries, _ in rows:
+        print(f"{label:<24} {wall_ms:>9.0f} {wall_ms / len(questions):>12.1f} {queries:>15}")
+
+    same = sum(sources(a) == sources(b) for a, b in zip(rows[0][3], rows[1][3]))
+    print(f"\nSame sources as query_books: {same}/{len(questions)}")
+    print(f"Embedding: {summary['embedding']}")
+    print(f"Retrievals: {summary['retrievals']}")
+    print("Phases (ms): " + ", ".join(f"{k} {v:.0f}" for k, v in summary["phases"].items()))
+    print(f"{'stage':<16} {'count':>6} {'p50 ms':>8} {'max ms':>8}")
+    for name, stats in sorted(summary["stages"].items()):
+        print(f"{name:<16} {stats['count']:>6} {stats['p50_ms']:>8.1f} {stats['max_ms']:>8.1f}")
@@ -0,0 +1,85 @@
+# Benchmark: rank_bm25.BM25Okapi vs the vectorized candidate BM25 scorer
+# Scores 8 query variations against a 90-chunk candidate set (the "all" path)
+# and checks the scores agree
+#
+# Usage: python benchmarks/bench_bm25.py [--docs 90] [--queries 8] [--rounds 50]
+
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sparse_index import bm25_score_matrix, token_cache
+
+WORDS = (
+    "agent memory retrieval augmented generation vector database embedding context "
+    "window transformer attention lambda serverless pipeline deployment monitoring "
+    "pytorch training gradient model feature python asyncio decorator architecture "
+    "scalability latency cache index chunk rerank hybrid search keyword the a of to"
+).split()
+
+
+def synthetic_chunks(num_docs: int, rng: random.Random) -> list:
+    """Book-sized chunks (~250 tokens) with a Zipf-like word distribution."""
+    weights = [1 / (i + 1) for i in range(len(WORDS))]
+    return [
+        " ".join(rng.choices(WORDS, weights=weights, k=rng.randint(150, 350)))
+        for _ in range(num_docs)
+    ]
+
+
+def okapi_scores(queries: list, texts: list) -> np.ndarray:
+    """Old bm25_search path: tokenize + build BM25Okapi once per query."""
+    rows = []
+    for query in queries:
+        bm25 = BM25Okapi([text.lower().split() for text in texts])
+        rows.append(bm25.get_scores(query.lower().split()))
+    return np.array(rows)
+
+
+def timed(func, rounds: int):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = func()
+    return result, (time.perf_counter() - start) * 1000 / rounds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BM25 scorer benchmark")
+    parser.add_argument("--docs", type=int, default=90)
+    parser.add_argument("--queries", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    texts = synthetic_chunks(args.docs, rng)
+    keys = [f"chunk-{i}" for i in range(args.docs)]
+    queries = [" ".join(rng.sample(WORDS, rng.randint(4, 12))) for _ in range(args.queries)]
+
+    print(f"{args.queries} queries x {args.docs} candidate chunks, {args.rounds} rounds")
+    print("-" * 60)
+
+    expected, okapi_ms = timed(lambda: okapi_scores(queries, texts), args.rounds)
+    print(f"BM25Okapi (per query)      : {okapi_ms:8.2f} ms")
+
+    def cold():
+        token_cache._entries.clear()
+        return bm25_score_matrix(queries, keys, texts)
+
+    actual_cold, cold_ms = timed(cold, args.rounds)
+    print(f"Vectorized, cold cache     : {cold_ms:8.2f} ms ({okapi_ms / cold_ms:.1f}x)")
+
+    actual, warm_ms = timed(lambda: bm25_score_matrix(queries, keys, texts), args.rounds)
+    print(f"Vectorized, cached tokens  : {warm_ms:8.2f} ms ({okapi_ms / warm_ms:.1f}x)")
+
+    print("-" * 60)
+    max_error = float(np.max(np.abs(actual - expected)))
+    assert np.allclose(actual, expected, rtol=1e-6, atol=1e-8), f"Scores differ (max {max_error})"
+    assert np.allclose(actual_cold, expected, rtol=1e-6, atol=1e-8)
+    print(f"Scores match BM25Okapi (max abs error {max_error:.2e})")
@@ -0,0 +1,81 @@
+# Benchmark: cold start - module import time, warmup() time and first vs
+# second request latency, each measured in a fresh Python process
+#
+# Import timings need no API keys. The request timings call query_books and
+# need PINECONE_API_KEY / OPENAI_API_KEY / COHERE_API_KEY (skip with --no-query).
+#
+# Usage: python benchmarks/bench_cold_start.py [--runs 5] [--no-query]
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"import_ms": (time.perf_counter() - start) * 1000}}))
+"""
+
+REQUEST_SCRIPT = """
+import io, json, sys, time, contextlib
+import rag_llamaindex as rag
+timings = {{}}
+if {warm}:
+    start = time.perf_counter()
+    report = rag.warmup()
+    timings["warmup_ms"] = (time.perf_counter() - start) * 1000
+    if not report["ready"]:
+        sys.exit("warmup failed: " + report.get("error", ""))
+for label, question in (("first_request_ms", {q1!r}), ("second_request_ms", {q2!r})):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        rag.query_books(question, namespace="all", use_answer_cache=False)
+    timings[label] = (time.perf_counter() - start) * 1000
+print(json.dumps(timings))
+"""
+
+
+def run_script(script: str) -> dict:
+    """Run a snippet in a fresh interpreter and parse its last output line as JSON."""
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT,
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def median_of(runs: int, script: str) -> dict:
+    samples = [run_script(script) for _ in range(runs)]
+    return {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-query", action="store_true", help="Only measure import time")
+    args = parser.parse_args()
+
+    print(f"Median of {args.runs} fresh processes")
+    print("-" * 60)
+    for module in ("rag_llamaindex", "api"):
+        timings = median_of(args.runs, IMPORT_SCRIPT.format(module=module))
+        print(f"import {module:<16}: {timings['import_ms']:8.0f} ms")
+
+    if args.no_query:
+        sys.exit(0)
+
+    questions = dict(q1="What is retrieval augmented generation?", q2="How do I deploy a model on AWS?")
+    for warm in (False, True):
+        timings = median_of(args.runs, REQUEST_SCRIPT.format(warm=warm, **questions))
+        print("-" * 60)
+        print("With warmup()" if warm else "Without warmup()")
+        for key, value in timings.items():
+            print(f"  {key:<20}: {value:8.0f} ms")
@@ -0,0 +1,99 @@
+# Benchmark: parallel, incremental ingestion (ingest.py) against the local
+# stand-ins for OpenAI embeddings and Pinecone in benchmarks/fakes.py
+# Writes a synthetic library of text books, ingests it with each worker
+# count, then re-runs after adding one book to show the unchanged-chunk skip
+#
+# Usage: python benchmarks/bench_ingest.py [--books 6] [--pages 40] [--workers 1 4 8]
+#            [--embed-ms 300] [--upsert-ms 60] [--embed-batch 64]
+
+import os
+import sys
+import random
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes
+from ingest import IngestState, Progress, ingest
+
+
+def write_book(books_path: str, name: str, pages: int, words_per_page: int, topic: list, rng):
+    book_dir = os.path.join(books_path, name)
+    os.makedirs(book_dir)
+    for page in range(pages):
+        sentences = []
+        for _ in range(words_per_page // 12):
+            words = [rng.choice(topic) if rng.random() < 0.6 else rng.choice(fakes.COMMON_WORDS)
+                     for _ in range(12)]
+            sentences.append(" ".join(words).capitalize() + ".")
+        with open(os.path.join(book_dir, f"page_{page:04d}.txt"), "w", encoding="utf-8") as f:
+            f.write(" ".join(sentences))
+
+
+def run(books: dict, books_path: str, state_path: str, config, workers: int, embed_batch: int):
+    embedder = fakes.HashedEmbedder(config.dimensions)
+    latency = fakes.Latency(config.jitter, config.seed)
+    index = fakes.FakePineconeIndex(embedder, latency, config)
+    embed_model = fakes.FakeEmbedding(embedder, latency, config)
+    state = IngestState(state_path)
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        summary = ingest(books, books_path, index, embed_model, state, workers=workers,
+                         embed_batch_size=embed_batch, progress=Progress(every=0))
+    return summary, index, embed_model, state
+
+
+def print_row(label: str, summary: dict):
+    print(f"{label:<28} {summary['chunks']:>7} {summary['unchanged']:>10} {summary['upserted']:>9} "
+          f"{summary['seconds']:>8.2f} {summary['upserted_per_second']:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestion benchmark")
+    parser.add_argument("--books", type=int, default=6, help="Books per run (one namespace each)")
+    parser.add_argument("--pages", type=int, default=40, help="Pages per book")
+    parser.add_argument("--words", type=int, default=900, help="Words per page")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--embed-batch", type=int, default=64)
+    parser.add_argument("--embed-ms", type=float, default=300, help="Embedding latency per batch")
+    parser.add_argument("--upsert-ms", type=float, default=60, help="Pinecone latency per upsert request")
+    args = parser.parse_args()
+
+    config = fakes.FakeConfig(docs_per_namespace=0, jitter=0.2, embed_ms=args.embed_ms,
+                              embed_per_text_ms=1.0, upsert_ms=args.upsert_ms, pinecone_ms=20)
+    rng = random.Random(0)
+    topics = list(fakes.TOPIC_WORDS.items())
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        books_path = os.path.join(work_dir, "Books")
+        books = {}
+        for i in range(args.books + 1):
+            namespace, topic = topics[i % len(topics)]
+            name = f"{namespace.upper()} Book {i + 1}"
+            write_book(books_path, name, args.pages, args.words, topic, rng)
+            books.setdefault(namespace, []).append(name)
+        # The last book is held back for the incremental run
+        extra_namespace, extra_book = next(
+            (ns, names[-1]) for ns, names in books.items() if f"Book {args.books + 1}" in names[-1]
+        )
+        initial = {ns: [b for b in names if b != extra_book] for ns, names in books.items()}
+        initial = {ns: names for ns, names in initial.items() if names}
+
+        print(f"{args.books} books x {args.pages} pages, embedding {args.embed_ms:.0f} ms/batch "
+              f"of {args.embed_batch}, upsert {args.upsert_ms:.0f} ms/request")
+        print("-" * 78)
+        print(f"{'run':<28} {'chunks':>7} {'unchanged':>10} {'upserted':>9} {'seconds':>8} {'chunks/s':>10}")
+        for workers in args.workers:
+            state_path = os.path.join(work_dir, f"state_{workers}.sqlite")
+            summary, *_ = run(initial, books_path, state_path, config, workers, args.embed_batch)
+            print_row(f"full, {workers} workers", summary)
+
+        # Incremental: same manifest, one new book
+        workers = max(args.workers)
+        state_path = os.path.join(work_dir, f"state_{workers}.sqlite")
+        summary, *_ = run(books, books_path, state_path, config, workers, args.embed_batch)
+        print_row(f"+1 book, {workers} workers", summary)
+        summary, *_ = run(books, books_path, state_path, config, workers, args.embed_batch)
+        print_row(f"no changes, {workers} workers", summary)
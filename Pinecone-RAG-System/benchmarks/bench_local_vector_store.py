@@ -0,0 +1,93 @@
+# Benchmark: local memory-mapped vector store vs the (fake) Pinecone index
+# Exports the synthetic corpus in benchmarks/fakes.py into float32, float16
+# and float16 + IVF shards, then reports per-query latency (one at a time and
+# batched) and top-k agreement with the Pinecone index
+#
+# Usage: python benchmarks/bench_local_vector_store.py [--docs 5000] [--questions 200]
+#            [--top-k 20] [--ivf 64] [--nprobe 4 8 16]
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes
+from local_vector_store import NamespaceShard, export_namespace_vectors
+
+
+def make_questions(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    topics = list(fakes.TOPIC_WORDS.values())
+    return ["how does " + " ".join(rng.sample(rng.choice(topics), rng.randint(2, 4))) + " work"
+            for _ in range(count)]
+
+
+def recall(rows: np.ndarray, reference: np.ndarray) -> float:
+    hits = sum(len(set(r.tolist()) & set(ref.tolist())) for r, ref in zip(rows, reference))
+    return hits / reference.size
+
+
+def time_search(shard: NamespaceShard, embeddings: np.ndarray, top_k: int, nprobe=None):
+    """(ms per query searched one at a time, ms per query in one batch, rows)."""
+    start = time.perf_counter()
+    for vector in embeddings:
+        shard.search_many(vector, top_k, nprobe)
+    single_ms = (time.perf_counter() - start) * 1000 / len(embeddings)
+
+    start = time.perf_counter()
+    _, rows = shard.search_many(embeddings, top_k, nprobe)
+    batch_ms = (time.perf_counter() - start) * 1000 / len(embeddings)
+    return single_ms, batch_ms, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local vector store benchmark")
+    parser.add_argument("--docs", type=int, default=5000, help="Synthetic chunks per namespace")
+    parser.add_argument("--namespace", default="llm")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--ivf", type=int, default=64, help="IVF lists")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    config = fakes.FakeConfig(docs_per_namespace=args.docs, jitter=0, pinecone_ms=0, embed_ms=0)
+    embedder = fakes.HashedEmbedder(config.dimensions)
+    index = fakes.FakePineconeIndex(embedder, fakes.Latency(0, 0), config)
+    embeddings = np.vstack([embedder.embed(q) for q in make_questions(args.questions)])
+
+    start = time.perf_counter()
+    docs, vectors = export_namespace_vectors(index, args.namespace)
+    print(f"Exported {len(docs)} vectors of '{args.namespace}' in "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    ids = index.namespaces[args.namespace][0]
+    pinecone_rows = np.array([
+        [ids.index(m.id) for m in index.query(v, top_k=args.top_k, namespace=args.namespace).matches]
+        for v in embeddings
+    ])
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        variants = [("float32", 0), ("float16", 0), ("float16", args.ivf)]
+        print(f"{args.questions} queries, top-{args.top_k}; recall vs the Pinecone top-k")
+        print("-" * 76)
+        print(f"{'shard':<26} {'nprobe':>6} {'MB':>7} {'ms/query':>9} {'batched':>9} {'recall':>8}")
+        for dtype, ivf in variants:
+            path = os.path.join(store_dir, f"{dtype}-{ivf}")
+            start = time.perf_counter()
+            NamespaceShard.write(path, docs, vectors, dtype, ivf)
+            write_ms = (time.perf_counter() - start) * 1000
+            shard = NamespaceShard(path)
+            size_mb = os.path.getsize(os.path.join(path, "vectors.npy")) / 1e6
+            label = f"{dtype}{f' + IVF{ivf}' if ivf else ''} ({write_ms:.0f} ms)"
+            for nprobe in (args.nprobe if ivf else [None]):
+                single_ms, batch_ms, rows = time_search(shard, embeddings, args.top_k, nprobe)
+                print(f"{label:<26} {nprobe or '-':>6} {size_mb:>7.1f} {single_ms:>9.3f} "
+                      f"{batch_ms:>9.3f} {recall(rows, pinecone_rows):>8.1%}")
+            shard.close()
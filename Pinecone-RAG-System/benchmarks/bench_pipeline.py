@@ -0,0 +1,235 @@
+# Offline load test of the RAG pipeline: latency percentiles, requests/second
+# and a per-stage breakdown for each combination of use_* flags
+#
+# Runs query_books directly (--mode direct) and/or through the FastAPI app
+# served by uvicorn (--mode api), against the local stand-ins for Pinecone,
+# OpenAI and Cohere in benchmarks/fakes.py - no API keys, no paid calls.
+#
+# Usage: python benchmarks/bench_pipeline.py [--mode direct|api|both]
+#            [--concurrency 8] [--requests 48] [--combos default|all]
+#            [--pinecone-ms 40] [--embed-ms 60] [--llm-ms 350] [--cohere-ms 120]
+#            [--jitter 0.35] [--docs 2000] [--json results.json]
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import itertools
+import threading
+import contextlib
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Keep benchmark runs out of the persistent embedding cache
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+os.environ.setdefault("WARMUP_ON_STARTUP", "false")
+# ... and write the taxonomy-only concept graph outside the tree
+os.environ["CONCEPT_GRAPH_PATH"] = os.path.join(tempfile.gettempdir(), "rag_bench_concept_graph.json")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import rag_llamaindex as rag
+import fakes
+
+FLAGS = ["use_graph", "use_multi_query", "use_hyde", "use_hybrid", "use_rerank", "use_query_rewrite"]
+STAGES = [
+    "answer_cache", "graph", "multi_query", "hyde", "rewrite", "embed", "retrieve",
+    "retrieval_wait", "bm25", "fusion", "mmr", "rerank", "pack_context", "generate"
+]
+
+
+def flag_combos(which: str) -> list:
+    """All flags on, all off, and each flag off on its own - or every combination."""
+    if which == "all":
+        return [dict(zip(FLAGS, values)) for values in itertools.product([True, False], repeat=len(FLAGS))]
+
+    combos = [{flag: True for flag in FLAGS}]
+    combos += [{**combos[0], flag: False} for flag in FLAGS]
+    combos.append({flag: False for flag in FLAGS})
+    return combos
+
+
+def combo_label(flags: dict) -> str:
+    off = [flag[4:] for flag in FLAGS if not flags[flag]]
+    if not off:
+        return "all on"
+    if len(off) == len(FLAGS):
+        return "all off"
+    return "-" + ",-".join(off)
+
+
+def make_questions(count: int, seed: int = 1) -> list:
+    """Distinct questions built from the synthetic corpus vocabulary."""
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        topic = rng.choice(list(fakes.TOPIC_WORDS.values()))
+        words = " ".join(rng.sample(topic, rng.randint(2, 4)))
+        questions.append(f"how does {words} work in practice {i}")
+    return questions
+
+
+def stage_walls(timings: dict) -> dict:
+    """Wall-clock extent per stage (spans of one stage can run in parallel)."""
+    extents = {}
+    for span in timings["spans"]:
+        start, end = span["start_ms"], span["start_ms"] + span["duration_ms"]
+        lo, hi = extents.get(span["name"], (start, end))
+        extents[span["name"]] = (min(lo, start), max(hi, end))
+    return {name: hi - lo for name, (lo, hi) in extents.items()}
+
+
+def run_closed_loop(request_fn, questions: list, concurrency: int) -> dict:
+    """Send every question through request_fn from `concurrency` workers."""
+    latencies, walls = [], []
+    lock = threading.Lock()
+    next_index = itertools.count()
+
+    def worker():
+        while True:
+            i = next(next_index)
+            if i >= len(questions):
+                return
+            start = time.perf_counter()
+            timings = request_fn(questions[i])
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed * 1000)
+                walls.append(stage_walls(timings))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - start
+
+    ms = np.array(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / wall,
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+        "stages_p50": {
+            stage: float(np.median([w[stage] for w in walls if stage in w]))
+            for stage in STAGES if any(stage in w for w in walls)
+        }
+    }
+
+
+def reset_caches():
+    rag.embedding_cache.clear()
+    rag.llm_stage_cache.clear()
+    rag.rerank_cache.clear()
+    rag.answer_cache.clear()
+
+
+def direct_request(flags: dict):
+    def request(question: str) -> dict:
+        result = rag.query_books(question, namespace="all", use_answer_cache=False, **flags)
+        return result["timings"]
+    return request
+
+
+def api_request(base_url: str, flags: dict):
+    def request(question: str) -> dict:
+        body = {"question": question, "category": "all", "include_timings": True, "bypass_cache": True, **flags}
+        req = urllib.request.Request(
+            base_url + "/query", data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(req, timeout=300) as response:
+            return json.loads(response.read())["timings"]
+    return request
+
+
+@contextlib.contextmanager
+def api_server():
+    """Serve api.app with uvicorn on a free local port."""
+    import socket
+    import uvicorn
+    import api
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def print_table(mode: str, rows: list):
+    stages = [s for s in STAGES if any(s in r["stages_p50"] for r in rows)]
+    print(f"\n[{mode}]")
+    print(f"{'flags':<28} {'p50':>7} {'p95':>7} {'p99':>7} {'rps':>6} | "
+          + " ".join(f"{s[:9]:>9}" for s in stages))
+    for r in rows:
+        print(f"{r['label']:<28} {r['p50']:>7.0f} {r['p95']:>7.0f} {r['p99']:>7.0f} {r['rps']:>6.2f} | "
+              + " ".join(f"{r['stages_p50'][s]:>9.0f}" if s in r["stages_p50"] else f"{'-':>9}" for s in stages))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline RAG pipeline benchmark")
+    parser.add_argument("--mode", choices=["direct", "api", "both"], default="both")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=48, help="Requests per flag combination")
+    parser.add_argument("--combos", choices=["default", "all"], default="default")
+    parser.add_argument("--warm-caches", action="store_true", help="Keep caches between combinations")
+    parser.add_argument("--pinecone-ms", type=float, default=40)
+    parser.add_argument("--embed-ms", type=float, default=60)
+    parser.add_argument("--llm-ms", type=float, default=350, help="LLM time to first token")
+    parser.add_argument("--llm-token-ms", type=float, default=8)
+    parser.add_argument("--cohere-ms", type=float, default=120)
+    parser.add_argument("--jitter", type=float, default=0.35, help="Lognormal sigma of every latency")
+    parser.add_argument("--docs", type=int, default=2000, help="Synthetic chunks per namespace")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    config = fakes.FakeConfig(
+        docs_per_namespace=args.docs, jitter=args.jitter, pinecone_ms=args.pinecone_ms,
+        embed_ms=args.embed_ms, llm_first_token_ms=args.llm_ms, llm_token_ms=args.llm_token_ms,
+        cohere_ms=args.cohere_ms
+    )
+    fakes.install(rag, config)
+    # Measure the candidate-only BM25 path regardless of any local corpus index
+    rag.corpus_bm25_index = None
+
+    questions = make_questions(args.requests)
+    modes = ["direct", "api"] if args.mode == "both" else [args.mode]
+    print(f"{args.requests} requests x concurrency {args.concurrency}, latencies in ms "
+          f"(stage columns: p50 wall time)")
+
+    results = {}
+    devnull = open(os.devnull, "w")
+    for mode in modes:
+        rows = []
+        with contextlib.ExitStack() as stack:
+            base_url = stack.enter_context(api_server()) if mode == "api" else None
+            for flags in flag_combos(args.combos):
+                if not args.warm_caches:
+                    reset_caches()
+                request_fn = api_request(base_url, flags) if mode == "api" else direct_request(flags)
+                with contextlib.redirect_stdout(devnull):
+                    row = run_closed_loop(request_fn, questions, args.concurrency)
+                rows.append({"label": combo_label(flags), "flags": flags, **row})
+        print_table(mode, rows)
+        results[mode] = rows
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(config), "concurrency": args.concurrency, "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
@@ -0,0 +1,49 @@
+# Benchmark: per-request retriever construction vs the shared registry
+# Measures only object construction (no Pinecone queries are sent)
+#
+# Usage: python benchmarks/bench_retriever_registry.py [--requests 200]
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import rag_llamaindex as rag
+
+# Retrievers an "all" query with ~8 search variations asks for:
+# one per (variation, namespace), with keyword-adjusted top_k values
+QUERIES_PER_REQUEST = 8
+TOP_K_VALUES = [7, 15, 22]
+
+
+def run(get_retriever, requests: int) -> float:
+    """Return average milliseconds of retriever construction per request."""
+    start = time.perf_counter()
+    for _ in range(requests):
+        for q in range(QUERIES_PER_REQUEST):
+            for ns in rag.ACTIVE_NAMESPACES:
+                get_retriever(namespace=ns, top_k=TOP_K_VALUES[q % len(TOP_K_VALUES)])
+    return (time.perf_counter() - start) * 1000 / requests
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retriever registry benchmark")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    calls = QUERIES_PER_REQUEST * len(rag.ACTIVE_NAMESPACES)
+    print(f"{args.requests} requests x {calls} retriever lookups per request")
+    print("-" * 60)
+
+    uncached_ms = run(rag.build_retriever, args.requests)
+    print(f"Per-call construction : {uncached_ms:8.2f} ms/request")
+
+    rag.invalidate_retrievers()
+    cached_ms = run(rag.get_retriever, args.requests)
+    print(f"Registry (incl. warm) : {cached_ms:8.2f} ms/request")
+
+    print("-" * 60)
+    print(f"Overhead removed      : {uncached_ms - cached_ms:8.2f} ms/request "
+          f"({uncached_ms / max(cached_ms, 1e-9):.0f}x faster)")
@@ -0,0 +1,81 @@
+# Benchmark: embedding-centroid namespace routing vs full fan-out
+# Builds centroids from the synthetic corpus in benchmarks/fakes.py, then
+# reports how much of the fan-out top-k each routing setting keeps, and the
+# Pinecone calls it saves
+#
+# Usage: python benchmarks/bench_router.py [--questions 300] [--centroids 8] [--top-k 10]
+
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes
+from namespace_router import NamespaceRouter, evaluate_grid, fan_out
+
+
+def make_questions(count: int, mixed_share: float, seed: int = 1) -> list:
+    """Questions from one namespace's vocabulary, some mixing in a second one."""
+    rng = random.Random(seed)
+    topics = list(fakes.TOPIC_WORDS.values())
+    questions = []
+    for _ in range(count):
+        primary = rng.choice(topics)
+        words = rng.sample(primary, rng.randint(2, 4))
+        if rng.random() < mixed_share:
+            words += rng.sample(rng.choice(topics), rng.randint(1, 2))
+        questions.append("how does " + " ".join(words) + " work")
+    return questions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Namespace router benchmark")
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--mixed", type=float, default=0.4, help="Share of cross-topic questions")
+    parser.add_argument("--centroids", type=int, default=8, help="Centroids per namespace")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--docs", type=int, default=2000, help="Synthetic chunks per namespace")
+    args = parser.parse_args()
+
+    config = fakes.FakeConfig(docs_per_namespace=args.docs, jitter=0, pinecone_ms=0, embed_ms=0)
+    embedder = fakes.HashedEmbedder(config.dimensions)
+    index = fakes.FakePineconeIndex(embedder, fakes.Latency(0, 0), config)
+    namespaces = list(index.namespaces)
+
+    start = time.perf_counter()
+    router = NamespaceRouter.build(
+        {ns: index.namespaces[ns][2] for ns in namespaces}, args.centroids
+    )
+    print(f"Built {len(router.centroids)} centroids in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    questions = make_questions(args.questions, args.mixed)
+    embeddings = np.vstack([embedder.embed(q) for q in questions])
+    fan_out_results = [
+        fan_out(
+            lambda ns: [m.score for m in index.query(vector, top_k=args.top_k, namespace=ns).matches],
+            namespaces, args.top_k
+        )
+        for vector in embeddings
+    ]
+
+    start = time.perf_counter()
+    router.score_many(embeddings)
+    per_query_us = (time.perf_counter() - start) * 1e6 / len(questions)
+    print(f"Routing cost: {per_query_us:.1f} us per query (batched)")
+
+    print(f"{args.questions} questions ({args.mixed:.0%} cross-topic), fan-out top-{args.top_k} "
+          f"over {len(namespaces)} namespaces")
+    print("-" * 78)
+    print(f"{'top_n':>5} {'thresh':>7} {'recall':>8} {'top1':>7} {'no loss':>8} "
+          f"{'ns/query':>9} {'calls saved':>12}")
+    for row in evaluate_grid(router, embeddings, fan_out_results, thresholds=(0.0, 0.2, 0.3)):
+        saved = 1 - row["mean_namespaces"] / len(namespaces)
+        print(f"{row['top_n']:>5} {row['threshold']:>7.1f} {row['recall']:>8.1%} "
+              f"{row['top1_accuracy']:>7.1%} {row['full_recall_rate']:>8.1%} "
+              f"{row['mean_namespaces']:>9.2f} {saved:>12.0%}")
@@ -0,0 +1,370 @@
+# Local stand-ins for Pinecone, OpenAI and Cohere used by the offline benchmarks
+# A synthetic corpus per namespace, deterministic bag-of-words embeddings (so
+# queries really do match related chunks) and configurable latency per service
+#
+# Usage:
+#     import fakes
+#     fakes.install(rag, fakes.FakeConfig(llm_first_token_ms=600))
+
+import re
+import time
+import types
+import zlib
+import random
+import threading
+from dataclasses import dataclass
+from typing import Any, List
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+# Vocabulary per namespace; every chunk also draws from COMMON_WORDS
+TOPIC_WORDS = {
+    "aws": "aws lambda s3 ec2 sagemaker bedrock iam vpc cloudwatch dynamodb serverless region".split(),
+    "llm": "llm agent prompt rag retrieval embedding context token transformer attention memory tool".split(),
+    "mlops": "mlops pipeline deployment monitoring drift registry ci cd docker kubernetes feature store".split(),
+    "ml": "model training gradient loss regression classification overfitting feature validation tree".split(),
+    "arch": "architecture microservice event queue scalability latency cache pattern design system api".split(),
+    "python": "python function class decorator asyncio generator typing package module exception list".split(),
+}
+COMMON_WORDS = "the a of to and in is for with how data use can this that".split()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+@dataclass
+class FakeConfig:
+    """Latency (milliseconds, lognormal median + sigma) and corpus settings."""
+    dimensions: int = 256
+    docs_per_namespace: int = 2000
+    words_per_chunk: int = 120
+    seed: int = 0
+    jitter: float = 0.35          # lognormal sigma applied to every latency
+    pinecone_ms: float = 40.0     # per query
+    upsert_ms: float = 60.0       # per upsert request
+    embed_ms: float = 60.0        # per batch
+    embed_per_text_ms: float = 2.0
+    llm_first_token_ms: float = 350.0
+    llm_token_ms: float = 8.0     # per generated token
+    answer_tokens: int = 150
+    cohere_ms: float = 120.0      # per rerank call
+    cohere_per_doc_ms: float = 1.5
+
+
+class Latency:
+    """Sleeps for lognormally distributed durations around a median."""
+
+    def __init__(self, jitter: float, seed: int):
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self, median_ms: float):
+        if median_ms <= 0:
+            return
+        with self._lock:
+            factor = self._rng.lognormvariate(0, self.jitter) if self.jitter else 1.0
+        time.sleep(median_ms * factor / 1000)
+
+
+# ============================================================================
+# EMBEDDINGS
+# ============================================================================
+
+class HashedEmbedder:
+    """Deterministic bag-of-words embeddings: sum of per-word random unit vectors."""
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        self._words = {}
+        self._lock = threading.Lock()
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._words.get(word)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(word.encode("utf-8")))
+            vector = rng.standard_normal(self.dimensions).astype(np.float32)
+            with self._lock:
+                self._words[word] = vector
+        return vector
+
+    def embed(self, text: str) -> np.ndarray:
+        words = re.findall(r"[a-z0-9]+", text.lower()) or ["empty"]
+        vector = np.sum([self._word_vector(w) for w in words], axis=0)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+
+class FakeEmbedding(BaseEmbedding):
+    """Stand-in for OpenAIEmbedding with per-batch latency."""
+
+    model_name: str = "fake-embedding"
+    dimensions: int = 256
+    _embedder: Any = None
+    _latency: Any = None
+    _config: Any = None
+
+    def __init__(self, embedder: HashedEmbedder, latency: Latency, config: FakeConfig, **kwargs):
+        super().__init__(dimensions=embedder.dimensions, **kwargs)
+        self._embedder = embedder
+        self._latency = latency
+        self._config = config
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        self._latency.sleep(self._config.embed_ms + self._config.embed_per_text_ms * len(texts))
+        return [self._embedder.embed(t).tolist() for t in texts]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_batch([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_batch(texts)
+
+
+# ============================================================================
+# PINECONE
+# ============================================================================
+
+class FakePineconeIndex:
+    """
+    In-memory stand-in for a Pinecone index handle.
+
+    Each namespace holds docs_per_namespace synthetic chunks. Matches carry
+    LlamaIndex node metadata (like an index written by LlamaIndex) and their
+    vectors, as Pinecone returns with include_values=True.
+    """
+
+    def __init__(self, embedder: HashedEmbedder, latency: Latency, config: FakeConfig):
+        self._latency = latency
+        self._config = config
+        self.namespaces = {}
+        self._write_lock = threading.Lock()
+        rng = random.Random(config.seed)
+
+        for ns, topic in TOPIC_WORDS.items():
+            ids, metadata, vectors = [], [], []
+            for i in range(config.docs_per_namespace):
+                words = [
+                    rng.choice(topic) if rng.random() < 0.6 else rng.choice(COMMON_WORDS)
+                    for _ in range(config.words_per_chunk)
+                ]
+                text = " ".join(words)
+                node = TextNode(
+                    id_=f"{ns}-{i}", text=text,
+                    metadata={"source": f"{ns.upper()} Book {i // 100 + 1}", "page": i % 100 + 1, "namespace": ns}
+                )
+                ids.append(node.node_id)
+                metadata.append(node_to_metadata_dict(node, remove_text=False, flat_metadata=False))
+                vectors.append(embedder.embed(text))
+            vectors = np.array(vectors, dtype=np.float32).reshape(-1, config.dimensions)
+            self.namespaces[ns] = (ids, metadata, vectors)
+
+    def query(self, vector=None, top_k: int = 10, namespace: str = None,
+              include_values: bool = True, include_metadata: bool = True, **kwargs):
+        self._latency.sleep(self._config.pinecone_ms)
+        if namespace not in self.namespaces:
+            return types.SimpleNamespace(matches=[])
+
+        ids, metadata, vectors = self.namespaces[namespace]
+        scores = vectors @ np.asarray(vector, dtype=np.float32)
+        top = np.argsort(-scores)[:top_k]
+        return types.SimpleNamespace(matches=[
+            types.SimpleNamespace(
+                id=ids[i], score=float(scores[i]),
+                metadata=metadata[i] if include_metadata else {},
+                values=vectors[i].tolist() if include_values else []
+            )
+            for i in top
+        ])
+
+    def list(self, namespace: str = None, limit: int = 100):
+        """Vector ids of a namespace in pages, like Index.list."""
+        ids = self.namespaces.get(namespace, ([],))[0]
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def fetch(self, ids: list, namespace: str = None):
+        self._latency.sleep(self._config.pinecone_ms)
+        vectors = {}
+        if namespace in self.namespaces:
+            all_ids, metadata, values = self.namespaces[namespace]
+            rows = {vector_id: i for i, vector_id in enumerate(all_ids)}
+            for vector_id in ids:
+                if vector_id in rows:
+                    i = rows[vector_id]
+                    vectors[vector_id] = types.SimpleNamespace(
+                        id=vector_id, values=values[i].tolist(), metadata=metadata[i]
+                    )
+        return types.SimpleNamespace(vectors=vectors)
+
+    def upsert(self, vectors: list, namespace: str = None, batch_size: int = None, **kwargs):
+        """Insert or overwrite {"id", "values", "metadata"} entries, one request per batch."""
+        batch_size = batch_size or len(vectors) or 1
+        for _ in range(0, len(vectors), batch_size):
+            self._latency.sleep(self._config.upsert_ms)
+        with self._write_lock:
+            ids, metadata, values = self.namespaces.get(
+                namespace, ([], [], np.empty((0, self._config.dimensions), dtype=np.float32))
+            )
+            ids, metadata, values = list(ids), list(metadata), list(values)
+            rows = {vector_id: i for i, vector_id in enumerate(ids)}
+            for entry in vectors:
+                vector = np.asarray(entry["values"], dtype=np.float32)
+                if entry["id"] in rows:
+                    metadata[rows[entry["id"]]] = entry["metadata"]
+                    values[rows[entry["id"]]] = vector
+                else:
+                    rows[entry["id"]] = len(ids)
+                    ids.append(entry["id"])
+                    metadata.append(entry["metadata"])
+                    values.append(vector)
+            self.namespaces[namespace] = (ids, metadata, np.array(values, dtype=np.float32))
+
+    def delete(self, ids: list = None, namespace: str = None, delete_all: bool = False, **kwargs):
+        self._latency.sleep(self._config.pinecone_ms)
+        with self._write_lock:
+            if namespace not in self.namespaces:
+                return
+            ids_to_drop = set(self.namespaces[namespace][0]) if delete_all else set(ids or [])
+            all_ids, metadata, values = self.namespaces[namespace]
+            keep = [i for i, vector_id in enumerate(all_ids) if vector_id not in ids_to_drop]
+            self.namespaces[namespace] = (
+                [all_ids[i] for i in keep], [metadata[i] for i in keep], values[keep]
+            )
+
+    def describe_index_stats(self) -> dict:
+        return {
+            "dimension": self._config.dimensions,
+            "namespaces": {ns: {"vector_count": len(v[0])} for ns, v in self.namespaces.items()}
+        }
+
+
+# ============================================================================
+# LLM
+# ============================================================================
+
+class FakeLLM(CustomLLM):
+    """
+    Stand-in for the OpenAI LLM.
+
+    Recognizes the pipeline's multi-query, rewrite and HyDE prompts and
+    answers them in the expected format; latency is time-to-first-token
+    plus a per-token cost.
+    """
+
+    model: str = "fake-llm"
+    temperature: float = 0.7
+    _latency: Any = None
+    _config: Any = None
+
+    def __init__(self, latency: Latency, config: FakeConfig, **kwargs):
+        super().__init__(**kwargs)
+        self._latency = latency
+        self._config = config
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=self.model)
+
+    @staticmethod
+    def _question(prompt: str) -> str:
+        match = re.search(r"(?:Original query|Question): (.*)", prompt)
+        return match.group(1).strip() if match else "the question"
+
+    def _reply(self, prompt: str) -> str:
+        question = self._question(prompt)
+        if "search variations" in prompt:
+            return "\n".join(
+                f"{i}. {question} {suffix}"
+                for i, suffix in enumerate(["explained", "best practices", "implementation guide", "examples"], 1)
+            )
+        if "Rewritten query" in prompt:
+            return f"{question} concepts implementation"
+        if "hypothetical book passage" in prompt:
+            return f"In practice, {question} is addressed by combining several techniques. " * 4
+        return " ".join(["The", "books", "explain", "that"] + ["context"] * (self._config.answer_tokens - 4))
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs) -> CompletionResponse:
+        text = self._reply(prompt)
+        self._latency.sleep(self._config.llm_first_token_ms + self._config.llm_token_ms * len(text.split()))
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs):
+        words = self._reply(prompt).split()
+        config, latency = self._config, self._latency
+
+        def generate():
+            latency.sleep(config.llm_first_token_ms)
+            text = ""
+            for word in words:
+                latency.sleep(config.llm_token_ms)
+                delta = word + " "
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+
+        return generate()
+
+
+# ============================================================================
+# COHERE
+# ============================================================================
+
+class FakeCohere:
+    """Stand-in for cohere.Client: rerank scores are query/document cosine mapped to 0-1."""
+
+    def __init__(self, embedder: HashedEmbedder, latency: Latency, config: FakeConfig):
+        self._embedder = embedder
+        self._latency = latency
+        self._config = config
+
+    def rerank(self, model: str, query: str, documents: list, top_n: int = None, **kwargs):
+        self._latency.sleep(self._config.cohere_ms + self._config.cohere_per_doc_ms * len(documents))
+        q = self._embedder.embed(query)
+        scores = [(1 + float(self._embedder.embed(d) @ q)) / 2 for d in documents]
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)[:top_n]
+        return types.SimpleNamespace(results=[
+            types.SimpleNamespace(index=i, relevance_score=scores[i]) for i in order
+        ])
+
+
+# ============================================================================
+# INSTALL
+# ============================================================================
+
+def install(rag, config: FakeConfig = None) -> dict:
+    """
+    Point the rag_llamaindex module at the fakes (before its first request).
+
+    Returns:
+        Dict of the installed fakes
+    """
+    config = config or FakeConfig()
+    embedder = HashedEmbedder(config.dimensions)
+    latency = Latency(config.jitter, config.seed)
+
+    fakes = {
+        "pinecone_index": FakePineconeIndex(embedder, latency, config),
+        "embed_model": FakeEmbedding(embedder, latency, config),
+        "llm": FakeLLM(latency, config),
+        "co": FakeCohere(embedder, latency, config),
+    }
+    rag.pinecone_index = fakes["pinecone_index"]
+    rag.co = fakes["co"]
+    Settings.embed_model = fakes["embed_model"]
+    Settings.llm = fakes["llm"]
+    rag.invalidate_retrievers()
+    return fakes
@@ -0,0 +1,104 @@
+# Load test: requests/second and latency of a running API server at
+# increasing numbers of concurrent clients (closed loop: each client sends
+# its next request as soon as the previous one returns)
+#
+# Start the server first (python api.py or uvicorn api:app), then:
+# Usage: python benchmarks/load_test.py [--url http://localhost:8000]
+#            [--clients 1 8 32] [--duration 30] [--endpoint /query]
+
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+QUESTIONS = [
+    "What is retrieval augmented generation?",
+    "How do I deploy a model with SageMaker?",
+    "How does agent memory work?",
+    "What is a feature store in MLOps?",
+    "How do Python decorators work?",
+    "When should I use an event-driven architecture?",
+    "How does attention work in transformers?",
+    "How do I monitor data drift in production?",
+]
+
+
+def send(url: str, body: dict, timeout: float) -> int:
+    """POST one JSON request and return the HTTP status."""
+    request = urllib.request.Request(
+        url, data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception:
+        return 0
+
+
+def run_level(url: str, clients: int, duration: float, body: dict, timeout: float) -> dict:
+    """Drive `clients` concurrent closed-loop clients for `duration` seconds."""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(client_id: int):
+        i = client_id
+        while time.perf_counter() < deadline:
+            # Vary the question so the answer cache doesn't serve every request
+            payload = {**body, "question": f"{QUESTIONS[i % len(QUESTIONS)]} ({client_id}-{i})"}
+            start = time.perf_counter()
+            status = send(url, payload, timeout)
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+            i += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    wall = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "clients": clients,
+        "ok": len(latencies),
+        "statuses": statuses,
+        "rps": len(latencies) / wall,
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API load test")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/query")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--category", default="all")
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/") + args.endpoint
+    body = {"category": args.category, "bypass_cache": True}
+
+    print(f"Load test: {url}, {args.duration:.0f}s per level")
+    print("-" * 72)
+    print(f"{'clients':>8} {'ok':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+    for clients in args.clients:
+        r = run_level(url, clients, args.duration, body, args.timeout)
+        print(f"{r['clients']:>8} {r['ok']:>6} {r['rps']:>8.2f} {r['p50']:>9.0f} "
+              f"{r['p95']:>9.0f} {r['p99']:>9.0f}  {r['statuses']}")
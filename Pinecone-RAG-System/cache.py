@@ -0,0 +1,437 @@
+# Caching Utilities for the RAG Pipeline
+# In-process LRU/TTL cache, a two-tier (memory + SQLite) embedding cache
+# that survives API server restarts, and a semantic answer cache
+
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def normalize_text(text: str) -> str:
+    """Normalize text for cache keys: case-fold and collapse whitespace."""
+    return " ".join(text.casefold().split())
+
+
+def hash_key(*parts) -> str:
+    """Stable SHA-256 key from any number of parts."""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+# ============================================================================
+# IN-PROCESS LRU + TTL CACHE
+# ============================================================================
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU cache with optional per-entry time-to-live.
+
+    Entries are evicted least-recently-used first once max_size is reached,
+    and are treated as missing once they are older than ttl seconds.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        """
+        Args:
+            max_size: Maximum number of entries kept
+            ttl: Seconds an entry stays valid (None = no expiry)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the cached value (refreshing its LRU position) or default."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl is None or time.time() - stored_at <= self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries if full."""
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+# ============================================================================
+# TWO-TIER EMBEDDING CACHE
+# ============================================================================
+
+class EmbeddingCache:
+    """
+    Embedding cache keyed by (model, dimensions, normalized text).
+
+    Tier 1 is an in-process TTLCache. Tier 2 is a local SQLite file holding
+    float32 vectors, so embeddings survive restarts of the API server. Disk
+    entries are evicted by age (max_age) and by size (max_rows, least
+    recently used first). The SQLite file is opened on first use, so creating
+    the cache (at import time) touches no disk.
+    """
+
+    # Run disk eviction after this many new rows
+    EVICT_EVERY = 500
+
+    def __init__(
+        self,
+        path: Optional[str] = "embedding_cache.sqlite",
+        memory_size: int = 10000,
+        max_rows: int = 200000,
+        max_age: Optional[float] = 30 * 24 * 3600
+    ):
+        """
+        Args:
+            path: SQLite file for the persistent tier (None or "" = memory only)
+            memory_size: Maximum entries in the in-memory LRU tier
+            max_rows: Maximum rows kept in the persistent tier
+            max_age: Seconds before an entry expires in either tier (None = never)
+        """
+        self.path = path
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.memory = TTLCache(max_size=memory_size, ttl=max_age)
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        self._open_lock = threading.Lock()
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """The SQLite connection, opened and evicted on first use (None = memory only)."""
+        if self._conn is None and self.path:
+            with self._open_lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS embeddings (
+                            key TEXT PRIMARY KEY,
+                            model TEXT NOT NULL,
+                            dimensions INTEGER,
+                            vector BLOB NOT NULL,
+                            created_at REAL NOT NULL,
+                            last_used REAL NOT NULL
+                        )
+                    """)
+                    conn.execute(
+                        "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)"
+                    )
+                    conn.commit()
+                    self._conn = conn
+                    self.evict()
+        return self._conn
+
+    @staticmethod
+    def make_key(model: str, dimensions: Optional[int], text: str) -> str:
+        return hash_key(model, dimensions, normalize_text(text))
+
+    def get_many(self, model: str, dimensions: Optional[int], texts: List[str]) -> Dict[str, List[float]]:
+        """
+        Look up embeddings for texts, memory tier first, then disk.
+
+        Returns:
+            Dict of text -> embedding for every text found
+        """
+        found = {}
+        disk_lookup = {}
+        memory_hits = disk_hits = 0
+
+        for text in texts:
+            key = self.make_key(model, dimensions, text)
+            vector = self.memory.get(key)
+            if vector is not None:
+                found[text] = vector
+                memory_hits += 1
+            else:
+                disk_lookup.setdefault(key, []).append(text)
+
+        conn = self._db() if disk_lookup else None
+        if conn is not None:
+            now = time.time()
+            keys = list(disk_lookup)
+            placeholders = ",".join("?" * len(keys))
+            with self._lock:
+                rows = conn.execute(
+                    f"SELECT key, vector, created_at FROM embeddings WHERE key IN ({placeholders})",
+                    keys
+                ).fetchall()
+                fresh = [
+                    (key, blob) for key, blob, created_at in rows
+                    if self.max_age is None or now - created_at <= self.max_age
+                ]
+                if fresh:
+                    conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key, _ in fresh]
+                    )
+                    conn.commit()
+
+            for key, blob in fresh:
+                vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                self.memory.set(key, vector)
+                for text in disk_lookup.pop(key):
+                    found[text] = vector
+                    disk_hits += 1
+
+        # Counters are shared across request threads
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.disk_hits += disk_hits
+            self.misses += sum(len(t) for t in disk_lookup.values())
+        return found
+
+    def put_many(self, model: str, dimensions: Optional[int], embeddings: Dict[str, List[float]]):
+        """Store text -> embedding pairs in both tiers."""
+        if not embeddings:
+            return
+
+        now = time.time()
+        rows = []
+        for text, vector in embeddings.items():
+            key = self.make_key(model, dimensions, text)
+            self.memory.set(key, list(vector))
+            rows.append((
+                key, model, dimensions,
+                np.asarray(vector, dtype=np.float32).tobytes(), now, now
+            ))
+
+        conn = self._db()
+        if conn is None:
+            return
+
+        with self._lock:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings "
+                "(key, model, dimensions, vector, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+            self._writes_since_evict += len(rows)
+            should_evict = self._writes_since_evict >= self.EVICT_EVERY
+
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """Remove expired rows, then the least recently used rows beyond max_rows."""
+        conn = self._db()
+        if conn is None:
+            return
+
+        with self._lock:
+            if self.max_age is not None:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE created_at < ?",
+                    (time.time() - self.max_age,)
+                )
+            if self.max_rows is not None:
+                conn.execute("""
+                    DELETE FROM embeddings WHERE key IN (
+                        SELECT key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_rows,))
+            conn.commit()
+            self._writes_since_evict = 0
+
+    def clear(self):
+        """Empty both tiers."""
+        self.memory.clear()
+        conn = self._db()
+        if conn is not None:
+            with self._lock:
+                conn.execute("DELETE FROM embeddings")
+                conn.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss counters for both tiers."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        disk_rows = 0
+        conn = self._db()
+        if conn is not None:
+            with self._lock:
+                disk_rows = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_size": len(self.memory),
+            "disk_rows": disk_rows
+        }
+
+
+# ============================================================================
+# SEMANTIC ANSWER CACHE
+# ============================================================================
+
+class SemanticAnswerCache:
+    """
+    Answer cache that matches paraphrased questions by embedding similarity.
+
+    Question vectors are kept unit-normalized in one NumPy matrix, so a lookup
+    is a single masked matrix-vector product. Entries only match within the
+    same scope (namespace + pipeline flags), expire after ttl seconds, and the
+    least recently used entry is replaced once max_size is reached.
+    """
+
+    def __init__(self, threshold: float = 0.92, max_size: int = 1000, ttl: Optional[float] = 3600):
+        """
+        Args:
+            threshold: Minimum cosine similarity for a cached answer to be served
+            max_size: Maximum number of cached answers
+            ttl: Seconds an answer stays valid (None = no expiry)
+        """
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        self._vectors = None  # (max_size, dim) float32, allocated on first put
+        self._scope_ids = np.full(max_size, -1, dtype=np.int64)
+        self._stored_at = np.zeros(max_size)
+        self._last_used = np.zeros(max_size)
+        self._valid = np.zeros(max_size, dtype=bool)
+        self._values = [None] * max_size
+        self._scopes = {}  # scope tuple -> int id, only for scopes with entries
+        self._next_scope_id = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def _expire(self, now: float):
+        if self.ttl is None:
+            return
+        expired = self._valid & (now - self._stored_at > self.ttl)
+        for slot in np.flatnonzero(expired):
+            self._values[slot] = None
+        self._valid[expired] = False
+
+    def lookup(self, vector, scope: tuple):
+        """
+        Find the most similar cached question in the same scope.
+
+        Returns:
+            (value, similarity) if the best match clears the threshold, else None
+        """
+        with self._lock:
+            scope_id = self._scopes.get(scope)
+            if self._vectors is None or scope_id is None:
+                self.misses += 1
+                return None
+
+            now = time.time()
+            self._expire(now)
+
+            slots = np.flatnonzero(self._valid & (self._scope_ids == scope_id))
+            if slots.size == 0:
+                self.misses += 1
+                return None
+
+            similarities = self._vectors[slots] @ self._normalize(vector)
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = slots[best]
+            self._last_used[slot] = now
+            self.hits += 1
+            return self._values[slot], similarity
+
+    def put(self, vector, scope: tuple, value):
+        """Cache a value for a question vector, replacing the LRU entry if full."""
+        v = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, v.shape[0]), dtype=np.float32)
+
+            now = time.time()
+            self._expire(now)
+
+            free = np.flatnonzero(~self._valid)
+            slot = int(free[0]) if free.size else int(np.argmin(self._last_used))
+            self._valid[slot] = False
+
+            if scope not in self._scopes:
+                # Scopes come from client options, so forget the ones whose
+                # entries have all expired or been replaced
+                live = set(self._scope_ids[self._valid].tolist())
+                self._scopes = {s: i for s, i in self._scopes.items() if i in live}
+                self._scopes[scope] = self._next_scope_id
+                self._next_scope_id += 1
+
+            self._vectors[slot] = v
+            self._scope_ids[slot] = self._scopes[scope]
+            self._stored_at[slot] = now
+            self._last_used[slot] = now
+            self._valid[slot] = True
+            self._values[slot] = value
+
+    def clear(self):
+        with self._lock:
+            self._valid[:] = False
+            self._values = [None] * self.max_size
+            self._scopes = {}
+
+    def __len__(self) -> int:
+        return int(self._valid.sum())
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
@@ -0,0 +1,266 @@
+# Token-Budgeted Context Packing
+# Builds the context of the generation prompt from the reranked chunks within
+# a token budget: chunks from the same source/page become one cited block
+# with overlapping text stitched out, near-duplicate sentences are dropped,
+# and blocks are added greedily by rerank score until the budget is spent
+
+import os
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.utils import get_tokenizer
+
+from cache import normalize_text
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Context tokens for the gpt-4o-mini prompt (0 = no packing, every chunk in full)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+# Jaccard similarity of word-bigram sets at which a sentence counts as a repeat
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85"))
+
+# Shortest shared text treated as chunk overlap (chunker overlap is ~200 tokens)
+MIN_OVERLAP_CHARS = 40
+
+# A block cut to fit the budget is only kept if at least this many tokens remain
+MIN_PARTIAL_TOKENS = 48
+
+# Sentences shorter than this (headings, "See Figure 3.") are never deduplicated
+MIN_DEDUPE_WORDS = 4
+
+# Unpunctuated runs (tables, code, PDF extraction artifacts) are cut into
+# pieces of at most this many words so they can be deduped and truncated
+MAX_SENTENCE_WORDS = 60
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Prompt tokens of a text.
+
+    Uses LlamaIndex's bundled tiktoken encoding (cl100k), which works offline
+    and is within a few percent of gpt-4o-mini's o200k on English text.
+    """
+    return len(get_tokenizer()(text))
+
+
+def citation(metadata: dict) -> str:
+    return f"[Source: {metadata.get('source', 'Unknown')}, Page {metadata.get('page', 'N/A')}]"
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences of a text, with over-long runs cut every MAX_SENTENCE_WORDS words."""
+    sentences = []
+    for sentence in _SENTENCE_BREAK.split(text.strip()):
+        words = sentence.split()
+        for start in range(0, len(words), MAX_SENTENCE_WORDS):
+            sentences.append(" ".join(words[start:start + MAX_SENTENCE_WORDS]))
+    return sentences
+
+
+def naive_context(nodes: list) -> str:
+    """Every chunk in full under its own citation, in rank order (no packing)."""
+    return "\n\n".join(f"{citation(n.metadata)}\n{n.text}" for n in nodes)
+
+
+# ============================================================================
+# MERGING CHUNKS OF ONE PAGE
+# ============================================================================
+
+class _Segment:
+    """Contiguous text stitched from one or more chunks of the same page."""
+
+    __slots__ = ("text", "first_id", "last_id", "prev_id")
+
+    def __init__(self, text: str, first_id: str, last_id: str, prev_id: Optional[str]):
+        self.text = text
+        self.first_id = first_id
+        self.last_id = last_id
+        self.prev_id = prev_id
+
+
+def _stitch(a: str, b: str) -> Optional[str]:
+    """a followed by b with their shared text removed, or None if they don't overlap."""
+    if b in a:
+        return a
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return None
+    start = a.find(probe)
+    while start != -1:
+        if b.startswith(a[start:]):
+            return a + b[len(a) - start:]
+        start = a.find(probe, start + 1)
+    return None
+
+
+def _join(a: _Segment, b: _Segment) -> Optional[_Segment]:
+    """Segment a then b if b overlaps a's end or is the chunk right after it."""
+    text = _stitch(a.text, b.text)
+    if text is None and b.prev_id is not None and b.prev_id == a.last_id:
+        text = a.text + "\n" + b.text
+    if text is None:
+        return None
+    return _Segment(text, a.first_id, b.last_id if text != a.text else a.last_id, a.prev_id)
+
+
+def merge_page_chunks(nodes: list) -> List[str]:
+    """
+    Merge the chunks of one source/page into as few texts as possible.
+
+    Overlapping chunks (the chunker's overlap window) are stitched so the
+    shared text appears once, and chunks linked as previous/next are
+    concatenated in document order.
+    """
+    segments = []
+    for n in nodes:
+        prev = n.node.prev_node
+        segments.append(_Segment(n.text, n.node.node_id, n.node.node_id, prev.node_id if prev else None))
+
+    merged = True
+    while merged and len(segments) > 1:
+        merged = False
+        for i, a in enumerate(segments):
+            for j, b in enumerate(segments):
+                if i != j:
+                    joined = _join(a, b)
+                    if joined is not None:
+                        segments[i] = joined
+                        del segments[j]
+                        merged = True
+                        break
+            if merged:
+                break
+    return [s.text for s in segments]
+
+
+# ============================================================================
+# NEAR-DUPLICATE SENTENCES
+# ============================================================================
+
+def near_duplicate_mask(sentences: List[str], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> np.ndarray:
+    """
+    True for each sentence that repeats an earlier kept one.
+
+    Sentences are compared as sets of word bigrams, which unlike bare word
+    sets tell apart different sentences over the same technical vocabulary.
+    All pairwise Jaccard similarities come from one binary
+    (sentences x bigram vocabulary) matrix product.
+    """
+    shingle_sets = []
+    for sentence in sentences:
+        words = _WORD.findall(normalize_text(sentence))
+        shingle_sets.append(set(zip(words, words[1:])) if len(words) >= MIN_DEDUPE_WORDS else set())
+    vocabulary = {w: i for i, w in enumerate(set().union(*shingle_sets))} if shingle_sets else {}
+    drop = np.zeros(len(sentences), dtype=bool)
+    if not vocabulary:
+        return drop
+
+    matrix = np.zeros((len(sentences), len(vocabulary)), dtype=np.float32)
+    for i, shingles in enumerate(shingle_sets):
+        matrix[i, [vocabulary[w] for w in shingles]] = 1.0
+    sizes = matrix.sum(axis=1)
+    intersections = matrix @ matrix.T
+    unions = sizes[:, None] + sizes[None, :] - intersections
+    similarity = np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+
+    for i in range(1, len(sentences)):
+        if sizes[i] == 0:
+            continue
+        earlier = np.flatnonzero(~drop[:i])
+        drop[i] = bool(np.any(similarity[i, earlier] >= threshold))
+    return drop
+
+
+# ============================================================================
+# PACKING
+# ============================================================================
+
+def pack_context(nodes: list, token_budget: Optional[int] = None) -> Tuple[str, dict]:
+    """
+    Context string for the generation prompt within a token budget.
+
+    1. Chunks with the same source and page are merged into one block under
+       a single citation (see merge_page_chunks); a block's score is its best
+       chunk's rerank score
+    2. Sentences that nearly repeat a sentence of a better block are dropped
+    3. Blocks are added best first while they fit; a block that doesn't fit
+       is cut at a sentence boundary, and smaller blocks can still fill the
+       remaining space
+
+    Args:
+        nodes: Reranked NodeWithScore list, best first
+        token_budget: Context token budget (None = CONTEXT_TOKEN_BUDGET, 0 = no packing)
+
+    Returns:
+        (context string, report with token counts before/after and what was merged or dropped)
+    """
+    budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    unpacked = naive_context(nodes)
+    tokens_before = count_tokens(unpacked)
+    report = {
+        "budget": budget, "tokens_before": tokens_before, "tokens_after": tokens_before,
+        "chunks": len(nodes), "blocks": len(nodes), "sentences_dropped": 0,
+        "blocks_truncated": 0, "blocks_dropped": 0
+    }
+    if budget <= 0 or not nodes:
+        return unpacked, report
+
+    # 1. One block per source/page, in order of its best chunk
+    groups = {}
+    for n in nodes:
+        key = (n.metadata.get("source", "Unknown"), n.metadata.get("page", "N/A"))
+        groups.setdefault(key, []).append(n)
+    blocks = []
+    for members in groups.values():
+        sentences = [s for text in merge_page_chunks(members) for s in split_sentences(text)]
+        blocks.append({
+            "header": citation(members[0].metadata),
+            "score": max((m.score or 0.0) for m in members),
+            "sentences": sentences
+        })
+    blocks.sort(key=lambda b: b["score"], reverse=True)
+
+    # 2. Near-duplicate sentences across all blocks, best block first
+    flat = [(bi, s) for bi, block in enumerate(blocks) for s in block["sentences"]]
+    drop = near_duplicate_mask([s for _, s in flat])
+    for block in blocks:
+        block["sentences"] = []
+    for (bi, sentence), dropped in zip(flat, drop):
+        if not dropped:
+            blocks[bi]["sentences"].append(sentence)
+    report["sentences_dropped"] = int(drop.sum())
+
+    # 3. Greedy fill by score
+    remaining = budget
+    parts = []
+    for block in blocks:
+        header_tokens = count_tokens(block["header"]) + 2  # separators
+        kept, used = [], header_tokens
+        for sentence in block["sentences"]:
+            tokens = count_tokens(sentence) + 1
+            if used + tokens > remaining:
+                break
+            kept.append(sentence)
+            used += tokens
+        if not kept:
+            report["blocks_dropped"] += 1
+            continue
+        if len(kept) < len(block["sentences"]):
+            if used - header_tokens < MIN_PARTIAL_TOKENS:
+                report["blocks_dropped"] += 1
+                continue
+            report["blocks_truncated"] += 1
+        parts.append(f"{block['header']}\n{' '.join(kept)}")
+        remaining -= used
+
+    context = "\n\n".join(parts)
+    report["blocks"] = len(parts)
+    report["tokens_after"] = count_tokens(context)
+    return context, report
@@ -0,0 +1,440 @@
+# Parallel, Incremental Book Ingestion
+# Streams the pages of every book in books_config.yaml through chunking,
+# embeds new or changed chunks in large batches on a worker pool and
+# bulk-upserts them to the book's Pinecone namespace in sized batches. A
+# local SQLite manifest of chunk content hashes lets a re-run skip unchanged
+# chunks (adding one book doesn't re-embed the library) and resume where an
+# interrupted run stopped. The corpus BM25 index (sparse_index.py) is updated
+# with the same added and deleted chunks
+#
+# Usage:
+#   python ingest.py                               # Every namespace in books_config.yaml
+#   python ingest.py --namespace llm --workers 8   # One namespace
+#   python ingest.py --book "AI Engineering"       # One book
+#   python ingest.py --dry-run                     # Count new/changed chunks only
+
+import os
+import time
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import yaml
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode, TextNode
+
+from cache import hash_key
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+BOOKS_CONFIG_PATH = os.getenv("BOOKS_CONFIG_PATH", "books_config.yaml")
+INGEST_STATE_PATH = os.getenv("INGEST_STATE_PATH", "ingest_state.sqlite")
+
+# Chunking (tokens), as LlamaIndex's SentenceSplitter defaults
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1024"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+
+# Embed + upsert tasks running at once, chunks per task, vectors per upsert request
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "256"))
+INGEST_UPSERT_BATCH_SIZE = int(os.getenv("INGEST_UPSERT_BATCH_SIZE", "100"))
+
+PAGE_EXTENSIONS = (".pdf", ".txt", ".md")
+PROGRESS_EVERY_SECONDS = 5
+
+
+def load_books_config(path: str = BOOKS_CONFIG_PATH) -> Tuple[str, Dict[str, List[str]]]:
+    """
+    Read books_config.yaml.
+
+    Returns:
+        (books directory, {namespace: [book folder names]}); the books_path
+        setting is relative to the config file
+    """
+    with open(path, encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    books_path = os.path.join(os.path.dirname(os.path.abspath(path)), config.get("books_path", "Books"))
+    namespaces = {ns: list(entry.get("books") or []) for ns, entry in config["namespaces"].items()}
+    return books_path, namespaces
+
+
+# ============================================================================
+# PAGES AND CHUNKS
+# ============================================================================
+
+def iter_pages(book_dir: str) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page number, text) for the files of a book folder, in name order.
+
+    PDF pages are numbered as in the file; a .txt/.md file is one page.
+    Page numbers continue across files so every page of a book is distinct.
+    """
+    page_base = 0
+    for name in sorted(os.listdir(book_dir)):
+        path = os.path.join(book_dir, name)
+        extension = os.path.splitext(name)[1].lower()
+        if not os.path.isfile(path) or extension not in PAGE_EXTENSIONS:
+            continue
+
+        if extension == ".pdf":
+            from pypdf import PdfReader
+
+            reader = PdfReader(path)
+            for i, page in enumerate(reader.pages, 1):
+                yield page_base + i, page.extract_text() or ""
+            page_base += len(reader.pages)
+        else:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                yield page_base + 1, f.read()
+            page_base += 1
+
+
+def chunk_id(namespace: str, book: str, page: int, index: int) -> str:
+    """Stable vector id of a chunk position, so a changed chunk overwrites its old vector."""
+    return f"{namespace}-{hash_key(book, page, index)[:24]}"
+
+
+class Chunk:
+    """One chunk awaiting embedding."""
+
+    __slots__ = ("id", "book", "content_hash", "node")
+
+    def __init__(self, chunk_id: str, book: str, content_hash: str, node: TextNode):
+        self.id = chunk_id
+        self.book = book
+        self.content_hash = content_hash
+        self.node = node
+
+
+# ============================================================================
+# INGESTION STATE (SQLite manifest)
+# ============================================================================
+
+class IngestState:
+    """
+    Content hash of every chunk already upserted, per namespace and book.
+
+    Rows are written only after their batch was upserted, so after an
+    interruption the next run skips the finished batches and resumes.
+    """
+
+    def __init__(self, path: str = INGEST_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT NOT NULL,
+                namespace TEXT NOT NULL,
+                book TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, id)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_book ON chunks (namespace, book)")
+        self._conn.commit()
+
+    def book_hashes(self, namespace: str, book: str) -> Dict[str, str]:
+        """Chunk id -> content hash of a book's upserted chunks."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, content_hash FROM chunks WHERE namespace = ? AND book = ?", (namespace, book)
+            ).fetchall()
+        return dict(rows)
+
+    def count(self, namespace: str) -> int:
+        """Number of upserted chunks recorded for a namespace."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def mark_upserted(self, namespace: str, chunks: List[Chunk]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, namespace, book, content_hash, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(c.id, namespace, c.book, c.content_hash, now) for c in chunks]
+            )
+            self._conn.commit()
+
+    def forget(self, namespace: str, ids: List[str]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE namespace = ? AND id = ?", [(namespace, i) for i in ids]
+            )
+            self._conn.commit()
+
+    def clear(self, namespace: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE namespace = ?", (namespace,))
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+# ============================================================================
+# PIPELINE
+# ============================================================================
+
+class Progress:
+    """Thread-safe ingestion counters with a periodic chunks/sec line."""
+
+    FIELDS = ("pages", "chunks", "unchanged", "queued", "embedded", "upserted", "deleted",
+              "sparse_indexed", "failed_batches")
+
+    def __init__(self, every: float = PROGRESS_EVERY_SECONDS):
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+        self.start = time.perf_counter()
+        self._every = every
+        self._last_report = self.start
+        self._lock = threading.Lock()
+
+    def add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self.counts[name] += delta
+            now = time.perf_counter()
+            if self._every and now - self._last_report >= self._every:
+                self._last_report = now
+                print("  " + self.line())
+
+    def line(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        c = self.counts
+        return (f"{c['chunks']} chunks ({c['unchanged']} unchanged), {c['upserted']} upserted | "
+                f"{c['chunks'] / elapsed:.1f} chunks/s read, {c['upserted'] / elapsed:.1f} chunks/s upserted")
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.start
+        return {
+            **self.counts,
+            "seconds": round(elapsed, 2),
+            "chunks_per_second": round(self.counts["chunks"] / max(elapsed, 1e-9), 1),
+            "upserted_per_second": round(self.counts["upserted"] / max(elapsed, 1e-9), 1),
+        }
+
+
+def ingest(
+    books: Dict[str, List[str]],
+    books_path: str,
+    pinecone_index,
+    embed_model,
+    state: IngestState,
+    workers: int = INGEST_WORKERS,
+    embed_batch_size: int = INGEST_EMBED_BATCH_SIZE,
+    upsert_batch_size: int = INGEST_UPSERT_BATCH_SIZE,
+    dry_run: bool = False,
+    progress: Optional[Progress] = None,
+    sparse_index=None
+) -> dict:
+    """
+    Chunk, embed and upsert the given books, skipping unchanged chunks.
+
+    The calling thread reads pages and chunks them; full batches of new or
+    changed chunks go to a pool of `workers` threads that embed the batch
+    and upsert it, then record it in the state. At most 2 x workers batches
+    are in flight, so memory stays bounded on large libraries. Chunks of a
+    fully read book that no longer exist (the book got shorter) are deleted.
+
+    With a sparse_index, each upserted batch is also added to its namespace
+    partition (before the manifest records it, so a resumed run re-adds it)
+    and deleted chunks are tombstoned; touched partitions are compacted at
+    the end, so BM25 results follow the run without a rebuild from Pinecone.
+
+    Args:
+        books: {namespace: [book folder names]} to ingest
+        books_path: Directory holding the book folders
+        pinecone_index: Pinecone index handle
+        embed_model: LlamaIndex embedding model
+        state: Manifest of upserted chunk hashes
+        workers: Embed + upsert tasks running at once
+        embed_batch_size: Chunks embedded per task
+        upsert_batch_size: Vectors per Pinecone upsert request
+        dry_run: Only count new/changed chunks; nothing is embedded or written
+        progress: Counters to update (a new Progress if None)
+        sparse_index: SparseIndex to keep in step with Pinecone (optional)
+
+    Returns:
+        Progress.summary() of the run
+    """
+    from llama_index.vector_stores.pinecone import PineconeVectorStore
+
+    progress = progress or Progress()
+    splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    model_key = (getattr(embed_model, "model_name", ""), getattr(embed_model, "dimensions", None))
+    vector_stores = {
+        ns: PineconeVectorStore(pinecone_index=pinecone_index, namespace=ns, batch_size=upsert_batch_size)
+        for ns in books
+    }
+
+    in_flight = threading.BoundedSemaphore(max(1, workers) * 2)
+    failed_books = set()
+    failed_lock = threading.Lock()
+    sparse_touched = set()
+
+    def embed_and_upsert(namespace: str, batch: List[Chunk]):
+        try:
+            texts = [c.node.get_content(metadata_mode=MetadataMode.EMBED) for c in batch]
+            for chunk, embedding in zip(batch, embed_model.get_text_embedding_batch(texts)):
+                chunk.node.embedding = embedding
+            progress.add(embedded=len(batch))
+            vector_stores[namespace].add([c.node for c in batch])
+            if sparse_index is not None:
+                sparse_index.add_documents(namespace, [
+                    {"id": c.id, "text": c.node.text, "metadata": dict(c.node.metadata)} for c in batch
+                ])
+                sparse_touched.add(namespace)
+                progress.add(sparse_indexed=len(batch))
+            state.mark_upserted(namespace, batch)
+            progress.add(upserted=len(batch))
+        except Exception as e:
+            with failed_lock:
+                failed_books.update((namespace, c.book) for c in batch)
+            progress.add(failed_batches=1)
+            print(f"  Batch of {len(batch)} chunks in '{namespace}' failed: {e}")
+        finally:
+            in_flight.release()
+
+    completed_books = []  # (namespace, book, stale ids)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest") as pool:
+        futures = []
+
+        def submit(namespace: str, batch: List[Chunk]):
+            progress.add(queued=len(batch))
+            if dry_run:
+                return
+            in_flight.acquire()
+            futures.append(pool.submit(embed_and_upsert, namespace, batch))
+
+        try:
+            for namespace, book_names in books.items():
+                batch = []
+                for book in book_names:
+                    book_dir = os.path.join(books_path, book)
+                    if not os.path.isdir(book_dir):
+                        print(f"  Skipping '{book.strip()}' ({namespace}): no folder at {book_dir}")
+                        continue
+
+                    known = state.book_hashes(namespace, book)
+                    seen = set()
+                    for page, text in iter_pages(book_dir):
+                        progress.add(pages=1)
+                        for index, chunk_text in enumerate(splitter.split_text(text)):
+                            node = TextNode(
+                                id_=chunk_id(namespace, book, page, index), text=chunk_text,
+                                metadata={"source": book.strip(), "page": page, "namespace": namespace}
+                            )
+                            content_hash = hash_key(*model_key, chunk_text, sorted(node.metadata.items()))
+                            seen.add(node.node_id)
+                            progress.add(chunks=1)
+                            if known.get(node.node_id) == content_hash:
+                                progress.add(unchanged=1)
+                                continue
+                            batch.append(Chunk(node.node_id, book, content_hash, node))
+                            if len(batch) >= embed_batch_size:
+                                submit(namespace, batch)
+                                batch = []
+                    completed_books.append((namespace, book, [i for i in known if i not in seen]))
+                if batch:
+                    submit(namespace, batch)
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            print("Interrupted - finished batches are recorded, re-run to resume")
+            raise
+        finally:
+            for future in futures:
+                if not future.cancelled():
+                    future.result()
+
+    # Chunks that disappeared from a book (only once the whole book went through)
+    for namespace, book, stale in completed_books:
+        if stale and not dry_run and (namespace, book) not in failed_books:
+            for start in range(0, len(stale), upsert_batch_size):
+                ids = stale[start:start + upsert_batch_size]
+                pinecone_index.delete(ids=ids, namespace=namespace)
+                if sparse_index is not None:
+                    sparse_index.delete_documents(namespace, ids)
+                    sparse_touched.add(namespace)
+                state.forget(namespace, ids)
+            progress.add(deleted=len(stale))
+
+    # Fold this run's segments and tombstones into one segment per partition
+    if sparse_touched:
+        sparse_index.compact(sorted(sparse_touched))
+
+    return progress.summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel, incremental book ingestion")
+    parser.add_argument("--config", default=BOOKS_CONFIG_PATH, help="Books config file")
+    parser.add_argument("--namespace", help="Only this namespace (default: all in the config)")
+    parser.add_argument("--book", help="Only this book folder")
+    parser.add_argument("--state", default=INGEST_STATE_PATH, help="Ingestion manifest (SQLite)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--embed-batch", type=int, default=INGEST_EMBED_BATCH_SIZE, help="Chunks per embedding task")
+    parser.add_argument("--upsert-batch", type=int, default=INGEST_UPSERT_BATCH_SIZE, help="Vectors per upsert request")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Delete the selected namespaces' vectors and manifest first")
+    parser.add_argument("--dry-run", action="store_true", help="Only count new/changed chunks")
+    args = parser.parse_args()
+
+    books_path, books = load_books_config(args.config)
+    if args.namespace:
+        if args.namespace not in books:
+            raise SystemExit(f"Unknown namespace '{args.namespace}' (expected one of {list(books)})")
+        books = {args.namespace: books[args.namespace]}
+    if args.book:
+        books = {ns: [b for b in names if b.strip() == args.book.strip()] for ns, names in books.items()}
+        books = {ns: names for ns, names in books.items() if names}
+        if not books:
+            raise SystemExit(f"Book '{args.book}' is not in {args.config}")
+
+    import rag_llamaindex as rag
+    from sparse_index import SPARSE_INDEX_DIR, SparseIndex, export_namespace
+
+    pinecone_index = rag.get_pinecone_index()
+    state = IngestState(args.state)
+    sparse = None if args.dry_run else rag.corpus_bm25_index or SparseIndex(SPARSE_INDEX_DIR)
+    if args.rebuild and not args.dry_run:
+        for namespace in books:
+            print(f"Clearing namespace '{namespace}'...")
+            pinecone_index.delete(delete_all=True, namespace=namespace)
+            state.clear(namespace)
+            sparse.clear(namespace)
+    if sparse is not None:
+        # Namespaces ingested before the BM25 index existed are exported once;
+        # from then on every run updates the partition incrementally
+        for namespace in books:
+            if not sparse.partition(namespace).num_docs and state.count(namespace):
+                print(f"Building the BM25 partition of '{namespace}' from Pinecone (first run)...")
+                sparse.add_documents(namespace, export_namespace(pinecone_index, namespace))
+
+    print(f"Ingesting {sum(len(b) for b in books.values())} books into {list(books)} "
+          f"({args.workers} workers, {args.embed_batch} chunks per embedding batch)")
+    summary = ingest(
+        books, books_path, pinecone_index, rag.get_embed_model(), state,
+        workers=args.workers, embed_batch_size=args.embed_batch,
+        upsert_batch_size=args.upsert_batch, dry_run=args.dry_run, sparse_index=sparse
+    )
+    state.close()
+
+    print(f"Done in {summary['seconds']}s: {summary['chunks']} chunks, {summary['unchanged']} unchanged, "
+          f"{summary['queued']} new or changed, {summary['upserted']} upserted, {summary['deleted']} deleted, "
+          f"{summary['failed_batches']} failed batches | {summary['chunks_per_second']} chunks/s")
+    if sparse is not None:
+        print(f"BM25 index ({SPARSE_INDEX_DIR}): {summary['sparse_indexed']} chunks added or updated, "
+              f"{summary['deleted']} removed | "
+              + ", ".join(f"{ns}: {sparse.partition(ns).num_docs} docs" for ns in books))
+    if (summary["upserted"] or summary["deleted"]) and os.path.isdir(rag.LOCAL_VECTOR_STORE_DIR):
+        # The local store is a snapshot of Pinecone (VECTOR_STORE_BACKEND=local)
+        print(f"{rag.LOCAL_VECTOR_STORE_DIR} still serves the previous vectors: "
+              f"python local_vector_store.py export to include this run")
@@ -4,6 +4,7 @@
 
 import os
 import json
+import threading
 from typing import Dict, List, Set, Optional
 from pathlib import Path
 from dotenv import load_dotenv
@@ -15,11 +16,23 @@ load_dotenv()
 # CONFIGURATION
 # ============================================================================
 
-GRAPH_FILE = "concept_graph.json"
+GRAPH_FILE = os.getenv("CONCEPT_GRAPH_PATH", "concept_graph.json")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Initialize LLM for concept extraction
-llm = OpenAI(model="gpt-4o-mini", temperature=0, api_key=OPENAI_API_KEY)
+# LLM for concept extraction, created on first use so importing this module
+# (e.g. from the RAG pipeline, which only reads the graph) stays cheap
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm() -> OpenAI:
+    """Lazily create the concept extraction LLM (thread-safe)."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = OpenAI(model="gpt-4o-mini", temperature=0, api_key=OPENAI_API_KEY)
+    return _llm
 
 # ============================================================================
 # CONCEPT GRAPH SCHEMA
@@ -539,7 +552,7 @@ Example output: agent_memory, rag, vector_database, fine_tuning
 Concepts:"""
 
     try:
-        response = llm.complete(prompt)
+        response = get_llm().complete(prompt)
         concepts_str = str(response).strip()
         concepts = [c.strip().lower().replace(" ", "_") for c in concepts_str.split(",")]
         return [c for c in concepts if len(c) > 2 and len(c) < 50]
@@ -570,7 +583,7 @@ vector_database | enables | semantic_search
 Relationships:"""
 
     try:
-        response = llm.complete(prompt)
+        response = get_llm().complete(prompt)
         lines = str(response).strip().split("\n")
         relationships = []
 
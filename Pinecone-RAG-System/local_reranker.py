@@ -0,0 +1,99 @@
+# Local Vector Reranking with Maximal Marginal Relevance
+# Scores retrieval candidates against the question embedding using the
+# vectors returned with the retrieval (no API call), and picks them with MMR
+# so the top-k is not filled with near-identical passages from one book.
+# Used as a pre-filter before Cohere and as the reranker when Cohere is
+# unavailable.
+
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Relevance vs diversity trade-off (1 = pure cosine relevance, 0 = pure diversity)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+# Shrink the Cohere candidate list to this many MMR picks (0 = no pre-filter)
+MMR_PREFILTER_CANDIDATES = int(os.getenv("MMR_PREFILTER_CANDIDATES", "0"))
+
+
+def mmr_select(query_vector, vectors: np.ndarray, k: int, mmr_lambda: float = MMR_LAMBDA) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pick k rows by Maximal Marginal Relevance.
+
+    Each step takes the row maximizing
+
+        lambda * cos(q, d) - (1 - lambda) * max over picked p of cos(d, p)
+
+    Query relevance and all pairwise similarities come from two matrix
+    products up front; each step is then a vectorized update of the running
+    max similarity to the picked rows.
+
+    Args:
+        query_vector: Question embedding
+        vectors: (candidates x dims) candidate embeddings
+        k: Rows to pick
+        mmr_lambda: Relevance weight (see MMR_LAMBDA)
+
+    Returns:
+        (picked row indices in pick order, cosine relevance of every row)
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = matrix @ query
+    similarity = matrix @ matrix.T
+
+    k = min(k, len(matrix))
+    picked = np.empty(k, dtype=np.int64)
+    # Max similarity to the picked rows (no penalty before the first pick)
+    max_similarity = np.zeros(len(matrix), dtype=np.float32)
+    available = np.ones(len(matrix), dtype=bool)
+    for step in range(k):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked[step] = best
+        available[best] = False
+        max_similarity = similarity[best] if step == 0 else np.maximum(max_similarity, similarity[best])
+    return picked, relevance
+
+
+def mmr_rerank(query_embedding, nodes: list, top_n: int, mmr_lambda: float = MMR_LAMBDA) -> List:
+    """
+    Rerank retrieved nodes locally by MMR over their embeddings.
+
+    Picked nodes are returned in pick order, scored with their cosine
+    relevance to the question. Nodes without an embedding are never picked;
+    they fill any remaining slots in their original order.
+
+    Args:
+        query_embedding: Question embedding (None = keep the original order)
+        nodes: Candidate NodeWithScore list (node.node.embedding holds the vector)
+        top_n: Number of nodes to return
+        mmr_lambda: Relevance weight (see MMR_LAMBDA)
+
+    Returns:
+        Up to top_n nodes
+    """
+    with_vectors = [i for i, n in enumerate(nodes) if n.node.embedding is not None]
+    if query_embedding is None or not with_vectors:
+        return nodes[:top_n]
+
+    picked, relevance = mmr_select(
+        query_embedding, [nodes[i].node.embedding for i in with_vectors], top_n, mmr_lambda
+    )
+    reranked = []
+    for row in picked:
+        node = nodes[with_vectors[row]]
+        node.score = float(relevance[row])
+        reranked.append(node)
+
+    without_vectors = [n for i, n in enumerate(nodes) if n.node.embedding is None]
+    return reranked + without_vectors[:top_n - len(reranked)]
@@ -0,0 +1,415 @@
+# Local Memory-Mapped Vector Store
+# Drop-in replacement for PineconeVectorStore for on-prem deployments and
+# low-latency serving: per-namespace vectors in a memory-mapped .npy file,
+# chunk text and metadata in a side store, exact batched NumPy inner-product
+# top-k with optional coarse IVF partitioning for large corpora
+#
+# Usage:
+#   python local_vector_store.py export                      # Copy every namespace from Pinecone
+#   python local_vector_store.py export --namespace llm --dtype float16 --ivf 256
+#   python local_vector_store.py search "what is rag" --namespace llm
+#
+# Serve from it with VECTOR_STORE_BACKEND=local (see rag_llamaindex.get_retriever)
+
+import os
+import json
+import mmap
+import shutil
+import argparse
+import threading
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+from namespace_router import spherical_kmeans
+from sparse_index import iter_namespace_vectors, metadata_to_document
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+LOCAL_VECTOR_STORE_DIR = os.getenv("LOCAL_VECTOR_STORE_DIR", "local_vectors")
+
+# IVF lists scanned per query (only used by namespaces exported with --ivf)
+LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", "16"))
+
+# Rows scored per matrix product in exact search; bounds the float32 copy of
+# a float16 block and the (queries x rows) score matrix
+SEARCH_BLOCK_ROWS = 32768
+
+DTYPES = {"float32": np.float32, "float16": np.float16}
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def _merge_top_k(best_scores, best_rows, scores, rows, top_k: int):
+    """Keep the top_k (score, row) pairs per query of two candidate sets."""
+    scores = np.concatenate([best_scores, scores], axis=1)
+    rows = np.concatenate([best_rows, rows], axis=1)
+    if scores.shape[1] > top_k:
+        keep = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        scores = np.take_along_axis(scores, keep, axis=1)
+        rows = np.take_along_axis(rows, keep, axis=1)
+    return scores, rows
+
+
+# ============================================================================
+# NAMESPACE SHARD (memory-mapped)
+# ============================================================================
+
+"""
+Store Layout:
+local_vectors/
+    llm/                        # One shard per namespace
+        vectors.npy             # (N, dim) unit-normalized, float32 or float16
+        ids.json                # Chunk id per row (Pinecone vector id)
+        docs.jsonl              # {"id", "text", "metadata"} per row
+        doc_offsets.npy         # Byte offsets of each row in docs.jsonl (N + 1)
+        ivf_centroids.npy       # Optional: (lists, dim) coarse centroids
+        ivf_offsets.npy         # Optional: CSR offsets into ivf_rows (lists + 1)
+        ivf_rows.npy            # Optional: row indices grouped by list
+        deleted.json            # Optional: tombstoned chunk ids, skipped by search
+    aws/
+    ...
+"""
+
+
+class NamespaceShard:
+    """The vectors and documents of one namespace, loaded with mmap."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.doc_offsets = np.load(os.path.join(path, "doc_offsets.npy"), mmap_mode="r")
+        with open(os.path.join(path, "ids.json"), encoding="utf-8") as f:
+            self.ids = json.load(f)
+
+        self.ivf_centroids = self.ivf_offsets = self.ivf_rows = None
+        if os.path.exists(os.path.join(path, "ivf_centroids.npy")):
+            self.ivf_centroids = np.load(os.path.join(path, "ivf_centroids.npy"))
+            self.ivf_offsets = np.load(os.path.join(path, "ivf_offsets.npy"))
+            self.ivf_rows = np.load(os.path.join(path, "ivf_rows.npy"), mmap_mode="r")
+
+        self._docs_file = open(os.path.join(path, "docs.jsonl"), "rb")
+        size = os.fstat(self._docs_file.fileno()).st_size
+        self._docs = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        # Rows of tombstoned ids stay on disk until the shard is rewritten
+        self.deleted = set()
+        deleted_path = os.path.join(path, "deleted.json")
+        if os.path.exists(deleted_path):
+            with open(deleted_path, encoding="utf-8") as f:
+                self.deleted = set(json.load(f))
+        self.live = np.array([i not in self.deleted for i in self.ids], dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    def document(self, row: int) -> dict:
+        """Read one stored doc ({"id", "text", "metadata"}) from docs.jsonl."""
+        start, end = int(self.doc_offsets[row]), int(self.doc_offsets[row + 1])
+        return json.loads(self._docs[start:end])
+
+    def search_many(self, queries, top_k: int, nprobe: Optional[int] = None):
+        """
+        Top-k rows by inner product for a batch of query vectors.
+
+        Queries are unit-normalized, so scores are cosine similarities like
+        the Pinecone index returns. Exact search scans every row in blocks;
+        if the shard has IVF lists and nprobe is given, only the nprobe lists
+        closest to each query are scanned.
+
+        Returns:
+            (scores, rows) arrays of shape (queries, <= top_k), best first
+        """
+        queries = _normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        top_k = min(top_k, len(self))
+        if top_k <= 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+
+        if self.ivf_centroids is not None and nprobe:
+            scores, rows = self._search_ivf(queries, top_k, nprobe)
+        else:
+            scores, rows = self._search_exact(queries, top_k)
+
+        order = np.argsort(-scores, axis=1, kind="stable")
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+    def _search_exact(self, queries: np.ndarray, top_k: int):
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores = queries @ block.T
+            scores[:, ~self.live[start:start + len(block)]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            best_scores, best_rows = _merge_top_k(best_scores, best_rows, scores, rows, top_k)
+        return best_scores, best_rows
+
+    def _search_ivf(self, queries: np.ndarray, top_k: int, nprobe: int):
+        nprobe = min(nprobe, len(self.ivf_centroids))
+        probes = np.argpartition(-(queries @ self.ivf_centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        all_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        all_rows = np.zeros((len(queries), top_k), dtype=np.int64)
+        for i, lists in enumerate(probes):
+            rows = np.concatenate([
+                self.ivf_rows[self.ivf_offsets[j]:self.ivf_offsets[j + 1]] for j in lists
+            ]).astype(np.int64)
+            if len(rows) == 0:
+                continue
+            rows.sort()  # sequential reads from the memory map
+            scores = np.asarray(self.vectors[rows], dtype=np.float32) @ queries[i]
+            scores[~self.live[rows]] = -np.inf
+            k = min(top_k, len(rows))
+            keep = np.argpartition(-scores, k - 1)[:k]
+            all_scores[i, :k], all_rows[i, :k] = scores[keep], rows[keep]
+        return all_scores, all_rows
+
+    def delete_ids(self, ids: List[str]):
+        """Tombstone rows by chunk id; search skips them from now on."""
+        deleted = self.deleted | (set(ids) & set(self.ids))
+        if deleted == self.deleted:
+            return
+        tmp_path = os.path.join(self.path, "deleted.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sorted(deleted), f)
+        os.replace(tmp_path, os.path.join(self.path, "deleted.json"))
+        self.deleted = deleted
+        self.live = np.array([i not in deleted for i in self.ids], dtype=bool)
+
+    def close(self):
+        if isinstance(self._docs, mmap.mmap):
+            self._docs.close()
+        self._docs_file.close()
+
+    @staticmethod
+    def write(path: str, docs: List[dict], vectors: np.ndarray, dtype: str = "float32",
+              ivf_lists: int = 0):
+        """
+        Write a shard atomically to path, replacing any existing one.
+
+        Args:
+            path: Shard directory to create
+            docs: List of {"id", "text", "metadata"} dicts, one per vector
+            vectors: (len(docs), dim) chunk embeddings
+            dtype: "float32" or "float16" storage for the vectors
+            ivf_lists: Number of coarse IVF lists to build (0 = exact search only)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # An empty namespace exports a 1-D empty array; store it as (0, 0)
+        vectors = _normalize_rows(vectors.reshape(len(docs), -1) if len(docs) else vectors.reshape(0, 0))
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        stored = np.lib.format.open_memmap(
+            os.path.join(tmp_path, "vectors.npy"), mode="w+", dtype=DTYPES[dtype], shape=vectors.shape
+        )
+        stored[:] = vectors
+        stored.flush()
+        del stored
+
+        doc_offsets = [0]
+        with open(os.path.join(tmp_path, "docs.jsonl"), "wb") as f:
+            for doc in docs:
+                line = json.dumps(doc, ensure_ascii=False).encode("utf-8") + b"\n"
+                f.write(line)
+                doc_offsets.append(doc_offsets[-1] + len(line))
+        np.save(os.path.join(tmp_path, "doc_offsets.npy"), np.asarray(doc_offsets, dtype=np.int64))
+        with open(os.path.join(tmp_path, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump([doc["id"] for doc in docs], f)
+
+        if ivf_lists and len(docs):
+            centroids = spherical_kmeans(vectors, ivf_lists)
+            assignment = np.empty(len(vectors), dtype=np.int64)
+            for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+                block = vectors[start:start + SEARCH_BLOCK_ROWS]
+                assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            ivf_rows = np.argsort(assignment, kind="stable")
+            ivf_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=ivf_offsets[1:])
+            np.save(os.path.join(tmp_path, "ivf_centroids.npy"), centroids.astype(np.float32))
+            np.save(os.path.join(tmp_path, "ivf_offsets.npy"), ivf_offsets)
+            np.save(os.path.join(tmp_path, "ivf_rows.npy"), ivf_rows.astype(np.int64))
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+
+# ============================================================================
+# LLAMAINDEX VECTOR STORE
+# ============================================================================
+
+class LocalVectorStore(BasePydanticVectorStore):
+    """
+    LlamaIndex vector store over one exported namespace shard.
+
+    Query results carry the chunk text, the stored metadata (source, page,
+    namespace) and the chunk vector, like PineconeVectorStore does with
+    include_values. Deletes are tombstones on the shard; add rewrites the
+    shard with the new rows appended (dropping tombstoned and replaced rows),
+    so it suits occasional updates - bulk loads go through the export command.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+
+    namespace: Optional[str] = None
+    store_dir: str = LOCAL_VECTOR_STORE_DIR
+    nprobe: Optional[int] = LOCAL_IVF_NPROBE
+
+    _shard: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, namespace: Optional[str] = None, store_dir: str = LOCAL_VECTOR_STORE_DIR,
+                 nprobe: Optional[int] = LOCAL_IVF_NPROBE, **kwargs):
+        super().__init__(namespace=namespace, store_dir=store_dir, nprobe=nprobe, **kwargs)
+        path = os.path.join(store_dir, namespace or "_default")
+        if not os.path.exists(os.path.join(path, "vectors.npy")):
+            raise FileNotFoundError(
+                f"No local vectors for namespace '{namespace}' in '{store_dir}' - "
+                f"run: python local_vector_store.py export"
+            )
+        self._shard = NamespaceShard(path)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @property
+    def client(self) -> NamespaceShard:
+        return self._shard
+
+    def add(self, nodes, **add_kwargs) -> List[str]:
+        """Append embedded nodes to the shard, replacing rows with the same ids."""
+        if not nodes:
+            return []
+        with self._lock:
+            shard = self._shard
+            new_ids = {node.node_id for node in nodes}
+            keep = [row for row in np.flatnonzero(shard.live) if shard.ids[row] not in new_ids]
+            docs = [shard.document(row) for row in keep]
+            for node in nodes:
+                doc = {"id": node.node_id, "text": node.get_content(), "metadata": dict(node.metadata)}
+                if node.ref_doc_id:
+                    doc["ref_doc_id"] = node.ref_doc_id
+                docs.append(doc)
+
+            vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+            if keep:
+                vectors = np.concatenate([np.asarray(shard.vectors[keep], dtype=np.float32), vectors])
+            dtype = "float16" if shard.vectors.dtype == np.float16 else "float32"
+            ivf_lists = len(shard.ivf_centroids) if shard.ivf_centroids is not None else 0
+            NamespaceShard.write(shard.path, docs, vectors, dtype, ivf_lists)
+
+            # The old shard is not closed: in-flight queries may still hold it
+            self._shard = NamespaceShard(shard.path)
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs) -> None:
+        """Tombstone the chunks of a source document (or the chunk with that id)."""
+        with self._lock:
+            shard = self._shard
+            ids = [
+                shard.ids[row] for row in np.flatnonzero(shard.live)
+                if shard.ids[row] == ref_doc_id or shard.document(row).get("ref_doc_id") == ref_doc_id
+            ]
+            shard.delete_ids(ids)
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters=None, **delete_kwargs) -> None:
+        """Tombstone chunks by id."""
+        if filters is not None:
+            raise NotImplementedError("LocalVectorStore does not support metadata filters")
+        with self._lock:
+            self._shard.delete_ids(node_ids or [])
+
+    def query(self, query: VectorStoreQuery, **kwargs) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise NotImplementedError("LocalVectorStore does not support metadata filters")
+        if query.query_embedding is None:
+            raise ValueError("LocalVectorStore needs a query embedding")
+
+        scores, rows = self._shard.search_many([query.query_embedding], query.similarity_top_k, self.nprobe)
+        nodes, similarities, ids = [], [], []
+        for score, row in zip(scores[0].tolist(), rows[0].tolist()):
+            if score == -np.inf:  # IVF probes held fewer than top_k rows
+                continue
+            doc = self._shard.document(row)
+            nodes.append(TextNode(
+                id_=doc["id"], text=doc["text"], metadata=doc["metadata"],
+                embedding=np.asarray(self._shard.vectors[row], dtype=np.float32).tolist()
+            ))
+            similarities.append(score)
+            ids.append(doc["id"])
+        return VectorStoreQueryResult(nodes=nodes, similarities=similarities, ids=ids)
+
+
+# ============================================================================
+# EXPORT FROM PINECONE
+# ============================================================================
+
+def export_namespace_vectors(pinecone_index, namespace: str, batch_size: int = 100):
+    """
+    Fetch every chunk of a namespace from Pinecone with its vector.
+
+    Returns:
+        (docs, vectors): {"id", "text", "metadata"} dicts and a (N, dim) array
+    """
+    docs, vectors = [], []
+    for vector_id, vector in iter_namespace_vectors(pinecone_index, namespace, batch_size):
+        if vector.values and vector.metadata:
+            docs.append(metadata_to_document(vector_id, vector.metadata, namespace))
+            vectors.append(vector.values)
+    return docs, np.array(vectors, dtype=np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local memory-mapped vector store")
+    parser.add_argument("command", choices=["export", "search"])
+    parser.add_argument("query", nargs="?", help="Query for the search command")
+    parser.add_argument("--namespace", help="Only this namespace (default: all active)")
+    parser.add_argument("--dir", default=LOCAL_VECTOR_STORE_DIR, help="Store directory")
+    parser.add_argument("--dtype", choices=list(DTYPES), default="float32", help="Vector storage type")
+    parser.add_argument("--ivf", type=int, default=0, help="IVF lists per namespace (0 = exact only)")
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    import rag_llamaindex as rag
+
+    namespaces = [args.namespace] if args.namespace else rag.ACTIVE_NAMESPACES
+    if args.command == "export":
+        pinecone_index = rag.get_pinecone_index()
+        for namespace in namespaces:
+            print(f"Exporting namespace '{namespace}' from Pinecone...")
+            docs, vectors = export_namespace_vectors(pinecone_index, namespace)
+            NamespaceShard.write(os.path.join(args.dir, namespace), docs, vectors, args.dtype, args.ivf)
+            print(f"  Wrote {len(docs)} vectors ({args.dtype}"
+                  f"{f', {args.ivf} IVF lists' if args.ivf else ''})")
+
+    else:
+        embedding = rag.embed_queries([args.query or ""])[args.query or ""]
+        for namespace in namespaces:
+            shard = NamespaceShard(os.path.join(args.dir, namespace))
+            scores, rows = shard.search_many([embedding], args.top_k, LOCAL_IVF_NPROBE)
+            for score, row in zip(scores[0], rows[0]):
+                if score == -np.inf:
+                    continue
+                metadata = shard.document(int(row))["metadata"]
+                print(f"{score:.3f}  [{namespace}] {metadata.get('source', 'Unknown')} "
+                      f"p.{metadata.get('page', 'N/A')}")
@@ -0,0 +1,74 @@
+# Prometheus Metrics for the RAG API
+# Turns per-request traces (see tracing.py) into histograms (latency, prompt
+# context tokens), exposes candidate counts, cache hit rates and admission
+# state as gauges, and counts requests coalesced into an identical one
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Seconds; covers cached stages (~ms) up to slow generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+
+REQUEST_LATENCY = Histogram(
+    "rag_request_duration_seconds", "End-to-end pipeline latency",
+    ["endpoint"], buckets=LATENCY_BUCKETS
+)
+STAGE_LATENCY = Histogram(
+    "rag_stage_duration_seconds", "Latency of one pipeline stage",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+NAMESPACE_LATENCY = Histogram(
+    "rag_namespace_retrieval_duration_seconds", "Latency of one namespace retrieval",
+    ["namespace"], buckets=LATENCY_BUCKETS
+)
+TIME_TO_FIRST_BYTE = Histogram(
+    "rag_stream_time_to_first_byte_seconds", "Time until /query/stream sends its first event",
+    buckets=LATENCY_BUCKETS
+)
+
+CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens", "Generation prompt context tokens before and after packing",
+    ["phase"], buckets=(250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000)
+)
+
+CANDIDATES = Gauge(
+    "rag_candidates", "Candidate counts of the most recent request", ["stage"]
+)
+CACHE_HIT_RATE = Gauge(
+    "rag_cache_hit_rate", "Lifetime hit rate of a pipeline cache", ["cache"]
+)
+PIPELINE_REQUESTS = Gauge(
+    "rag_pipeline_requests", "Requests running or waiting for a pipeline slot", ["state"]
+)
+COALESCED_REQUESTS = Counter(
+    "rag_coalesced_requests", "Requests answered by an identical in-flight pipeline execution",
+    ["endpoint"]
+)
+
+
+def observe_trace(endpoint: str, timings: dict):
+    """Record a Trace.summary() from one request."""
+    REQUEST_LATENCY.labels(endpoint).observe(timings["total_ms"] / 1000)
+    for span in timings["spans"]:
+        if span["name"] == "retrieve":
+            NAMESPACE_LATENCY.labels(span["namespace"]).observe(span["duration_ms"] / 1000)
+        else:
+            STAGE_LATENCY.labels(span["name"]).observe(span["duration_ms"] / 1000)
+    for name, value in timings["counts"].items():
+        if name.startswith("context_tokens_"):
+            CONTEXT_TOKENS.labels(name[len("context_tokens_"):]).observe(value)
+        else:
+            CANDIDATES.labels(name).set(value)
+
+
+def render(cache_stats: dict, pipeline_stats: dict) -> tuple:
+    """
+    Refresh the scrape-time gauges and serialize every metric.
+
+    Returns:
+        (body bytes, content type) for the /metrics response
+    """
+    for cache, stats in cache_stats.items():
+        CACHE_HIT_RATE.labels(cache).set(stats["hit_rate"])
+    PIPELINE_REQUESTS.labels("active").set(pipeline_stats["active"])
+    PIPELINE_REQUESTS.labels("waiting").set(pipeline_stats["waiting"])
+    return generate_latest(), CONTENT_TYPE_LATEST
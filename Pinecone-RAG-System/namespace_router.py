@@ -0,0 +1,257 @@
+# Embedding-Centroid Namespace Router
+# Scores a query embedding against a few precomputed centroids per namespace
+# and picks the namespaces worth searching, instead of fanning out to all six
+#
+# Build centroids from the vectors in Pinecone, then check routing accuracy
+# against full fan-out retrieval:
+#     python namespace_router.py build
+#     python namespace_router.py evaluate --questions questions.txt
+
+import os
+import json
+import random
+import argparse
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+NAMESPACE_ROUTER_PATH = os.getenv("NAMESPACE_ROUTER_PATH", "namespace_centroids.npz")
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Unit-length cluster centres of unit vectors under cosine similarity."""
+    vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)]
+
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        updated = np.zeros_like(centroids)
+        np.add.at(updated, assignment, vectors)
+        # Keep the previous centre for clusters that lost all their members
+        empty = ~np.any(updated, axis=1)
+        updated[empty] = centroids[empty]
+        updated = _normalize_rows(updated)
+        if np.allclose(updated, centroids):
+            break
+        centroids = updated
+    return centroids
+
+
+class NamespaceRouter:
+    """
+    Per-namespace centroid matrix for routing query embeddings.
+
+    A namespace's score for a query is the best cosine similarity between the
+    query and any of that namespace's centroids. Scoring every namespace is
+    one (centroids x dim) matrix-vector product.
+    """
+
+    def __init__(self, namespaces: List[str], centroids: np.ndarray, labels: np.ndarray):
+        """
+        Args:
+            namespaces: Namespace names
+            centroids: (num_centroids, dim) matrix, rows unit-normalized here
+            labels: Namespace index of each centroid row
+        """
+        self.namespaces = list(namespaces)
+        self.centroids = _normalize_rows(np.asarray(centroids, dtype=np.float32))
+        self.labels = np.asarray(labels, dtype=np.int64)
+
+    @classmethod
+    def build(cls, vectors_by_namespace: Dict[str, np.ndarray], centroids_per_namespace: int = 8):
+        """
+        Cluster each namespace's chunk vectors into a few centroids.
+
+        Namespaces without vectors are left out, so they are never routed to.
+        """
+        namespaces, blocks, labels = [], [], []
+        for namespace, vectors in vectors_by_namespace.items():
+            if not len(vectors):
+                continue
+            centroids = spherical_kmeans(vectors, centroids_per_namespace)
+            labels.extend([len(namespaces)] * len(centroids))
+            namespaces.append(namespace)
+            blocks.append(centroids)
+        if not blocks:
+            raise ValueError("No namespace has any vectors to build centroids from")
+        return cls(namespaces, np.vstack(blocks), np.array(labels))
+
+    def save(self, path: str = NAMESPACE_ROUTER_PATH):
+        np.savez(path, namespaces=np.array(self.namespaces), centroids=self.centroids, labels=self.labels)
+
+    @classmethod
+    def load(cls, path: str = NAMESPACE_ROUTER_PATH) -> Optional["NamespaceRouter"]:
+        """Load saved centroids; None if the file doesn't exist."""
+        if not path or not os.path.exists(path):
+            return None
+        data = np.load(path)
+        return cls([str(ns) for ns in data["namespaces"]], data["centroids"], data["labels"])
+
+    def score_many(self, vectors) -> np.ndarray:
+        """(queries x namespaces) best-centroid cosine similarity."""
+        queries = _normalize_rows(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+        similarities = queries @ self.centroids.T
+        scores = np.full((len(queries), len(self.namespaces)), -np.inf, dtype=np.float32)
+        for i in range(len(self.namespaces)):
+            scores[:, i] = similarities[:, self.labels == i].max(axis=1)
+        return scores
+
+    def scores(self, vector) -> Dict[str, float]:
+        """Namespace -> best-centroid cosine similarity for one query."""
+        return dict(zip(self.namespaces, self.score_many(vector)[0].tolist()))
+
+    def route(self, vector, top_n: int = 3, threshold: float = 0.0, always: tuple = ()) -> List[str]:
+        """
+        Namespaces to search for a query: the top_n scoring at least threshold.
+
+        The best namespace is always kept, as are the namespaces in `always`.
+
+        Returns:
+            Namespace names, best first
+        """
+        scores = self.score_many(vector)[0]
+        order = np.argsort(-scores, kind="stable")
+        chosen = [self.namespaces[i] for i in order[:top_n] if scores[i] >= threshold]
+        if not chosen:
+            chosen = [self.namespaces[order[0]]]
+        chosen += [ns for ns in always if ns in self.namespaces and ns not in chosen]
+        return chosen
+
+
+# ============================================================================
+# BUILD FROM PINECONE
+# ============================================================================
+
+def fetch_namespace_vectors(pinecone_index, namespace: str, max_vectors: int = 5000,
+                            batch_size: int = 100, seed: int = 0) -> np.ndarray:
+    """
+    Fetch the vectors of up to max_vectors chunks of a namespace from Pinecone.
+
+    Every id is listed first and a uniform sample of them is fetched, so the
+    centroids cover the whole namespace rather than the chunks that come
+    first in list order. The fixed seed makes rebuilds reproducible.
+    """
+    ids = [vector_id for page in pinecone_index.list(namespace=namespace) for vector_id in page]
+    if len(ids) > max_vectors:
+        ids = random.Random(seed).sample(ids, max_vectors)
+
+    vectors = []
+    for start in range(0, len(ids), batch_size):
+        response = pinecone_index.fetch(ids=ids[start:start + batch_size], namespace=namespace)
+        vectors.extend(vector.values for vector in response.vectors.values() if vector.values)
+    return np.array(vectors, dtype=np.float32)
+
+
+# ============================================================================
+# OFFLINE EVALUATION
+# ============================================================================
+
+def evaluate(
+    router: NamespaceRouter,
+    embeddings: np.ndarray,
+    fan_out_results: List[List[tuple]],
+    top_n: int = 3,
+    threshold: float = 0.0
+) -> dict:
+    """
+    Compare routing with full fan-out retrieval.
+
+    Args:
+        router: Router under test
+        embeddings: (questions x dim) question embeddings
+        fan_out_results: Per question, the merged top-k of a search across
+            every namespace, as (namespace, score) pairs best first
+        top_n, threshold: Routing parameters
+
+    Returns:
+        recall: share of fan-out top-k chunks that come from routed namespaces
+        top1_accuracy: share of questions whose best fan-out chunk is routed
+        full_recall_rate: share of questions losing no fan-out top-k chunk
+        mean_namespaces: average namespaces searched per question
+    """
+    kept = total = top1 = complete = searched = 0
+    for vector, results in zip(embeddings, fan_out_results):
+        routed = set(router.route(vector, top_n, threshold))
+        searched += len(routed)
+        hits = sum(ns in routed for ns, _ in results)
+        kept += hits
+        total += len(results)
+        top1 += bool(results) and results[0][0] in routed
+        complete += hits == len(results)
+
+    questions = max(len(fan_out_results), 1)
+    return {
+        "questions": len(fan_out_results),
+        "recall": round(kept / max(total, 1), 4),
+        "top1_accuracy": round(top1 / questions, 4),
+        "full_recall_rate": round(complete / questions, 4),
+        "mean_namespaces": round(searched / questions, 2),
+    }
+
+
+def evaluate_grid(router: NamespaceRouter, embeddings: np.ndarray, fan_out_results: list,
+                  top_ns=(1, 2, 3, 4), thresholds=(0.0,)) -> List[dict]:
+    """evaluate() for every (top_n, threshold) pair."""
+    return [
+        {"top_n": top_n, "threshold": threshold,
+         **evaluate(router, embeddings, fan_out_results, top_n, threshold)}
+        for top_n in top_ns for threshold in thresholds
+    ]
+
+
+def fan_out(search: Callable, namespaces: List[str], top_k: int) -> List[tuple]:
+    """Merged top_k (namespace, score) of search(namespace) over every namespace."""
+    results = [(ns, score) for ns in namespaces for score in search(ns)]
+    return sorted(results, key=lambda r: r[1], reverse=True)[:top_k]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding-centroid namespace router")
+    parser.add_argument("command", choices=["build", "evaluate"])
+    parser.add_argument("--path", default=NAMESPACE_ROUTER_PATH, help="Centroid file")
+    parser.add_argument("--centroids", type=int, default=8, help="Centroids per namespace")
+    parser.add_argument("--sample", type=int, default=5000, help="Vectors sampled per namespace")
+    parser.add_argument("--questions", help="Evaluation questions, one per line")
+    parser.add_argument("--top-k", type=int, default=10, help="Fan-out results compared")
+    args = parser.parse_args()
+
+    import rag_llamaindex as rag
+    from llama_index.core.schema import QueryBundle
+
+    if args.command == "build":
+        pinecone_index = rag.get_pinecone_index()
+        vectors = {}
+        for namespace in rag.ACTIVE_NAMESPACES:
+            vectors[namespace] = fetch_namespace_vectors(pinecone_index, namespace, args.sample)
+            print(f"  {namespace}: {len(vectors[namespace])} vectors")
+        router = NamespaceRouter.build(vectors, args.centroids)
+        router.save(args.path)
+        print(f"Saved {len(router.centroids)} centroids to {args.path}")
+
+    else:
+        router = NamespaceRouter.load(args.path)
+        if router is None:
+            raise SystemExit(f"No centroids at '{args.path}' - run the build command first")
+        if not args.questions:
+            raise SystemExit("--questions is required for evaluate")
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+        embedded = rag.embed_queries(questions)
+        embeddings = np.array([embedded[q] for q in questions], dtype=np.float32)
+        fan_out_results = []
+        for question in questions:
+            bundle = QueryBundle(query_str=question, embedding=embedded[question])
+            fan_out_results.append(fan_out(
+                lambda ns: [n.score for n in rag.get_retriever(ns, args.top_k).retrieve(bundle)],
+                rag.ACTIVE_NAMESPACES, args.top_k
+            ))
+        print(json.dumps(evaluate_grid(router, embeddings, fan_out_results,
+                                       thresholds=(0.0, 0.2, 0.3)), indent=2))
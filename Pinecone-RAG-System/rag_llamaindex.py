@@ -4,15 +4,28 @@
 # Production-grade RAG for AI/ML technical books
 
 import os
+import time
+import threading
 import cohere
+import numpy as np
 from dotenv import load_dotenv
 from pinecone import Pinecone
 from llama_index.core import VectorStoreIndex, Settings
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
 from llama_index.vector_stores.pinecone import PineconeVectorStore
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.llms.openai import OpenAI
-from rank_bm25 import BM25Okapi
 from collections import defaultdict
+from functools import wraps
+from contextlib import nullcontext
+from cache import EmbeddingCache, SemanticAnswerCache, TTLCache, hash_key, normalize_text
+from sparse_index import SparseIndex, SPARSE_INDEX_DIR, bm25_score_matrix
+from tracing import Trace
+from namespace_router import NamespaceRouter, NAMESPACE_ROUTER_PATH
+from local_vector_store import LocalVectorStore, LOCAL_VECTOR_STORE_DIR
+from context_packer import pack_context, CONTEXT_TOKEN_BUDGET
+from local_reranker import mmr_rerank, MMR_PREFILTER_CANDIDATES
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 
 # Import Knowledge Graph for concept-based query expansion
 try:
@@ -34,6 +47,11 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "azure")
 
+# Vector store behind the retrievers: "pinecone", or "local" for the
+# memory-mapped store exported with `python local_vector_store.py export`
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone")
+VECTOR_STORE_BACKENDS = ("pinecone", "local")
+
 # Available namespaces
 NAMESPACES = {
     "aws": "AWS & Cloud books",
@@ -45,42 +63,245 @@ NAMESPACES = {
     "all": "Search all books"
 }
 
+# Namespaces searched by an "all" query - skip "" (legacy/default)
+ACTIVE_NAMESPACES = ["aws", "llm", "mlops", "ml", "arch", "python"]
+
+# Concurrent retrieval: the shared pool size is the global cap on in-flight
+# Pinecone retrievals across all requests
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "16"))
+NAMESPACE_TIMEOUT_SECONDS = float(os.getenv("NAMESPACE_TIMEOUT_SECONDS", "8"))
+
+# Pre-retrieval stages (graph expansion, multi-query, HyDE) run concurrently
+STAGE_MAX_WORKERS = int(os.getenv("STAGE_MAX_WORKERS", "8"))
+
+# Batch queries (query_books_batch): questions per batch, questions in
+# flight at once across all batches, and concurrent rerank calls per batch
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_RERANK_CONCURRENCY = int(os.getenv("BATCH_RERANK_CONCURRENCY", "4"))
+
+# Query embedding cache (in-memory LRU + persistent SQLite file, "" = memory only)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "200000"))
+EMBEDDING_CACHE_MAX_AGE_DAYS = float(os.getenv("EMBEDDING_CACHE_MAX_AGE_DAYS", "30"))
+
+# Memoization of the pre-retrieval LLM stages (rewrite, multi-query, HyDE)
+LLM_STAGE_CACHE_SIZE = int(os.getenv("LLM_STAGE_CACHE_SIZE", "2000"))
+LLM_STAGE_CACHE_TTL_SECONDS = float(os.getenv("LLM_STAGE_CACHE_TTL_SECONDS", "3600"))
+
+# Semantic answer cache (serves answers to paraphrased questions)
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+
+# Embedding-centroid namespace routing for "all" queries (needs the centroid
+# file from `python namespace_router.py build`; without it all namespaces are searched)
+ROUTER_TOP_N = int(os.getenv("ROUTER_TOP_N", "3"))
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.2"))
+
+# Cohere rerank model, per-(query, chunk) relevance score cache, and the
+# deadline after which a request falls back to the local MMR rerank
+RERANK_MODEL = "rerank-v3.5"
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+RERANK_CACHE_TTL_SECONDS = float(os.getenv("RERANK_CACHE_TTL_SECONDS", "86400"))
+RERANK_TIMEOUT_SECONDS = float(os.getenv("RERANK_TIMEOUT_SECONDS", "3"))
+
 # ============================================================================
 # SETUP
 # ============================================================================
 
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+if OPENAI_API_KEY:
+    os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+
+# Pinecone, OpenAI and Cohere clients are created on first use (or by
+# warmup()), so importing this module needs neither network access nor keys.
+# Assigning pinecone_index, co or Settings.embed_model/llm before first use
+# overrides the defaults.
+pc = None
+pinecone_index = None
+co = None
+_cohere_checked = False
+_models_configured = False
+_clients_lock = threading.Lock()
+
+
+def get_pinecone_index():
+    """Lazily create the Pinecone client and index handle (thread-safe)."""
+    global pc, pinecone_index
+    if pinecone_index is None:
+        with _clients_lock:
+            if pinecone_index is None:
+                if not PINECONE_API_KEY:
+                    raise RuntimeError("PINECONE_API_KEY is not set")
+                pc = Pinecone(api_key=PINECONE_API_KEY)
+                pinecone_index = pc.Index(INDEX_NAME)
+    return pinecone_index
+
+
+def get_cohere_client():
+    """Lazily create the Cohere client for reranking (None if no key is configured)."""
+    global co, _cohere_checked
+    if co is None and not _cohere_checked:
+        with _clients_lock:
+            if co is None and not _cohere_checked:
+                if COHERE_API_KEY and COHERE_API_KEY != "YOUR_COHERE_API_KEY":
+                    co = cohere.Client(COHERE_API_KEY, timeout=RERANK_TIMEOUT_SECONDS)
+                _cohere_checked = True
+    return co
+
+
+def configure_models():
+    """Configure the LlamaIndex embedding model and LLM once (thread-safe)."""
+    global _models_configured
+    if not _models_configured:
+        with _clients_lock:
+            if not _models_configured:
+                # Checking the private fields avoids LlamaIndex resolving its
+                # own default models; models already set on Settings are kept
+                if Settings._embed_model is None:
+                    Settings.embed_model = OpenAIEmbedding(
+                        model="text-embedding-3-large",
+                        dimensions=1024
+                    )
+                if Settings._llm is None:
+                    Settings.llm = OpenAI(
+                        model="gpt-4o-mini",
+                        temperature=0.7,
+                        max_tokens=500
+                    )
+                _models_configured = True
+
+
+def get_embed_model():
+    """The configured embedding model."""
+    configure_models()
+    return Settings.embed_model
+
+
+def get_llm():
+    """The configured LLM."""
+    configure_models()
+    return Settings.llm
+
+
+# Shared, bounded thread pool for Pinecone retrievals (I/O bound)
+retrieval_pool = ThreadPoolExecutor(
+    max_workers=RETRIEVAL_MAX_WORKERS,
+    thread_name_prefix="rag-retrieval"
+)
 
-# Initialize Pinecone
-pc = Pinecone(api_key=PINECONE_API_KEY)
-pinecone_index = pc.Index(INDEX_NAME)
+# Embedding cache shared by all requests (see embed_queries)
+embedding_cache = EmbeddingCache(
+    path=EMBEDDING_CACHE_PATH or None,
+    memory_size=EMBEDDING_CACHE_SIZE,
+    max_rows=EMBEDDING_CACHE_MAX_ROWS,
+    max_age=EMBEDDING_CACHE_MAX_AGE_DAYS * 24 * 3600
+)
 
-# Configure LlamaIndex
-Settings.embed_model = OpenAIEmbedding(
-    model="text-embedding-3-large",
-    dimensions=1024
+# Memoized pre-retrieval LLM stage results (see memoize_llm_stage)
+llm_stage_cache = TTLCache(max_size=LLM_STAGE_CACHE_SIZE, ttl=LLM_STAGE_CACHE_TTL_SECONDS)
+
+# Answers keyed by question embedding, matched above ANSWER_CACHE_THRESHOLD
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD,
+    max_size=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL_SECONDS
 )
 
-Settings.llm = OpenAI(
-    model="gpt-4o-mini",
-    temperature=0.7,
-    max_tokens=500
+# Cohere relevance scores keyed by (model, normalized query, chunk fingerprint)
+rerank_cache = TTLCache(max_size=RERANK_CACHE_SIZE, ttl=RERANK_CACHE_TTL_SECONDS)
+
+# Corpus-wide BM25 index (kept current by `python ingest.py`, loaded at startup).
+# When missing, hybrid search falls back to BM25 over the vector candidates.
+corpus_bm25_index = SparseIndex.load(SPARSE_INDEX_DIR)
+if corpus_bm25_index is None:
+    print(f"Note: No corpus BM25 index at '{SPARSE_INDEX_DIR}', using candidate-only BM25")
+
+# Namespace centroids for routing "all" queries (None = full fan-out)
+namespace_router = NamespaceRouter.load(NAMESPACE_ROUTER_PATH)
+
+# Separate pool for the LLM/graph stages so they never queue behind retrievals
+stage_pool = ThreadPoolExecutor(
+    max_workers=STAGE_MAX_WORKERS,
+    thread_name_prefix="rag-stage"
+)
+
+# Cohere rerank calls, awaited for at most RERANK_TIMEOUT_SECONDS; a call
+# that answers late still fills the rerank cache
+rerank_pool = ThreadPoolExecutor(
+    max_workers=STAGE_MAX_WORKERS,
+    thread_name_prefix="rag-rerank"
 )
 
-# Initialize Cohere client for reranking
-co = cohere.Client(COHERE_API_KEY) if COHERE_API_KEY != "YOUR_COHERE_API_KEY" else None
+# Questions of query_books_batch calls, each running one full pipeline
+batch_pool = ThreadPoolExecutor(
+    max_workers=BATCH_MAX_CONCURRENCY,
+    thread_name_prefix="rag-batch"
+)
 
 # Initialize Knowledge Graph (lazy loading)
 _concept_graph = None
+_concept_graph_lock = threading.Lock()
 
 def get_concept_graph():
-    """Lazy-load the concept graph."""
+    """Lazy-load the concept graph (thread-safe)."""
     global _concept_graph
     if _concept_graph is None and GRAPH_AVAILABLE:
-        _concept_graph = ConceptGraph()
+        with _concept_graph_lock:
+            if _concept_graph is None:
+                _concept_graph = ConceptGraph()
     return _concept_graph
 
 
+# ============================================================================
+# LLM STAGE MEMOIZATION
+# ============================================================================
+
+# Bump a stage's version whenever its prompt template changes so that
+# memoized results from the old prompt are no longer served
+PROMPT_VERSIONS = {
+    "rewrite": 1,
+    "multi_query": 1,
+    "hyde": 1
+}
+
+
+def memoize_llm_stage(stage: str):
+    """
+    Memoize a pre-retrieval LLM stage in llm_stage_cache.
+
+    The key is (stage, prompt version, model, temperature, normalized question,
+    extra args). The returned dict carries "from_cache" so callers can report
+    whether the stage hit the cache. Results from failed LLM calls (marked
+    with "error") are not cached.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(query: str, *args, **kwargs):
+            llm = get_llm()
+            key = (
+                stage,
+                PROMPT_VERSIONS[stage],
+                getattr(llm, "model", type(llm).__name__),
+                getattr(llm, "temperature", None),
+                normalize_text(query),
+                args,
+                tuple(sorted(kwargs.items()))
+            )
+
+            cached = llm_stage_cache.get(key)
+            if cached is not None:
+                return {**cached, "from_cache": True}
+
+            result = func(query, *args, **kwargs)
+            if "error" not in result:
+                llm_stage_cache.set(key, result)
+            return {**result, "from_cache": False}
+        return wrapper
+    return decorator
+
+
 # ============================================================================
 # GRAPH-ENHANCED QUERY EXPANSION
 # ============================================================================
@@ -118,6 +339,7 @@ def expand_query_with_graph(query: str) -> dict:
 # MULTI-QUERY REWRITING (Generate multiple query variations)
 # ============================================================================
 
+@memoize_llm_stage("multi_query")
 def generate_multi_queries(query: str, num_queries: int = 4) -> dict:
     """
     Generate multiple query variations to improve retrieval coverage.
@@ -153,7 +375,7 @@ Original query: {query}
 Generate {num_queries} search variations:"""
 
     try:
-        response = Settings.llm.complete(multi_query_prompt)
+        response = get_llm().complete(multi_query_prompt)
         response_text = str(response).strip()
 
         # Parse numbered queries from response
@@ -182,9 +404,10 @@ Generate {num_queries} search variations:"""
         }
     except Exception as e:
         print(f"Multi-query generation failed: {e}")
-        return {"original": query, "queries": [query], "num_variations": 1}
+        return {"original": query, "queries": [query], "num_variations": 1, "error": str(e)}
 
 
+@memoize_llm_stage("rewrite")
 def rewrite_query(query: str) -> dict:
     """
     Use LLM to expand vague queries into more specific search terms.
@@ -222,7 +445,7 @@ Original query: {query}
 Rewritten query:"""
 
     try:
-        response = Settings.llm.complete(rewrite_prompt)
+        response = get_llm().complete(rewrite_prompt)
         rewritten = str(response).strip()
 
         # Validate the rewrite isn't too different or too long
@@ -236,13 +459,14 @@ Rewritten query:"""
         }
     except Exception as e:
         print(f"Query rewriting failed: {e}")
-        return {"original": query, "rewritten": query, "was_rewritten": False}
+        return {"original": query, "rewritten": query, "was_rewritten": False, "error": str(e)}
 
 
 # ============================================================================
 # HyDE (Hypothetical Document Embeddings)
 # ============================================================================
 
+@memoize_llm_stage("hyde")
 def generate_hypothetical_document(query: str) -> dict:
     """
     Generate a hypothetical document that would answer the query.
@@ -271,7 +495,7 @@ Question: {query}
 Write a hypothetical book passage that answers this:"""
 
     try:
-        response = Settings.llm.complete(hyde_prompt)
+        response = get_llm().complete(hyde_prompt)
         hypothetical_doc = str(response).strip()
 
         # Validate the response
@@ -285,7 +509,7 @@ Write a hypothetical book passage that answers this:"""
         }
     except Exception as e:
         print(f"HyDE generation failed: {e}")
-        return {"original": query, "hypothetical_doc": query, "hyde_used": False}
+        return {"original": query, "hypothetical_doc": query, "hyde_used": False, "error": str(e)}
 
 
 # ============================================================================
@@ -336,10 +560,32 @@ def detect_namespace_relevance(query: str) -> dict:
     return scores
 
 
+def route_namespaces(query: str, query_embedding=None) -> list:
+    """
+    Namespaces an "all" query should search.
+
+    With centroids loaded, the top ROUTER_TOP_N namespaces by embedding
+    similarity (at least ROUTER_THRESHOLD), plus any namespace with a full
+    keyword match. Otherwise, or without an embedding, every active namespace.
+    """
+    if namespace_router is None or query_embedding is None:
+        return list(ACTIVE_NAMESPACES)
+
+    keyword_matches = tuple(ns for ns, rel in detect_namespace_relevance(query).items() if rel >= 1.0)
+    routed = namespace_router.route(query_embedding, ROUTER_TOP_N, ROUTER_THRESHOLD, keyword_matches)
+    # Namespace order keeps the merge deterministic
+    return [ns for ns in ACTIVE_NAMESPACES if ns in routed]
+
+
 # ============================================================================
 # HYBRID SEARCH (BM25 + Vector)
 # ============================================================================
 
+def chunk_id(node) -> str:
+    """Stable identity of a retrieved chunk (Pinecone vector id, else a text hash)."""
+    return node.node.node_id or hash_key(node.text)
+
+
 def bm25_search(query: str, nodes: list, top_k: int = 10) -> list:
     """
     Perform BM25 keyword search on retrieved nodes.
@@ -357,24 +603,129 @@ def bm25_search(query: str, nodes: list, top_k: int = 10) -> list:
     Returns:
         List of (node, bm25_score) tuples sorted by score
     """
+    return bm25_search_many([query], nodes, top_k=top_k)[0]
+
+
+def bm25_search_many(queries: list, nodes: list, top_k: int = 10) -> list:
+    """
+    BM25 search of several queries against the same nodes in one pass.
+
+    Scores match rank_bm25.BM25Okapi built over `nodes`, but are computed as
+    one NumPy matrix product, and each chunk's term frequencies are cached by
+    chunk id so repeated candidates are never re-tokenized.
+
+    Args:
+        queries: Search queries
+        nodes: List of nodes to search within
+        top_k: Number of top results to return per query
+
+    Returns:
+        One list of (node, bm25_score) tuples per query, sorted by score
+    """
     if not nodes:
-        return []
+        return [[] for _ in queries]
 
-    # Tokenize documents and query
-    tokenized_docs = [node.text.lower().split() for node in nodes]
-    tokenized_query = query.lower().split()
+    scores = bm25_score_matrix(
+        queries,
+        [chunk_id(node) for node in nodes],
+        [node.text for node in nodes]
+    )
+
+    results = []
+    for row in scores:
+        # Pair nodes with scores and sort
+        scored_nodes = [(nodes[i], row[i]) for i in range(len(nodes))]
+        scored_nodes.sort(key=lambda x: x[1], reverse=True)
+        results.append(scored_nodes[:top_k])
+    return results
 
-    # Create BM25 index
-    bm25 = BM25Okapi(tokenized_docs)
 
-    # Get scores for each document
-    scores = bm25.get_scores(tokenized_query)
+def corpus_bm25_search(query: str, namespaces: list, top_k: int = 10) -> list:
+    """
+    Perform BM25 keyword search over the whole corpus (not just vector hits).
 
-    # Pair nodes with scores and sort
-    scored_nodes = [(nodes[i], scores[i]) for i in range(len(nodes))]
-    scored_nodes.sort(key=lambda x: x[1], reverse=True)
+    Uses the persistent sparse index, so chunks that vector search missed
+    entirely can still enter the hybrid merge.
 
-    return scored_nodes[:top_k]
+    Args:
+        query: Search query
+        namespaces: Namespaces to search (the ones the vector search used)
+        top_k: Number of top results to return
+
+    Returns:
+        List of (node, bm25_score) tuples sorted by score
+    """
+    results = []
+    for doc in corpus_bm25_index.search(query, namespaces, top_k=top_k):
+        node = TextNode(id_=doc["id"], text=doc["text"], metadata=doc["metadata"])
+        results.append((NodeWithScore(node=node, score=doc["score"]), doc["score"]))
+    return results
+
+
+class CandidatePool:
+    """
+    Retrieval candidates indexed by stable chunk id, fused with weighted RRF.
+
+    Every ranked list (one per variation x namespace vector search, plus one
+    BM25 list per variation) is stored as an array of pool rows. fuse() fills
+    a (lists x candidates) rank matrix and computes weighted Reciprocal Rank
+    Fusion for all lists in one vectorized pass:
+
+        RRF(d) = sum_i weight_i / (k + rank_i(d))
+
+    Candidates are deduplicated by chunk id, and the retrieved NodeWithScore
+    objects are never mutated - ranked() returns fresh wrappers.
+    """
+
+    def __init__(self, k: int = 60):
+        """
+        Args:
+            k: RRF constant (standard value 60)
+        """
+        self.k = k
+        self._rows = {}     # chunk id -> row
+        self.nodes = []     # row -> first NodeWithScore seen for the chunk
+        self._lists = []    # ranked lists as row arrays
+        self._weights = []  # weight per list
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add_list(self, nodes: list, weight: float = 1.0):
+        """Add a ranked list of nodes (best first) with its fusion weight."""
+        rows = []
+        for node in nodes:
+            key = chunk_id(node)
+            row = self._rows.get(key)
+            if row is None:
+                row = len(self.nodes)
+                self._rows[key] = row
+                self.nodes.append(node)
+            rows.append(row)
+
+        if rows:
+            # A chunk listed twice keeps its best (first) rank
+            _, first = np.unique(np.asarray(rows), return_index=True)
+            self._lists.append(np.asarray(rows)[np.sort(first)])
+            self._weights.append(weight)
+
+    def fuse(self) -> np.ndarray:
+        """Weighted RRF score of every candidate across all lists."""
+        if not self._lists:
+            return np.zeros(len(self.nodes))
+
+        ranks = np.full((len(self._lists), len(self.nodes)), np.inf)
+        for i, rows in enumerate(self._lists):
+            ranks[i, rows] = np.arange(1, rows.size + 1)
+
+        weights = np.asarray(self._weights)[:, None]
+        return (weights / (self.k + ranks)).sum(axis=0)
+
+    def ranked(self, top_n: int = None) -> list:
+        """Candidates sorted by fused score, as fresh NodeWithScore objects."""
+        scores = self.fuse()
+        order = np.argsort(-scores, kind="stable")[:top_n]
+        return [NodeWithScore(node=self.nodes[i].node, score=float(scores[i])) for i in order]
 
 
 def hybrid_merge(vector_nodes: list, bm25_results: list, alpha: float = 0.7) -> list:
@@ -390,38 +741,12 @@ def hybrid_merge(vector_nodes: list, bm25_results: list, alpha: float = 0.7) ->
         alpha: Weight for vector search (1-alpha for BM25). Default 0.7 favors vectors.
 
     Returns:
-        Merged and deduplicated list of nodes with combined scores
+        Merged and deduplicated (by chunk id) list of nodes with combined scores
     """
-    k = 60  # RRF constant (standard value)
-
-    # Build score map using node text as key (for deduplication)
-    rrf_scores = defaultdict(float)
-    node_map = {}
-
-    # Score vector results
-    for rank, node in enumerate(vector_nodes):
-        key = node.text[:100]  # Use text prefix as unique key
-        rrf_scores[key] += alpha * (1 / (k + rank + 1))
-        node_map[key] = node
-
-    # Score BM25 results
-    for rank, (node, bm25_score) in enumerate(bm25_results):
-        key = node.text[:100]
-        rrf_scores[key] += (1 - alpha) * (1 / (k + rank + 1))
-        if key not in node_map:
-            node_map[key] = node
-
-    # Sort by combined RRF score
-    sorted_keys = sorted(rrf_scores.keys(), key=lambda x: rrf_scores[x], reverse=True)
-
-    # Build result list with updated scores
-    merged_nodes = []
-    for key in sorted_keys:
-        node = node_map[key]
-        node.score = rrf_scores[key]
-        merged_nodes.append(node)
-
-    return merged_nodes
+    pool = CandidatePool()
+    pool.add_list(vector_nodes, weight=alpha)
+    pool.add_list([node for node, _ in bm25_results], weight=1 - alpha)
+    return pool.ranked()
 
 
 # ============================================================================
@@ -429,66 +754,477 @@ def hybrid_merge(vector_nodes: list, bm25_results: list, alpha: float = 0.7) ->
 # ============================================================================
 
 def rerank_results(query: str, nodes: list, top_n: int = 5) -> list:
+    """Reranked nodes from rerank_nodes (Cohere, or the local MMR fallback)."""
+    return rerank_nodes(query, nodes, top_n)[0]
+
+
+def rerank_nodes(query: str, nodes: list, top_n: int = 5) -> tuple:
     """
     Rerank retrieved nodes using Cohere's reranker for better relevance
 
+    Relevance scores are cached per (normalized query, chunk fingerprint),
+    where the fingerprint hashes the chunk id together with its text. Chunks
+    already scored for this query reuse the cached score; only unseen chunks
+    are sent to Cohere, and the two sets are merged by score.
+
+    Without a Cohere client, or if the call fails or takes longer than
+    RERANK_TIMEOUT_SECONDS, the nodes are reranked locally instead (see
+    local_rerank).
+
     Args:
         query: The user's question
         nodes: List of retrieved nodes from vector search
         top_n: Number of results to return after reranking
 
     Returns:
-        Reranked list of nodes
+        (reranked list of nodes, reranker that ran: "cohere" or "mmr")
     """
-    if not co or not nodes:
-        return nodes[:top_n]
+    co = get_cohere_client()
+    if not co:
+        return local_rerank(query, nodes, top_n), "mmr"
+    if not nodes:
+        return nodes, "cohere"
 
-    # Extract text from nodes for reranking
-    documents = [node.text for node in nodes]
+    key_prefix = (RERANK_MODEL, normalize_text(query))
+    fingerprints = [hash_key(chunk_id(node), node.text) for node in nodes]
+    scores = [rerank_cache.get(key_prefix + (fp,)) for fp in fingerprints]
+    unseen = [i for i, score in enumerate(scores) if score is None]
 
-    try:
-        # Use Cohere rerank
+    def score_unseen() -> dict:
+        # Ask for every score (top_n=len) so they can be merged with the cache.
         rerank_response = co.rerank(
-            model="rerank-v3.5",
+            model=RERANK_MODEL,
             query=query,
-            documents=documents,
-            top_n=top_n
+            documents=[nodes[i].text for i in unseen],
+            top_n=len(unseen)
         )
+        new_scores = {}
+        for result in rerank_response.results:
+            i = unseen[result.index]
+            new_scores[i] = result.relevance_score
+            rerank_cache.set(key_prefix + (fingerprints[i],), result.relevance_score)
+        return new_scores
+
+    try:
+        if unseen:
+            # Use Cohere rerank on the chunks not scored for this query yet
+            new_scores = rerank_pool.submit(score_unseen).result(timeout=RERANK_TIMEOUT_SECONDS)
+            for i, score in new_scores.items():
+                scores[i] = score
+
+        if len(unseen) < len(nodes):
+            print(f"  Rerank cache: reused {len(nodes) - len(unseen)}/{len(nodes)} scores")
 
         # Reorder nodes based on rerank scores
+        ranked = sorted(
+            (i for i, score in enumerate(scores) if score is not None),
+            key=lambda i: scores[i],
+            reverse=True
+        )
         reranked_nodes = []
-        for result in rerank_response.results:
-            node = nodes[result.index]
+        for i in ranked[:top_n]:
+            node = nodes[i]
             # Update score with rerank relevance score
-            node.score = result.relevance_score
+            node.score = scores[i]
             reranked_nodes.append(node)
 
-        return reranked_nodes
+        return reranked_nodes, "cohere"
+
+    except FutureTimeoutError:
+        print(f"Reranking took over {RERANK_TIMEOUT_SECONDS}s, using local MMR rerank")
+        return local_rerank(query, nodes, top_n), "mmr"
+    except Exception as e:
+        print(f"Reranking failed: {e}, using local MMR rerank")
+        return local_rerank(query, nodes, top_n), "mmr"
+
+
+def local_rerank(query: str, nodes: list, top_n: int = 5) -> list:
+    """
+    Rerank nodes by Maximal Marginal Relevance over their vectors (no API call).
+
+    The vectors come back with the retrieval (Pinecone matches include their
+    values, the local store returns its rows). Chunks found only by the
+    corpus BM25 index have none and are not embedded here - this is the
+    no-API fallback - so they only fill slots MMR leaves over.
+
+    Args:
+        query: The user's question (its embedding is normally cached already)
+        nodes: List of retrieved nodes
+        top_n: Number of results to return
+
+    Returns:
+        Up to top_n nodes, scored with their cosine relevance to the question
+    """
+    return mmr_rerank(embed_queries([query]).get(query), nodes, top_n)
+
+
+# ============================================================================
+# BATCHED QUERY EMBEDDING
+# ============================================================================
+
+def embed_queries(queries: list) -> dict:
+    """
+    Embed all distinct queries with a single batched embedding call.
+
+    The vectors are passed to every namespace retrieval via QueryBundle, so a
+    query is embedded once per request instead of once per namespace.
+    (text-embedding-3 uses the same model for queries and documents, so the
+    batch text endpoint gives the same vectors as per-query embedding.)
+
+    Queries already in the embedding cache are not sent to the API; only the
+    misses are embedded, then stored in the cache.
+
+    Args:
+        queries: Search queries (duplicates and empty strings are ignored)
+
+    Returns:
+        Dict of query -> embedding vector (missing entries if embedding failed)
+    """
+    distinct = list(dict.fromkeys(q for q in queries if q))
+    if not distinct:
+        return {}
+
+    embed_model = get_embed_model()
+    model_name = getattr(embed_model, "model_name", type(embed_model).__name__)
+    dimensions = getattr(embed_model, "dimensions", None)
+
+    embeddings = embedding_cache.get_many(model_name, dimensions, distinct)
+    misses = [q for q in distinct if q not in embeddings]
+    if not misses:
+        return embeddings
 
+    try:
+        new_embeddings = dict(zip(misses, embed_model.get_text_embedding_batch(misses)))
+        embedding_cache.put_many(model_name, dimensions, new_embeddings)
+        embeddings.update(new_embeddings)
     except Exception as e:
-        print(f"Reranking failed: {e}, using original order")
-        return nodes[:top_n]
+        # Retrievers fall back to embedding the query themselves
+        print(f"Batched query embedding failed: {e}")
+
+    return embeddings
 
 
 # ============================================================================
 # RAG FUNCTIONS
 # ============================================================================
 
-def get_retriever(namespace: str = None, top_k: int = 20):
-    """Create a retriever for a specific namespace or all"""
+# Long-lived per-namespace indexes and retrievers, shared by all requests.
+# Retrievers are keyed by (namespace, top_k) because similarity_top_k is fixed
+# at construction; the handful of top_k values in use keeps this small.
+_index_registry = {}
+_retriever_registry = {}
+_registry_config = None
+_registry_lock = threading.Lock()
 
-    vector_store = PineconeVectorStore(
-        pinecone_index=pinecone_index,
-        namespace=namespace  # None or "" searches default namespace
-    )
 
-    index = VectorStoreIndex.from_vector_store(vector_store)
+def _index_config() -> tuple:
+    """Fingerprint of the settings the cached indexes/retrievers are built from."""
+    if VECTOR_STORE_BACKEND == "local":
+        return (VECTOR_STORE_BACKEND, LOCAL_VECTOR_STORE_DIR, id(get_embed_model()))
+    return (INDEX_NAME, id(get_pinecone_index()), id(get_embed_model()))
+
+
+def invalidate_retrievers():
+    """Drop all cached indexes and retrievers (rebuilt on next use)."""
+    global _registry_config
+    with _registry_lock:
+        _index_registry.clear()
+        _retriever_registry.clear()
+        _registry_config = None
+
+
+def make_vector_store(namespace: str = None, backend: str = None):
+    """
+    Vector store for one namespace on the configured (or given) backend.
+
+    Args:
+        namespace: Namespace to search (None or "" searches default namespace)
+        backend: "pinecone" or "local" (default: VECTOR_STORE_BACKEND)
+    """
+    backend = backend or VECTOR_STORE_BACKEND
+    if backend == "local":
+        return LocalVectorStore(namespace=namespace, store_dir=LOCAL_VECTOR_STORE_DIR)
+    if backend == "pinecone":
+        return PineconeVectorStore(
+            pinecone_index=get_pinecone_index(),
+            namespace=namespace  # None or "" searches default namespace
+        )
+    raise ValueError(f"Unknown vector store backend '{backend}' (expected one of {VECTOR_STORE_BACKENDS})")
+
+
+def build_retriever(namespace: str = None, top_k: int = 20, backend: str = None):
+    """Create a new (uncached) retriever for a specific namespace or all"""
+
+    vector_store = make_vector_store(namespace, backend)
+
+    index = VectorStoreIndex.from_vector_store(vector_store, embed_model=get_embed_model())
 
     # Return retriever instead of query engine (we'll rerank before synthesis)
     return index.as_retriever(similarity_top_k=top_k)
 
 
-def query_all_namespaces(query: str, top_k_per_ns: int = 15) -> list:
+def get_retriever(namespace: str = None, top_k: int = 20, backend: str = None):
+    """
+    Get a retriever for a specific namespace or all from the registry.
+
+    One index is built per (backend, namespace) and one retriever per
+    (backend, namespace, top_k), then reused across requests. Thread-safe;
+    the registry is rebuilt if the index name, Pinecone index handle or
+    embedding model changes.
+
+    Args:
+        namespace: Namespace to search (None or "" searches default namespace)
+        top_k: similarity_top_k for this call
+        backend: "pinecone" or "local" (default: VECTOR_STORE_BACKEND)
+
+    Returns:
+        Shared VectorIndexRetriever
+    """
+    global _registry_config
+    backend = backend or VECTOR_STORE_BACKEND
+    key = (backend, namespace, top_k)
+
+    retriever = _retriever_registry.get(key)
+    if retriever is not None and _registry_config == _index_config():
+        return retriever
+
+    with _registry_lock:
+        config = _index_config()
+        if _registry_config != config:
+            _index_registry.clear()
+            _retriever_registry.clear()
+            _registry_config = config
+
+        retriever = _retriever_registry.get(key)
+        if retriever is None:
+            index = _index_registry.get((backend, namespace))
+            if index is None:
+                vector_store = make_vector_store(namespace, backend)
+                index = VectorStoreIndex.from_vector_store(vector_store, embed_model=get_embed_model())
+                _index_registry[(backend, namespace)] = index
+
+            retriever = index.as_retriever(similarity_top_k=top_k)
+            _retriever_registry[key] = retriever
+
+        return retriever
+
+
+def retrieve_namespace(
+    query: str,
+    ns: str,
+    top_k_per_ns: int,
+    relevance_score: float,
+    query_embedding: list = None
+) -> list:
+    """
+    Retrieve from a single namespace and tag/boost the results.
+
+    Args:
+        query: Search query
+        ns: Namespace to search
+        top_k_per_ns: Base results to fetch from the namespace
+        relevance_score: Keyword relevance of the namespace (0-1)
+        query_embedding: Precomputed query vector (embedded on demand if None)
+
+    Returns:
+        List of nodes tagged with their namespace
+    """
+    # Fetch more from namespaces that seem relevant to query
+    # High relevance (>0.5): fetch 25 results, low relevance: fetch 10
+    adjusted_top_k = int(top_k_per_ns * (0.5 + relevance_score))
+
+    retriever = get_retriever(namespace=ns, top_k=adjusted_top_k)
+    nodes = retriever.retrieve(QueryBundle(query_str=query, embedding=query_embedding))
+
+    # Tag each node with its namespace and apply slight boost for detected namespaces
+    for node in nodes:
+        if 'namespace' not in node.metadata:
+            node.metadata['namespace'] = ns
+        # Small boost (5%) for nodes from detected relevant namespaces
+        # This helps but doesn't override reranker judgement
+        if relevance_score > 0 and node.score:
+            node.score = node.score * (1 + 0.05 * relevance_score)
+
+    return nodes
+
+
+class PooledRetrieval:
+    """
+    A retrieval on the shared retrieval pool whose timeout starts when it
+    starts running.
+
+    The pool is shared by every request, so under load a retrieval can wait
+    in its queue; that wait is not the namespace being slow and must not
+    count against NAMESPACE_TIMEOUT_SECONDS. Retrievals are never cancelled,
+    since a batch may share one between several questions.
+    """
+
+    def __init__(self, func, *args):
+        self.started_at = None
+        self._started = threading.Event()
+        self.future = retrieval_pool.submit(self._run, func, *args)
+        # Also wakes waiters if the pool drops the task without running it
+        self.future.add_done_callback(lambda _: self._started.set())
+
+    def _run(self, func, *args):
+        self.started_at = time.monotonic()
+        self._started.set()
+        return func(*args)
+
+    def result(self, timeout: float):
+        """The retrieval's nodes; FutureTimeoutError once it has run for `timeout` seconds."""
+        self._started.wait()
+        if self.started_at is None:
+            return self.future.result()
+        return self.future.result(timeout=max(0.0, self.started_at + timeout - time.monotonic()))
+
+
+class RetrievalScheduler:
+    """
+    Runs the (query variation x namespace) retrieval grid concurrently.
+
+    Every grid cell is submitted to the shared retrieval pool as soon as its
+    query is known, so the pool size (RETRIEVAL_MAX_WORKERS) is the global cap
+    on concurrent Pinecone calls. Results are gathered per query in namespace
+    order, which keeps the merge identical to the serial pipeline.
+
+    Queries submitted together are embedded in one batched call, and each
+    vector is reused for every namespace in the query's row. For "all", the
+    caller routes once from the original question (see route_namespaces) and
+    passes the namespaces in, so they don't depend on which query arrives
+    first.
+    Schedulers of one query_books_batch call share a BatchContext: their
+    embedding calls are combined, and a retrieval already submitted for
+    another question is reused, not repeated.
+
+    Usage:
+        scheduler = RetrievalScheduler("all", namespaces=route_namespaces(question, question_embedding))
+        scheduler.submit_many(search_queries)
+        nodes = scheduler.results(search_queries[0])
+    """
+
+    def __init__(
+        self,
+        namespace: str = "all",
+        fetch_count: int = 20,
+        top_k_per_ns: int = 15,
+        timeout: float = NAMESPACE_TIMEOUT_SECONDS,
+        trace: Trace = None,
+        batch: "BatchContext" = None,
+        namespaces: list = None
+    ):
+        """
+        Args:
+            namespace: Namespace to search ("all" fans out to `namespaces`)
+            fetch_count: Results to fetch for a single-namespace search
+            top_k_per_ns: Base results per namespace for an "all" search
+            timeout: Per-namespace timeout in seconds, from when the retrieval starts running
+            trace: Trace receiving "embed" and per-namespace "retrieve" spans
+            batch: Batch whose embedding calls and retrievals are shared (None = no batch)
+            namespaces: Namespaces an "all" search fans out to (None = ACTIVE_NAMESPACES)
+        """
+        self.namespace = namespace
+        self.fetch_count = fetch_count
+        self.top_k_per_ns = top_k_per_ns
+        self.timeout = timeout
+        self.trace = trace or Trace()
+        self.batch = batch
+        if namespace != "all":
+            self.namespaces = [namespace]
+        else:
+            self.namespaces = list(ACTIVE_NAMESPACES if namespaces is None else namespaces)
+        # query -> [(ns, relevance, PooledRetrieval), ...]
+        self._cells = {}
+
+    def _submit(self, key: tuple, func, *args):
+        """Submit a retrieval to the shared pool, or reuse the batch's identical one."""
+        if self.batch is not None:
+            return self.batch.retrieval(key, func, *args)
+        return PooledRetrieval(func, *args)
+
+    def submit(self, query: str):
+        """Schedule retrieval of a query across its namespaces (no-op if already scheduled)."""
+        self.submit_many([query])
+
+    def submit_many(self, queries: list):
+        """Embed the not-yet-scheduled queries in one batch and schedule their retrievals."""
+        new_queries = [q for q in dict.fromkeys(queries) if q not in self._cells]
+        if not new_queries:
+            return
+
+        with self.trace.span("embed", queries=len(new_queries)):
+            if self.batch is not None:
+                embeddings = self.batch.embed(new_queries)
+            else:
+                embeddings = embed_queries(new_queries)
+
+        for query in new_queries:
+            query_embedding = embeddings.get(query)
+            variation = len(self._cells)
+
+            if self.namespace == "all":
+                ns_relevance = detect_namespace_relevance(query)
+                cells = [
+                    (ns, ns_relevance.get(ns, 0.5), self._submit(
+                        ("all", ns, query, self.top_k_per_ns),
+                        self.trace.timed("retrieve", retrieve_namespace, namespace=ns, variation=variation),
+                        query, ns, self.top_k_per_ns, ns_relevance.get(ns, 0.5), query_embedding
+                    ))
+                    for ns in self.namespaces
+                ]
+            else:
+                query_bundle = QueryBundle(query_str=query, embedding=query_embedding)
+                retriever = get_retriever(namespace=self.namespace, top_k=self.fetch_count)
+                cells = [(self.namespace, 0.0, self._submit(
+                    (self.namespace, self.namespace, query, self.fetch_count),
+                    self.trace.timed("retrieve", retriever.retrieve, namespace=self.namespace, variation=variation),
+                    query_bundle
+                ))]
+
+            self._cells[query] = cells
+
+    def results_by_namespace(self, query: str) -> list:
+        """
+        Wait for a query's grid row and return it per namespace.
+
+        Nodes are returned as fresh NodeWithScore wrappers, so a query that
+        appears twice in the search list can be merged twice without the
+        score updates of one pass leaking into the other.
+
+        Returns:
+            List of (namespace, keyword relevance, nodes) in namespace order;
+            namespaces that failed or timed out are left out
+        """
+        self.submit(query)
+        row = []
+        for ns, relevance, retrieval in self._cells[query]:
+            try:
+                nodes = retrieval.result(self.timeout)
+                row.append((ns, relevance, [NodeWithScore(node=n.node, score=n.score) for n in nodes]))
+            except FutureTimeoutError:
+                print(f"  Warning: Namespace '{ns}' timed out after {self.timeout}s, skipping")
+            except Exception as e:
+                print(f"  Warning: Failed to query namespace '{ns}': {e}")
+        return row
+
+    def results(self, query: str) -> list:
+        """Wait for a query's grid row and return its nodes merged across namespaces."""
+        all_nodes = [node for _, _, nodes in self.results_by_namespace(query) for node in nodes]
+
+        if self.namespace == "all":
+            # Sort all nodes by their (potentially boosted) score before hybrid/rerank
+            all_nodes.sort(key=lambda x: x.score if x.score else 0, reverse=True)
+            print(f"  Retrieved {len(all_nodes)} total candidates")
+
+        return all_nodes
+
+
+def query_all_namespaces(
+    query: str,
+    top_k_per_ns: int = 15,
+    parallel: bool = True,
+    timeout: float = NAMESPACE_TIMEOUT_SECONDS
+) -> list:
     """
     Query ALL namespaces with smart prioritization.
     Pinecone doesn't support cross-namespace search, so we query each separately.
@@ -499,45 +1235,44 @@ def query_all_namespaces(query: str, top_k_per_ns: int = 15) -> list:
     3. Apply a small boost to scores from detected namespaces
     4. Let Cohere reranker make final relevance decisions
 
+    With parallel=True the namespaces are queried concurrently on the shared
+    retrieval pool. A namespace that has not answered within `timeout` seconds
+    of its retrieval starting (time queued behind other requests does not
+    count) is skipped, so one slow namespace cannot hold up
+    the whole request. Both paths search the namespaces picked by
+    route_namespaces and merge them in namespace order, so the final
+    ordering is the same.
+
     Args:
         query: Search query
         top_k_per_ns: Base results to fetch from each namespace (default 15)
+        parallel: Query namespaces concurrently (default True)
+        timeout: Per-namespace timeout in seconds for the parallel path
 
     Returns:
         Combined list of nodes from all namespaces, sorted by boosted score
     """
-    all_nodes = []
-    # ONLY use properly organized namespaces - skip "" (legacy/default)
-    active_namespaces = ["aws", "llm", "mlops", "ml", "arch", "python"]
-
     # Detect which namespaces are likely relevant
     ns_relevance = detect_namespace_relevance(query)
     detected = [ns for ns, score in ns_relevance.items() if score > 0]
 
     if detected:
         print(f"  Detected relevance: {', '.join(detected)}")
-    print(f"  Searching {len(active_namespaces)} namespaces...")
 
-    for ns in active_namespaces:
+    query_embedding = embed_queries([query]).get(query)
+    namespaces = route_namespaces(query, query_embedding)
+    print(f"  Searching {len(namespaces)} namespaces{' in parallel' if parallel else ''}...")
+
+    if parallel:
+        scheduler = RetrievalScheduler("all", top_k_per_ns=top_k_per_ns, timeout=timeout, namespaces=namespaces)
+        return scheduler.results(query)
+
+    all_nodes = []
+    for ns in namespaces:
         try:
-            # Fetch more from namespaces that seem relevant to query
-            relevance_score = ns_relevance.get(ns, 0.5)
-            # High relevance (>0.5): fetch 25 results, low relevance: fetch 10
-            adjusted_top_k = int(top_k_per_ns * (0.5 + relevance_score))
-
-            retriever = get_retriever(namespace=ns, top_k=adjusted_top_k)
-            nodes = retriever.retrieve(query)
-
-            # Tag each node with its namespace and apply slight boost for detected namespaces
-            for node in nodes:
-                if 'namespace' not in node.metadata:
-                    node.metadata['namespace'] = ns
-                # Small boost (5%) for nodes from detected relevant namespaces
-                # This helps but doesn't override reranker judgement
-                if relevance_score > 0 and node.score:
-                    node.score = node.score * (1 + 0.05 * relevance_score)
-
-            all_nodes.extend(nodes)
+            all_nodes.extend(
+                retrieve_namespace(query, ns, top_k_per_ns, ns_relevance.get(ns, 0.5), query_embedding)
+            )
         except Exception as e:
             print(f"  Warning: Failed to query namespace '{ns}': {e}")
 
@@ -548,7 +1283,195 @@ def query_all_namespaces(query: str, top_k_per_ns: int = 15) -> list:
     return all_nodes
 
 
-def query_books(
+# ============================================================================
+# PIPELINE PLANNING (latency budgets)
+# ============================================================================
+
+# Named profiles cap which stages may run. A stage runs only if its use_*
+# flag is on and the profile allows it.
+PIPELINE_PROFILES = {
+    "fast": {
+        "graph": False, "multi_query_variations": 0, "hyde": False,
+        "rewrite": False, "hybrid": True, "rerank": True, "rerank_candidates": 20
+    },
+    "balanced": {
+        "graph": True, "multi_query_variations": 2, "hyde": False,
+        "rewrite": True, "hybrid": True, "rerank": True, "rerank_candidates": 30
+    },
+    "thorough": {
+        "graph": True, "multi_query_variations": 4, "hyde": True,
+        "rewrite": True, "hybrid": True, "rerank": True, "rerank_candidates": 50
+    },
+}
+
+# Starting per-stage latency estimates (ms), replaced by a moving average of
+# the stage spans of real requests as they complete
+STAGE_LATENCY_PRIORS_MS = {
+    "graph": 5, "multi_query": 1200, "hyde": 1800, "rewrite": 800,
+    "retrieve": 350, "bm25": 15, "rerank": 350, "generate": 3000
+}
+
+
+class StageLatencyModel:
+    """Exponential moving average of each stage's latency, fed from request traces."""
+
+    def __init__(self, priors: dict, alpha: float = 0.2):
+        self.alpha = alpha
+        self._estimates = dict(priors)
+        self._lock = threading.Lock()
+
+    def observe(self, timings: dict):
+        """Update the estimates from a Trace.summary()."""
+        durations = {}
+        for span in timings["spans"]:
+            # Parallel spans of one stage (e.g. namespace retrievals) count by the slowest
+            durations[span["name"]] = max(durations.get(span["name"], 0), span["duration_ms"])
+        with self._lock:
+            for stage, ms in durations.items():
+                if stage in self._estimates:
+                    self._estimates[stage] += self.alpha * (ms - self._estimates[stage])
+
+    def estimate(self, stage: str) -> float:
+        return self._estimates[stage]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {stage: round(ms, 1) for stage, ms in self._estimates.items()}
+
+
+stage_latency = StageLatencyModel(STAGE_LATENCY_PRIORS_MS)
+
+
+def estimate_plan_ms(plan: dict) -> float:
+    """Critical-path latency estimate of a plan."""
+    est = stage_latency.estimate
+    # Graph, multi-query, HyDE and rewrite run concurrently
+    pre_retrieval = [est("graph")] if plan["use_graph"] else []
+    if plan["use_multi_query"]:
+        # Output (and so latency) grows with the number of variations
+        pre_retrieval.append(est("multi_query") * (0.6 + 0.1 * plan["num_variations"]))
+    if plan["use_hyde"]:
+        pre_retrieval.append(est("hyde"))
+    if plan["use_query_rewrite"] and not plan["use_multi_query"]:
+        pre_retrieval.append(est("rewrite"))
+
+    total = max(pre_retrieval, default=0) + est("retrieve") + est("generate")
+    if plan["use_hybrid"]:
+        total += est("bm25")
+    if plan["use_rerank"]:
+        total += est("rerank") * (0.5 + 0.5 * plan["rerank_candidates"] / 50)
+    return total
+
+
+def plan_pipeline(
+    namespace: str = "all",
+    use_rerank: bool = True,
+    use_hybrid: bool = True,
+    use_query_rewrite: bool = True,
+    use_multi_query: bool = True,
+    use_hyde: bool = True,
+    use_graph: bool = True,
+    profile: str = None,
+    max_latency_ms: float = None
+) -> dict:
+    """
+    Decide which stages a request runs.
+
+    Starts from the use_* flags, applies the profile's caps, then - if a
+    latency budget is given - drops the most expensive optional work until
+    the estimated latency fits: HyDE, then multi-query variations (4 -> 2 ->
+    none), query rewrite, graph expansion, rerank candidates, and rerank.
+
+    Args:
+        namespace: Namespace being searched (sets the default rerank candidates)
+        use_*: Stages the caller asked for
+        profile: "fast", "balanced" or "thorough" (None = no caps)
+        max_latency_ms: Latency budget in milliseconds (None = no budget)
+
+    Returns:
+        Dict with the effective use_* flags, num_variations, rerank_candidates,
+        the stages skipped relative to the flags, and the estimated latency
+    """
+    if profile is not None and profile not in PIPELINE_PROFILES:
+        raise ValueError(f"Unknown profile '{profile}'. Choose from: {list(PIPELINE_PROFILES)}")
+
+    caps = PIPELINE_PROFILES.get(profile, PIPELINE_PROFILES["thorough"])
+    plan = {
+        "profile": profile,
+        "use_graph": use_graph and caps["graph"],
+        "use_multi_query": use_multi_query and caps["multi_query_variations"] > 0,
+        "num_variations": caps["multi_query_variations"] or 4,
+        "use_hyde": use_hyde and caps["hyde"],
+        "use_query_rewrite": use_query_rewrite and caps["rewrite"],
+        "use_hybrid": use_hybrid and caps["hybrid"],
+        "use_rerank": use_rerank and caps["rerank"],
+        "rerank_candidates": min(caps["rerank_candidates"], 50 if namespace == "all" else 30),
+    }
+
+    if max_latency_ms is not None:
+        downgrades = [
+            ("use_hyde", False),
+            ("num_variations", 2),
+            ("use_multi_query", False),
+            ("use_query_rewrite", False),
+            ("use_graph", False),
+            ("rerank_candidates", 20),
+            ("use_rerank", False),
+        ]
+        for key, value in downgrades:
+            if estimate_plan_ms(plan) <= max_latency_ms:
+                break
+            if key == "num_variations" or key == "rerank_candidates":
+                plan[key] = min(plan[key], value)
+            else:
+                plan[key] = value
+
+    requested = {
+        "graph": use_graph, "multi_query": use_multi_query, "hyde": use_hyde,
+        "query_rewrite": use_query_rewrite and not use_multi_query,
+        "hybrid": use_hybrid, "rerank": use_rerank
+    }
+    planned = {
+        "graph": plan["use_graph"], "multi_query": plan["use_multi_query"], "hyde": plan["use_hyde"],
+        "query_rewrite": plan["use_query_rewrite"] and not plan["use_multi_query"],
+        "hybrid": plan["use_hybrid"], "rerank": plan["use_rerank"]
+    }
+    plan["skipped_stages"] = [stage for stage in requested if requested[stage] and not planned[stage]]
+    plan["estimated_latency_ms"] = round(estimate_plan_ms(plan))
+    return plan
+
+
+def answer_cache_scope(plan: dict, namespace: str, top_k: int, hybrid_alpha: float,
+                       context_token_budget: int) -> tuple:
+    """
+    Semantic answer cache scope: a paraphrase of a recent question only gets
+    the stored answer with the same namespace and effective stages.
+    """
+    return (
+        namespace, top_k, plan["use_rerank"], plan["use_hybrid"], plan["use_query_rewrite"],
+        plan["use_multi_query"], plan["use_hyde"], plan["use_graph"], hybrid_alpha,
+        plan["num_variations"], plan["rerank_candidates"], context_token_budget
+    )
+
+
+def cached_answer(question: str, question_embedding, scope: tuple):
+    """The semantic answer cache's result for a question, or None on a miss."""
+    if question_embedding is None:
+        return None
+    cached = answer_cache.lookup(question_embedding, scope)
+    if cached is None:
+        return None
+    cached_result, similarity = cached
+    print(f"Answer cache hit (similarity {similarity:.3f})")
+    return {
+        **cached_result,
+        "question": question,
+        "answer_cache_hit": True,
+        "answer_cache_similarity": round(similarity, 4)
+    }
+
+
+def prepare_answer(
     question: str,
     namespace: str = "all",
     top_k: int = 5,
@@ -558,72 +1481,154 @@ def query_books(
     use_multi_query: bool = True,
     use_hyde: bool = True,
     use_graph: bool = True,
-    hybrid_alpha: float = 0.7
+    hybrid_alpha: float = 0.7,
+    use_answer_cache: bool = True,
+    profile: str = None,
+    max_latency_ms: float = None,
+    trace: Trace = None,
+    context_token_budget: int = None,
+    batch: "BatchContext" = None
 ) -> dict:
     """
-    Query the book knowledge base with production-grade retrieval.
+    Run every query_books step up to generation.
 
     Enhanced Pipeline:
     0. Graph Expansion: Use knowledge graph to find related concepts
     1. Multi-Query: Generate 4 query variations to cast wider net
     2. HyDE: Generate hypothetical answer for better embedding match
+       (steps 0-2 run concurrently while the original question is retrieved)
     3. Hybrid Search: Combine BM25 + Vector for each query
     4. Deduplicate & Merge: Combine results from all queries
     5. Rerank: Cohere reranker picks the best matches
-    6. Generate: LLM synthesizes final answer
+    6. Pack: Merge, dedupe and fit the chunks into the context token budget
 
-    Args:
-        question: Your question
-        namespace: Which category to search (aws, llm, mlops, ml, arch, or all)
-        top_k: Number of relevant chunks to return
-        use_rerank: Whether to use Cohere reranking (default True)
-        use_hybrid: Whether to use hybrid search (BM25 + vector) (default True)
-        use_query_rewrite: Whether to rewrite vague queries (default True)
-        use_multi_query: Whether to generate multiple query variations (default True)
-        use_hyde: Whether to use HyDE for embedding (default True)
-        use_graph: Whether to use knowledge graph for concept expansion (default True)
-        hybrid_alpha: Weight for vector search in hybrid (0-1, default 0.7)
+    Takes the same arguments as query_books, plus a Trace that receives a
+    span per stage and per namespace retrieval. Inside query_books_batch,
+    `batch` supplies the batch's plan, question embeddings, embedding calls,
+    retrievals and rerank slots.
 
     Returns:
-        Dict with response, sources, and metadata
+        {"cached": result} on a semantic answer cache hit, otherwise a dict with
+        the reranked nodes, the generation prompt, the response metadata and
+        formatted sources, and what is needed to store the finished answer
     """
-    # Step 0: Knowledge Graph Expansion (find related concepts)
+    print(f"Query: {question}")
+    trace = trace or Trace()
+    if context_token_budget is None:
+        context_token_budget = CONTEXT_TOKEN_BUDGET
+
+    # Stages actually run (profile caps and latency budget applied)
+    plan = batch.plan if batch is not None else plan_pipeline(
+        namespace, use_rerank, use_hybrid, use_query_rewrite, use_multi_query,
+        use_hyde, use_graph, profile, max_latency_ms
+    )
+    use_graph = plan["use_graph"]
+    use_multi_query = plan["use_multi_query"]
+    use_hyde = plan["use_hyde"]
+    use_query_rewrite = plan["use_query_rewrite"]
+    use_hybrid = plan["use_hybrid"]
+    use_rerank = plan["use_rerank"]
+    if plan["skipped_stages"]:
+        print(f"Plan: skipping {', '.join(plan['skipped_stages'])} "
+              f"(estimated {plan['estimated_latency_ms']} ms)")
+
+    # Semantic answer cache: a paraphrase of a recent question with the same
+    # namespace and effective stages gets the stored answer without
+    # retrieval/generation
+    cache_scope = answer_cache_scope(plan, namespace, top_k, hybrid_alpha, context_token_budget)
+    question_embedding = None
+    if use_answer_cache and batch is not None:
+        # The batch looked every question up before starting the pipelines
+        question_embedding = batch.question_embeddings.get(question)
+    elif use_answer_cache:
+        with trace.span("answer_cache"):
+            question_embedding = embed_queries([question]).get(question)
+            cached = cached_answer(question, question_embedding, cache_scope)
+        if cached is not None:
+            return {"cached": cached}
+
+    # Steps 0-2: Graph expansion, multi-query and HyDE are independent, so they
+    # run concurrently. Each stage's queries are scheduled for retrieval as
+    # soon as that stage finishes.
     graph_info = {"graph_enhanced": False, "concepts_found": [], "expansion_terms": [], "enriched_queries": []}
-    if use_graph and GRAPH_AVAILABLE:
-        graph_info = expand_query_with_graph(question)
-        if graph_info["graph_enhanced"]:
-            print(f"Query: {question}")
-            print(f"Graph: Found concepts {graph_info['concepts_found']}")
-            print(f"Graph: Related terms: {graph_info['expansion_terms'][:5]}")
-
-    # Step 1: Generate multiple query variations
     multi_query_info = {"original": question, "queries": [question], "num_variations": 1}
-    if use_multi_query:
-        multi_query_info = generate_multi_queries(question, num_queries=4)
-        print(f"Query: {question}")
-        print(f"Generated {multi_query_info['num_variations']} query variations:")
-        for i, q in enumerate(multi_query_info['queries'][:3], 1):  # Show first 3
-            print(f"  {i}. {q[:80]}{'...' if len(q) > 80 else ''}")
-        if len(multi_query_info['queries']) > 3:
-            print(f"  ... and {len(multi_query_info['queries']) - 3} more")
-    else:
-        print(f"Query: {question}")
+    hyde_info = {"original": question, "hypothetical_doc": question, "hyde_used": False}
+    query_info = {"original": question, "rewritten": question, "was_rewritten": False}
 
+    stages = {}
+    # Step 0: Knowledge Graph Expansion (find related concepts)
+    if use_graph and GRAPH_AVAILABLE:
+        stages[stage_pool.submit(trace.timed("graph", expand_query_with_graph), question)] = "graph"
+    # Step 1: Generate multiple query variations (4 unless the plan reduced them)
+    if use_multi_query:
+        stages[stage_pool.submit(trace.timed("multi_query", generate_multi_queries), question, plan["num_variations"])] = "multi_query"
     # Step 2: Generate HyDE document for embedding
-    hyde_info = {"original": question, "hypothetical_doc": question, "hyde_used": False}
     if use_hyde:
-        hyde_info = generate_hypothetical_document(question)
-        if hyde_info["hyde_used"]:
-            print(f"HyDE: Generated hypothetical document ({len(hyde_info['hypothetical_doc'])} chars)")
-
+        stages[stage_pool.submit(trace.timed("hyde", generate_hypothetical_document), question)] = "hyde"
     # Legacy query rewrite (still useful as fallback)
-    query_info = {"original": question, "rewritten": question, "was_rewritten": False}
     if use_query_rewrite and not use_multi_query:
-        query_info = rewrite_query(question)
-        if query_info["was_rewritten"]:
-            print(f"Rewritten: {query_info['rewritten']}")
+        stages[stage_pool.submit(trace.timed("rewrite", rewrite_query), question)] = "rewrite"
+
+    # Route an "all" search once, from the original question, so the
+    # namespaces searched don't depend on which stage finishes first
+    namespaces = None
+    if namespace == "all":
+        if question_embedding is None:
+            with trace.span("embed", queries=1):
+                embeddings = batch.embed([question]) if batch is not None else embed_queries([question])
+                question_embedding = embeddings.get(question)
+        with trace.span("route"):
+            namespaces = route_namespaces(question, question_embedding)
+        if len(namespaces) < len(ACTIVE_NAMESPACES):
+            print(f"  Routed to namespaces: {namespaces}")
+
+    # Retrieval is scheduled as soon as each query is known (see RetrievalScheduler)
+    # Fetch less per namespace for "all" since we have multiple queries
+    fetch_count = 20 if (use_hybrid or use_rerank) else top_k
+    scheduler = RetrievalScheduler(
+        namespace, fetch_count=fetch_count, top_k_per_ns=15, trace=trace, batch=batch, namespaces=namespaces
+    )
 
-    # Build list of all queries to search with
+    # With the stages running, start retrieving the original question - it
+    # doesn't depend on them. If multi-query or a rewrite leaves it out of the
+    # search queries, its row is simply not fused.
+    scheduler.submit(question)
+
+    stage_cache = {}  # LLM stage -> served from cache?
+    for future in as_completed(stages):
+        stage = stages[future]
+        if stage != "graph":
+            stage_cache[stage] = future.result().get("from_cache", False)
+
+        if stage == "graph":
+            graph_info = future.result()
+            if graph_info["graph_enhanced"]:
+                print(f"Graph: Found concepts {graph_info['concepts_found']}")
+                print(f"Graph: Related terms: {graph_info['expansion_terms'][:5]}")
+                scheduler.submit_many(graph_info["enriched_queries"])
+
+        elif stage == "multi_query":
+            multi_query_info = future.result()
+            print(f"Generated {multi_query_info['num_variations']} query variations:")
+            for i, q in enumerate(multi_query_info['queries'][:3], 1):  # Show first 3
+                print(f"  {i}. {q[:80]}{'...' if len(q) > 80 else ''}")
+            if len(multi_query_info['queries']) > 3:
+                print(f"  ... and {len(multi_query_info['queries']) - 3} more")
+            scheduler.submit_many(multi_query_info['queries'])
+
+        elif stage == "hyde":
+            hyde_info = future.result()
+            if hyde_info["hyde_used"]:
+                print(f"HyDE: Generated hypothetical document ({len(hyde_info['hypothetical_doc'])} chars)")
+                scheduler.submit(hyde_info["hypothetical_doc"][:500])
+
+        elif stage == "rewrite":
+            query_info = future.result()
+            if query_info["was_rewritten"]:
+                print(f"Rewritten: {query_info['rewritten']}")
+                scheduler.submit(query_info["rewritten"])
+
+    # Build list of all queries to search with (fixed order keeps the merge deterministic)
     search_queries = []
     if use_multi_query:
         search_queries.extend(multi_query_info['queries'])
@@ -641,6 +1646,12 @@ def query_books(
 
     print(f"Searching: {NAMESPACES.get(namespace, namespace)} with {len(search_queries)} queries")
 
+    # Cohere when configured, otherwise the local MMR reranker
+    reranker = None
+    if use_rerank:
+        reranker = "cohere" if get_cohere_client() is not None else "mmr"
+    rerank_enabled = reranker is not None
+
     features = []
     if graph_info["graph_enhanced"]:
         features.append("Graph")
@@ -650,82 +1661,123 @@ def query_books(
         features.append("HyDE")
     if use_hybrid:
         features.append("Hybrid Search")
-    if use_rerank and co:
-        features.append("Cohere Rerank")
+    if rerank_enabled:
+        features.append("Cohere Rerank" if reranker == "cohere" else "MMR Rerank")
     if use_query_rewrite and not use_multi_query:
         features.append("Query Rewrite")
     print(f"Features: {', '.join(features) if features else 'Basic'}")
     print("-" * 40)
 
-    # Step 3: Multi-Query Retrieval
-    # Search with each query variation and combine results
+    # Step 3: Multi-Query Retrieval + Hybrid Search
+    # Every (query x namespace) vector list and every BM25 list goes into one
+    # candidate pool keyed by chunk id, then all lists are fused in one
+    # weighted RRF pass.
     # IMPORTANT: Original query gets higher weight than variations
-    all_retrieved_nodes = []
-    seen_texts = set()  # For deduplication
     original_query = question  # Keep original for reranking
-
-    for query_idx, search_query in enumerate(search_queries):
-        # First query is always the original - give it higher weight
-        is_original_query = (query_idx == 0)
-
-        # Determine fetch count based on settings
-        if namespace == "all":
-            fetch_per_ns = 15  # Fetch less per query since we have multiple queries
-        else:
-            fetch_count = 20 if (use_hybrid or use_rerank) else top_k
-
-        # Query all namespaces or specific namespace
-        if namespace == "all":
-            vector_nodes = query_all_namespaces(search_query, top_k_per_ns=fetch_per_ns)
+    pool = CandidatePool()
+
+    # A repeated query would only double-count its lists, so fuse each once
+    fusion_queries = list(dict.fromkeys(search_queries))
+    vector_weight = hybrid_alpha if use_hybrid else 1.0
+
+    # Every query's row is already in flight on the shared retrieval pool;
+    # gather them in query order so the fusion is deterministic
+    with trace.span("retrieval_wait"):
+        for query_idx, search_query in enumerate(fusion_queries):
+            # First query is always the original - boost it by 20% to prioritize exact matches
+            query_boost = 1.2 if query_idx == 0 else 1.0
+
+            for ns, relevance, vector_nodes in scheduler.results_by_namespace(search_query):
+                # Small boost (5%) for lists from detected relevant namespaces
+                pool.add_list(vector_nodes, weight=vector_weight * query_boost * (1 + 0.05 * relevance))
+
+    # Hybrid Search: one BM25 list per query
+    bm25_start = time.perf_counter()
+    if use_hybrid and len(pool):
+        bm25_top_k = 30 if namespace == "all" else 15
+        if corpus_bm25_index is not None:
+            bm25_lists = [
+                corpus_bm25_search(search_query, scheduler.namespaces, top_k=bm25_top_k)
+                for search_query in fusion_queries
+            ]
         else:
-            retriever = get_retriever(namespace=namespace, top_k=fetch_count)
-            vector_nodes = retriever.retrieve(search_query)
-
-        # Hybrid Search (combine vector + BM25) for this query
-        if use_hybrid and vector_nodes:
-            bm25_top_k = 30 if namespace == "all" else 15
-            bm25_results = bm25_search(search_query, vector_nodes, top_k=bm25_top_k)
-            query_nodes = hybrid_merge(vector_nodes, bm25_results, alpha=hybrid_alpha)
-        else:
-            query_nodes = vector_nodes
+            # All variations scored against the whole candidate pool in one matrix op
+            bm25_lists = bm25_search_many(fusion_queries, pool.nodes, top_k=bm25_top_k)
 
-        # Add unique nodes to combined results
-        # Boost scores for results from original query
-        for node in query_nodes:
-            text_key = node.text[:150]  # Use text prefix for dedup
-            if text_key not in seen_texts:
-                seen_texts.add(text_key)
-                # Boost original query results by 20% to prioritize exact matches
-                if is_original_query and node.score is not None:
-                    node.score = node.score * 1.2
-                all_retrieved_nodes.append(node)
+        for query_idx, bm25_results in enumerate(bm25_lists):
+            query_boost = 1.2 if query_idx == 0 else 1.0
+            pool.add_list([node for node, _ in bm25_results], weight=(1 - hybrid_alpha) * query_boost)
+        trace.record("bm25", bm25_start)
 
-    print(f"  Combined: {len(all_retrieved_nodes)} unique chunks from {len(search_queries)} queries")
+    print(f"  Combined: {len(pool)} unique chunks from {len(search_queries)} queries")
+    trace.count("candidates", len(pool))
 
-    # Sort combined results by score
-    nodes = sorted(all_retrieved_nodes, key=lambda x: x.score if x.score else 0, reverse=True)
+    # Sort combined results by fused score
+    with trace.span("fusion"):
+        nodes = pool.ranked()
 
     # Step 4: Rerank the merged results
     # CRITICAL: Use ORIGINAL question for reranking, not query variations
     # This ensures Cohere scores relevance to what the user actually asked
-    if use_rerank and co:
+    if rerank_enabled:
         # Reranker can handle up to 1000 docs, but more = slower
-        # Use top 50 candidates for all-namespace, 30 for specific
-        rerank_candidates = min(len(nodes), 50 if namespace == "all" else 30)
+        # Use top 50 candidates for all-namespace, 30 for specific (or fewer per the plan)
+        rerank_candidates = min(len(nodes), plan["rerank_candidates"])
         nodes_to_rerank = nodes[:rerank_candidates]
+        if reranker == "cohere" and 0 < MMR_PREFILTER_CANDIDATES < rerank_candidates:
+            # Local MMR pre-filter: fewer, less redundant documents for Cohere
+            with trace.span("mmr", candidates=rerank_candidates):
+                nodes_to_rerank = local_rerank(original_query, nodes_to_rerank, top_n=MMR_PREFILTER_CANDIDATES)
         # Use original_query (user's actual question) for reranking
-        nodes = rerank_results(original_query, nodes_to_rerank, top_n=top_k)
+        # (a batch caps its concurrent rerank calls)
+        with batch.rerank_slots if batch is not None else nullcontext():
+            with trace.span("rerank", candidates=len(nodes_to_rerank)):
+                # The reranker that actually ran (Cohere can fail over to MMR)
+                nodes, reranker = rerank_nodes(original_query, nodes_to_rerank, top_n=top_k)
     else:
         nodes = nodes[:top_k]
+    trace.count("sources", len(nodes))
 
-    # Build context from reranked nodes
-    context_str = "\n\n".join([
-        f"[Source: {n.metadata.get('source', 'Unknown')}, Page {n.metadata.get('page', 'N/A')}]\n{n.text}"
-        for n in nodes
-    ])
+    # Step 5: Pack the reranked chunks into the prompt's token budget
+    with trace.span("pack_context"):
+        context_str, context_packing = pack_context(nodes, context_token_budget)
+    trace.count("context_tokens_before", context_packing["tokens_before"])
+    trace.count("context_tokens_after", context_packing["tokens_after"])
 
-    # Generate response using LLM
-    prompt = f"""Based on the following context from technical books, answer the question.
+    metadata = {
+        "question": question,
+        "namespace": namespace,
+        "query_rewritten": query_info["was_rewritten"] or use_multi_query,
+        "search_query": multi_query_info['queries'][0] if use_multi_query else (query_info["rewritten"] if query_info["was_rewritten"] else None),
+        "multi_query": use_multi_query,
+        "num_queries": len(search_queries),
+        "hyde_used": hyde_info.get("hyde_used", False),
+        "graph_enhanced": graph_info.get("graph_enhanced", False),
+        "concepts_found": graph_info.get("concepts_found", []),
+        "hybrid_search": use_hybrid,
+        "reranked": rerank_enabled,
+        "reranker": reranker,
+        "stage_cache": stage_cache,
+        "namespaces_searched": scheduler.namespaces,
+        "profile": plan["profile"],
+        "skipped_stages": plan["skipped_stages"],
+        "estimated_latency_ms": plan["estimated_latency_ms"],
+        "context_packing": context_packing
+    }
+
+    return {
+        "nodes": nodes,
+        "prompt": build_prompt(question, context_str),
+        "metadata": metadata,
+        "sources": format_sources(nodes),
+        "question_embedding": question_embedding if use_answer_cache else None,
+        "answer_cache_scope": cache_scope
+    }
+
+
+def build_prompt(question: str, context_str: str) -> str:
+    """Generation prompt with the packed, cited context (see context_packer)."""
+    return f"""Based on the following context from technical books, answer the question.
 Include citations [Source: Book, Page X] when referencing specific information.
 
 Context:
@@ -735,9 +1787,9 @@ Question: {question}
 
 Answer:"""
 
-    response = Settings.llm.complete(prompt)
 
-    # Extract source information
+def format_sources(nodes: list) -> list:
+    """Source entries (book, page, category, display score) for the response."""
     sources = []
     for node in nodes:
         metadata = node.metadata
@@ -760,22 +1812,487 @@ Answer:"""
             "score": score_display,
             "text_preview": node.text[:200] + "..."
         })
+    return sources
 
-    return {
-        "question": question,
-        "namespace": namespace,
-        "query_rewritten": query_info["was_rewritten"] or use_multi_query,
-        "search_query": multi_query_info['queries'][0] if use_multi_query else (query_info["rewritten"] if query_info["was_rewritten"] else None),
-        "multi_query": use_multi_query,
-        "num_queries": len(search_queries),
-        "hyde_used": hyde_info.get("hyde_used", False),
-        "graph_enhanced": graph_info.get("graph_enhanced", False),
-        "concepts_found": graph_info.get("concepts_found", []),
-        "hybrid_search": use_hybrid,
-        "reranked": use_rerank and co is not None,
+
+def store_answer(prepared: dict, result: dict):
+    """Store a finished answer in the semantic answer cache."""
+    if prepared["question_embedding"] is not None:
+        answer_cache.put(prepared["question_embedding"], prepared["answer_cache_scope"], result)
+
+
+def complete_answer(prepared: dict, trace: Trace) -> dict:
+    """
+    Step 7 for a prepare_answer result: generate the answer, store it in the
+    answer cache and return the query_books result (cache hits as they are).
+    """
+    if "cached" in prepared:
+        return {**prepared["cached"], "timings": trace.summary()}
+
+    # Generate response using LLM
+    with trace.span("generate"):
+        response = get_llm().complete(prepared["prompt"])
+
+    result = {
+        **prepared["metadata"],
         "response": str(response),
-        "sources": sources
+        "sources": prepared["sources"],
+        "answer_cache_hit": False
+    }
+    store_answer(prepared, result)
+
+    timings = trace.summary()
+    stage_latency.observe(timings)
+    return {**result, "timings": timings}
+
+
+def query_books(
+    question: str,
+    namespace: str = "all",
+    top_k: int = 5,
+    use_rerank: bool = True,
+    use_hybrid: bool = True,
+    use_query_rewrite: bool = True,
+    use_multi_query: bool = True,
+    use_hyde: bool = True,
+    use_graph: bool = True,
+    hybrid_alpha: float = 0.7,
+    use_answer_cache: bool = True,
+    profile: str = None,
+    max_latency_ms: float = None,
+    context_token_budget: int = None
+) -> dict:
+    """
+    Query the book knowledge base with production-grade retrieval.
+
+    Runs steps 0-6 through prepare_answer, then:
+    7. Generate: LLM synthesizes final answer
+
+    Args:
+        question: Your question
+        namespace: Which category to search (aws, llm, mlops, ml, arch, or all)
+        top_k: Number of relevant chunks to return
+        use_rerank: Whether to use Cohere reranking (default True)
+        use_hybrid: Whether to use hybrid search (BM25 + vector) (default True)
+        use_query_rewrite: Whether to rewrite vague queries (default True)
+        use_multi_query: Whether to generate multiple query variations (default True)
+        use_hyde: Whether to use HyDE for embedding (default True)
+        use_graph: Whether to use knowledge graph for concept expansion (default True)
+        hybrid_alpha: Weight for vector search in hybrid (0-1, default 0.7)
+        use_answer_cache: Serve/store answers in the semantic answer cache (default True)
+        profile: "fast", "balanced" or "thorough" - caps which stages run (default: flags only)
+        max_latency_ms: Latency budget; optional stages are dropped to fit it (see plan_pipeline)
+        context_token_budget: Prompt context tokens (default CONTEXT_TOKEN_BUDGET, 0 = no packing)
+
+    Returns:
+        Dict with response, sources, and metadata (including skipped_stages and the
+        context_packing token counts). "timings" holds the request's stage spans
+        and candidate counts (see tracing.Trace).
+    """
+    trace = Trace()
+    prepared = prepare_answer(
+        question, namespace, top_k, use_rerank, use_hybrid, use_query_rewrite,
+        use_multi_query, use_hyde, use_graph, hybrid_alpha, use_answer_cache,
+        profile, max_latency_ms, trace, context_token_budget
+    )
+    return complete_answer(prepared, trace)
+
+
+def query_books_stream(
+    question: str,
+    namespace: str = "all",
+    top_k: int = 5,
+    use_rerank: bool = True,
+    use_hybrid: bool = True,
+    use_query_rewrite: bool = True,
+    use_multi_query: bool = True,
+    use_hyde: bool = True,
+    use_graph: bool = True,
+    hybrid_alpha: float = 0.7,
+    use_answer_cache: bool = True,
+    profile: str = None,
+    max_latency_ms: float = None,
+    context_token_budget: int = None
+):
+    """
+    Streaming variant of query_books.
+
+    Yields events as dicts with "event" and "data" keys:
+    - "sources": response metadata and sources, as soon as reranking finishes
+    - "token": {"delta": text} for each chunk the LLM produces
+    - "done": {"response": full answer, "timings": {...}}
+
+    Timings are milliseconds from the call: time_to_sources_ms,
+    time_to_first_token_ms and total_ms, plus the stage spans under
+    "trace". Takes the same arguments as query_books.
+    """
+    started = time.perf_counter()
+    trace = Trace()
+
+    def elapsed_ms() -> float:
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    prepared = prepare_answer(
+        question, namespace, top_k, use_rerank, use_hybrid, use_query_rewrite,
+        use_multi_query, use_hyde, use_graph, hybrid_alpha, use_answer_cache,
+        profile, max_latency_ms, trace, context_token_budget
+    )
+
+    if "cached" in prepared:
+        cached = prepared["cached"]
+        time_to_sources = elapsed_ms()
+        yield {"event": "sources", "data": {k: v for k, v in cached.items() if k != "response"}}
+        yield {"event": "token", "data": {"delta": cached["response"]}}
+        timings = {
+            "time_to_sources_ms": time_to_sources,
+            "time_to_first_token_ms": elapsed_ms(),
+            "total_ms": elapsed_ms(),
+            "trace": trace.summary()
+        }
+        yield {"event": "done", "data": {"response": cached["response"], "timings": timings}}
+        return
+
+    time_to_sources = elapsed_ms()
+    yield {"event": "sources", "data": {
+        **prepared["metadata"],
+        "sources": prepared["sources"],
+        "answer_cache_hit": False
+    }}
+
+    # Stream the answer as the LLM generates it
+    time_to_first_token = None
+    chunks = []
+    generate_start = time.perf_counter()
+    for chunk in get_llm().stream_complete(prepared["prompt"]):
+        if not chunk.delta:
+            continue
+        if time_to_first_token is None:
+            time_to_first_token = elapsed_ms()
+        chunks.append(chunk.delta)
+        yield {"event": "token", "data": {"delta": chunk.delta}}
+
+    trace.record("generate", generate_start)
+    stage_latency.observe(trace.summary())
+
+    response = "".join(chunks)
+    timings = {
+        "time_to_sources_ms": time_to_sources,
+        "time_to_first_token_ms": time_to_first_token,
+        "total_ms": elapsed_ms(),
+        "trace": trace.summary()
     }
+    print(f"Streamed: sources {time_to_sources:.0f} ms, first token "
+          f"{time_to_first_token or 0:.0f} ms, total {timings['total_ms']:.0f} ms")
+
+    store_answer(prepared, {
+        **prepared["metadata"],
+        "response": response,
+        "sources": prepared["sources"],
+        "answer_cache_hit": False
+    })
+    yield {"event": "done", "data": {"response": response, "timings": timings}}
+
+
+# ============================================================================
+# BATCH QUERIES
+# ============================================================================
+
+class BatchContext:
+    """
+    State shared by the questions of one query_books_batch call.
+
+    - plan: one pipeline plan for the whole batch
+    - question_embeddings: every question's vector, from one embedding call
+    - embed(): query embedding for the questions' retrieval schedulers; calls
+      made while another is in flight are combined into the next single call
+    - retrieval(): retrieval futures keyed by (mode, namespace, query, top_k);
+      questions whose variations coincide share one Pinecone call
+    - rerank_slots: caps the batch's concurrent Cohere rerank calls
+    """
+
+    def __init__(self, plan: dict, trace: Trace, rerank_concurrency: int = BATCH_RERANK_CONCURRENCY):
+        self.plan = plan
+        self.trace = trace
+        self.question_embeddings = {}
+        self.rerank_slots = threading.BoundedSemaphore(rerank_concurrency)
+        self._lock = threading.Lock()
+        self._retrievals = {}
+        self._retrievals_requested = 0
+        # Embedding: queries waiting for the next call, in the current call,
+        # and already attempted (vector in _embeddings unless embedding failed)
+        self._embed_done = threading.Condition(self._lock)
+        self._embed_pending = set()
+        self._embed_in_flight = set()
+        self._embedded = set()
+        self._embeddings = {}
+        self._embed_calls = 0
+
+    def embed(self, queries: list) -> dict:
+        """
+        Vectors of queries (see embed_queries), embedded together with the
+        queries other questions of the batch are waiting for.
+
+        The first caller to find no embedding call in flight makes one for
+        everything pending; the others wait for it, or make the next one.
+        """
+        with self._lock:
+            wanted = [q for q in dict.fromkeys(queries) if q]
+            self._embed_pending.update(
+                q for q in wanted if q not in self._embedded and q not in self._embed_in_flight
+            )
+            while not all(q in self._embedded for q in wanted):
+                if self._embed_in_flight:
+                    self._embed_done.wait()
+                    continue
+                self._embed_in_flight = self._embed_pending
+                self._embed_pending = set()
+                self._lock.release()
+                try:
+                    embeddings = embed_queries(list(self._embed_in_flight))
+                finally:
+                    self._lock.acquire()
+                    self._embedded.update(self._embed_in_flight)
+                    self._embed_in_flight = set()
+                    self._embed_calls += 1
+                    self._embed_done.notify_all()
+                self._embeddings.update(embeddings)
+            return {q: self._embeddings[q] for q in wanted if q in self._embeddings}
+
+    def retrieval(self, key: tuple, func, *args):
+        """Future of a retrieval (submitted on first request, shared afterwards)."""
+        with self._lock:
+            self._retrievals_requested += 1
+            if key not in self._retrievals:
+                self._retrievals[key] = PooledRetrieval(func, *args)
+            return self._retrievals[key]
+
+    def summary(self, answers: list, questions: int) -> dict:
+        """
+        Aggregate timings of a batch.
+
+        Args:
+            answers: One result per distinct question (query_books results or errors)
+            questions: Questions submitted, including repeats
+
+        Returns:
+            Dict with the batch total, the duration of each batch phase, per-stage
+            count/total/p50/max over all questions' spans, answer cache hits,
+            failures, and the embedding and retrieval calls made vs requested
+        """
+        batch_timings = self.trace.summary()
+        durations = defaultdict(list)
+        for answer in answers:
+            for span in answer.get("timings", {}).get("spans", []):
+                durations[span["name"]].append(span["duration_ms"])
+
+        with self._lock:
+            embedding = {"calls": self._embed_calls, "queries": len(self._embedded)}
+            retrievals = {
+                "requested": self._retrievals_requested,
+                "executed": len(self._retrievals),
+                "deduped": self._retrievals_requested - len(self._retrievals)
+            }
+
+        return {
+            "total_ms": batch_timings["total_ms"],
+            "questions": questions,
+            "unique_questions": len(answers),
+            "answer_cache_hits": sum(1 for a in answers if a.get("answer_cache_hit")),
+            "failed": sum(1 for a in answers if "error" in a),
+            "phases": {span["name"]: span["duration_ms"] for span in batch_timings["spans"]},
+            "stages": {
+                name: {
+                    "count": len(values),
+                    "total_ms": round(sum(values), 1),
+                    "p50_ms": round(float(np.median(values)), 1),
+                    "max_ms": round(max(values), 1)
+                }
+                for name, values in durations.items()
+            },
+            "embedding": embedding,
+            "retrievals": retrievals
+        }
+
+
+def query_books_batch(
+    questions: list,
+    namespace: str = "all",
+    top_k: int = 5,
+    use_rerank: bool = True,
+    use_hybrid: bool = True,
+    use_query_rewrite: bool = True,
+    use_multi_query: bool = True,
+    use_hyde: bool = True,
+    use_graph: bool = True,
+    hybrid_alpha: float = 0.7,
+    use_answer_cache: bool = True,
+    profile: str = None,
+    max_latency_ms: float = None,
+    context_token_budget: int = None
+) -> dict:
+    """
+    Answer many questions, sharing work across the batch.
+
+    1. One plan for the batch; identical questions (after normalization) run once
+    2. All questions embedded in one call; answer cache hits are served here
+    3. One pipeline per remaining question on the batch pool
+       (BATCH_MAX_CONCURRENCY across all batches), so generations run in
+       parallel. Within the batch:
+       - query variations, HyDE documents and graph expansions are embedded
+         in combined calls (see BatchContext.embed)
+       - identical retrievals run once and are shared between questions
+       - at most BATCH_RERANK_CONCURRENCY reranks run at once
+
+    Takes the same options as query_books, applied to every question.
+
+    Returns:
+        {"results": one query_books result per question, in order - or
+        {"question", "error"} if that question failed,
+        "timings": aggregate batch timings (see BatchContext.summary)}
+    """
+    if not questions:
+        raise ValueError("questions must not be empty")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise ValueError(f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    if context_token_budget is None:
+        context_token_budget = CONTEXT_TOKEN_BUDGET
+
+    trace = Trace()
+    plan = plan_pipeline(
+        namespace, use_rerank, use_hybrid, use_query_rewrite, use_multi_query,
+        use_hyde, use_graph, profile, max_latency_ms
+    )
+    batch = BatchContext(plan, trace)
+
+    # 1. First spelling of each distinct question
+    representatives = {}
+    for question in questions:
+        representatives.setdefault(normalize_text(question), question)
+    unique = list(representatives.values())
+    print(f"Batch: {len(questions)} questions ({len(unique)} distinct)")
+
+    # 2. One embedding call for every question, then the answer cache
+    with trace.span("embed_questions", queries=len(unique)):
+        batch.question_embeddings = batch.embed(unique)
+
+    answers = {}
+    if use_answer_cache:
+        scope = answer_cache_scope(plan, namespace, top_k, hybrid_alpha, context_token_budget)
+        for question in unique:
+            question_trace = Trace()
+            with question_trace.span("answer_cache"):
+                cached = cached_answer(question, batch.question_embeddings.get(question), scope)
+            if cached is not None:
+                answers[question] = {**cached, "timings": question_trace.summary()}
+    pending = [q for q in unique if q not in answers]
+
+    # 3. The per-question pipelines, generation included
+    def answer(question: str) -> dict:
+        question_trace = Trace()
+        try:
+            prepared = prepare_answer(
+                question, namespace, top_k, use_rerank, use_hybrid, use_query_rewrite,
+                use_multi_query, use_hyde, use_graph, hybrid_alpha, use_answer_cache,
+                profile, max_latency_ms, question_trace, context_token_budget, batch
+            )
+            return complete_answer(prepared, question_trace)
+        except Exception as e:
+            print(f"Batch question failed: {question[:80]}: {e}")
+            return {"question": question, "error": str(e)}
+
+    with trace.span("pipelines", questions=len(pending)):
+        answers.update(zip(pending, batch_pool.map(answer, pending)))
+
+    results = [
+        {**answers[representatives[normalize_text(question)]], "question": question}
+        for question in questions
+    ]
+    timings = batch.summary(list(answers.values()), len(questions))
+    print(f"Batch: {timings['total_ms']:.0f} ms, {timings['retrievals']['deduped']} of "
+          f"{timings['retrievals']['requested']} retrievals shared, "
+          f"{timings['embedding']['calls']} embedding calls")
+    return {"results": results, "timings": timings}
+
+
+def get_cache_stats() -> dict:
+    """Hit/miss metrics for every pipeline cache."""
+    return {
+        "embedding": embedding_cache.stats(),
+        "llm_stage": llm_stage_cache.stats(),
+        "rerank": rerank_cache.stats(),
+        "answer": answer_cache.stats()
+    }
+
+
+# ============================================================================
+# WARMUP
+# ============================================================================
+
+# similarity_top_k values requested at runtime: retrieve_namespace's
+# keyword-adjusted 7/15/22 for "all" and fetch_count 20 for one namespace
+WARMUP_TOP_K = (7, 15, 20, 22)
+
+_warmup_report = None
+_warmup_lock = threading.Lock()
+
+
+def warmup() -> dict:
+    """
+    Do the setup work a first request would otherwise pay for.
+
+    Connects to Pinecone (one describe_index_stats round trip; skipped for
+    the local backend), configures the models, creates the Cohere client,
+    builds the namespace retrievers (opening the local shards) and loads the
+    concept graph. A successful warmup runs only once; after a
+    failure the next call retries.
+
+    Returns:
+        Dict with "ready", per-step milliseconds and "error" if a step failed
+    """
+    global _warmup_report
+    with _warmup_lock:
+        if _warmup_report is not None and _warmup_report["ready"]:
+            return _warmup_report
+
+        steps = {}
+        report = {"ready": False, "steps_ms": steps}
+        step_start = time.perf_counter()
+
+        def step_done(name: str):
+            nonlocal step_start
+            now = time.perf_counter()
+            steps[name] = round((now - step_start) * 1000, 1)
+            step_start = now
+
+        try:
+            if VECTOR_STORE_BACKEND == "pinecone":
+                get_pinecone_index().describe_index_stats()
+            step_done("vector_store")
+            configure_models()
+            step_done("models")
+            get_cohere_client()
+            step_done("cohere")
+            for ns in ACTIVE_NAMESPACES:
+                for top_k in WARMUP_TOP_K:
+                    get_retriever(namespace=ns, top_k=top_k)
+            step_done("retrievers")
+            if GRAPH_AVAILABLE:
+                get_concept_graph()
+            step_done("concept_graph")
+            report["ready"] = True
+        except Exception as e:
+            report["error"] = str(e)
+            print(f"Warmup failed: {e}")
+
+        report["total_ms"] = round(sum(steps.values()), 1)
+        _warmup_report = report
+        return report
+
+
+def warmup_status() -> dict:
+    """Report of the last warmup, or not-ready if it hasn't finished yet."""
+    report = _warmup_report
+    return report if report is not None else {"ready": False}
 
 
 def print_result(result: dict):
@@ -0,0 +1,605 @@
+# Persistent Corpus-Wide BM25 Index + Vectorized Candidate BM25 Scorer
+# Sparse inverted index over every chunk in the library, kept current by
+# ingest.py and memory-mapped at query time, so hybrid search can surface
+# keyword matches that vector search missed. Also a NumPy BM25Okapi-compatible
+# scorer for ranking a retrieved candidate set, with per-chunk token caching
+#
+# Usage:
+#   python sparse_index.py build                 # Export all namespaces from Pinecone
+#   python sparse_index.py build --namespace llm # Rebuild one partition
+#   python sparse_index.py compact               # Merge segments of every partition
+#   python sparse_index.py search "what is rag"  # Try a query
+
+import os
+import json
+import math
+import mmap
+import shutil
+import argparse
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from cache import hash_key
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+SPARSE_INDEX_DIR = os.getenv("SPARSE_INDEX_DIR", "sparse_index")
+
+# BM25 parameters (same defaults as rank_bm25.BM25Okapi)
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+
+# Chunks whose term-frequency vectors are kept between requests
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "50000"))
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenizer shared with bm25_search: lowercase + whitespace split."""
+    return text.lower().split()
+
+
+# ============================================================================
+# SEGMENT (immutable, memory-mapped)
+# ============================================================================
+
+"""
+Index Layout:
+sparse_index/
+    llm/                        # One partition per namespace
+        seg_000001/             # Immutable segments, newest wins on duplicate ids
+            terms.json          # Vocabulary, term i <-> row i of term_offsets
+            term_offsets.npy    # CSR offsets into the postings arrays (V + 1)
+            postings_docs.npy   # Local doc index of each posting (int32)
+            postings_tfs.npy    # Term frequency of each posting (float32)
+            doc_lengths.npy     # Token count per doc (int32)
+            doc_offsets.npy     # Byte offsets of each doc in docs.jsonl (N + 1)
+            ids.json            # Chunk id per doc (Pinecone vector id)
+            docs.jsonl          # {"id", "text", "metadata"} per doc
+            deleted.json        # Optional tombstones: ids removed from older segments
+        seg_000002/
+    aws/
+    ...
+"""
+
+
+class Segment:
+    """One immutable piece of a namespace partition, loaded with mmap."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.term_offsets = np.load(os.path.join(path, "term_offsets.npy"), mmap_mode="r")
+        self.postings_docs = np.load(os.path.join(path, "postings_docs.npy"), mmap_mode="r")
+        self.postings_tfs = np.load(os.path.join(path, "postings_tfs.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"), mmap_mode="r")
+        self.doc_offsets = np.load(os.path.join(path, "doc_offsets.npy"), mmap_mode="r")
+
+        with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+            self.terms = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "ids.json"), encoding="utf-8") as f:
+            self.ids = json.load(f)
+        deleted_path = os.path.join(path, "deleted.json")
+        self.deleted = []
+        if os.path.exists(deleted_path):
+            with open(deleted_path, encoding="utf-8") as f:
+                self.deleted = json.load(f)
+
+        self._docs_file = open(os.path.join(path, "docs.jsonl"), "rb")
+        size = os.fstat(self._docs_file.fileno()).st_size
+        self._docs = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        # Docs superseded by a newer segment are masked out (see Partition)
+        self.live = np.ones(len(self.doc_lengths), dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def document(self, local_idx: int) -> dict:
+        """Read one stored doc ({"id", "text", "metadata"}) from docs.jsonl."""
+        start, end = int(self.doc_offsets[local_idx]), int(self.doc_offsets[local_idx + 1])
+        return json.loads(self._docs[start:end])
+
+    def postings(self, term: str):
+        """(local doc indices, term frequencies) for a term, or None."""
+        i = self.terms.get(term)
+        if i is None:
+            return None
+        start, end = self.term_offsets[i], self.term_offsets[i + 1]
+        return self.postings_docs[start:end], self.postings_tfs[start:end]
+
+    def close(self):
+        if isinstance(self._docs, mmap.mmap):
+            self._docs.close()
+        self._docs_file.close()
+
+    @staticmethod
+    def write(path: str, docs: List[dict], deleted_ids: List[str] = ()):
+        """
+        Build a segment from docs and write it atomically to path.
+
+        Args:
+            path: Segment directory to create
+            docs: List of {"id", "text", "metadata"} dicts
+            deleted_ids: Ids to remove from older segments (tombstones)
+        """
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        postings = defaultdict(list)  # term -> [(doc, tf), ...]
+        doc_lengths = []
+        doc_offsets = [0]
+
+        with open(os.path.join(tmp_path, "docs.jsonl"), "wb") as f:
+            for local_idx, doc in enumerate(docs):
+                tokens = tokenize(doc["text"])
+                doc_lengths.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    postings[term].append((local_idx, tf))
+
+                line = json.dumps(doc, ensure_ascii=False).encode("utf-8") + b"\n"
+                f.write(line)
+                doc_offsets.append(doc_offsets[-1] + len(line))
+
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            term_offsets[i + 1] = term_offsets[i] + len(postings[term])
+
+        postings_docs = np.empty(term_offsets[-1], dtype=np.int32)
+        postings_tfs = np.empty(term_offsets[-1], dtype=np.float32)
+        for i, term in enumerate(terms):
+            entries = np.asarray(postings[term], dtype=np.int64).reshape(-1, 2)
+            postings_docs[term_offsets[i]:term_offsets[i + 1]] = entries[:, 0]
+            postings_tfs[term_offsets[i]:term_offsets[i + 1]] = entries[:, 1]
+
+        with open(os.path.join(tmp_path, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        with open(os.path.join(tmp_path, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump([doc["id"] for doc in docs], f)
+        if deleted_ids:
+            with open(os.path.join(tmp_path, "deleted.json"), "w", encoding="utf-8") as f:
+                json.dump(list(deleted_ids), f)
+        np.save(os.path.join(tmp_path, "term_offsets.npy"), term_offsets)
+        np.save(os.path.join(tmp_path, "postings_docs.npy"), postings_docs)
+        np.save(os.path.join(tmp_path, "postings_tfs.npy"), postings_tfs)
+        np.save(os.path.join(tmp_path, "doc_lengths.npy"), np.asarray(doc_lengths, dtype=np.int32))
+        np.save(os.path.join(tmp_path, "doc_offsets.npy"), np.asarray(doc_offsets, dtype=np.int64))
+
+        os.replace(tmp_path, path)
+
+
+# ============================================================================
+# NAMESPACE PARTITION
+# ============================================================================
+
+class Partition:
+    """
+    All segments of one namespace, scored together as a single BM25 corpus.
+
+    Segments are append-only: adding documents writes a new segment, and a doc
+    id that reappears in a newer segment masks out its older copy. Deleting
+    writes a segment of tombstones that masks the ids in older segments;
+    compact() drops masked docs and tombstones for good.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.segments: List[Segment] = []
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def _segment_dirs(self) -> List[str]:
+        return sorted(
+            d for d in os.listdir(self.path)
+            if d.startswith("seg_") and not d.endswith(".tmp")
+        )
+
+    def _load(self):
+        # Segments are immutable, so the ones already open are reused
+        loaded = {segment.path: segment for segment in self.segments}
+        paths = [os.path.join(self.path, d) for d in self._segment_dirs()]
+        segments = [loaded.get(path) or Segment(path) for path in paths]
+
+        # Newest segment wins for duplicate doc ids, and a tombstone hides the
+        # id in every older segment. Masks are rebuilt and swapped in whole,
+        # so a search holding the old mask never sees a half-updated one.
+        seen = set()
+        for segment in reversed(segments):
+            live = np.ones(len(segment), dtype=bool)
+            for local_idx, doc_id in enumerate(segment.ids):
+                if doc_id in seen:
+                    live[local_idx] = False
+                seen.add(doc_id)
+            seen.update(segment.deleted)
+            segment.live = live
+
+        # Live doc count and token total per segment, summed at search time
+        for segment in segments:
+            segment.live_docs = int(segment.live.sum())
+            segment.live_length = int(np.asarray(segment.doc_lengths)[segment.live].sum())
+
+        # Old segments are not closed here: in-flight searches may still hold
+        # them, and their mmaps are released once garbage collected
+        self.segments = segments
+        self.num_docs = sum(s.live_docs for s in segments)
+        total_length = sum(s.live_length for s in segments)
+        self.avg_doc_length = total_length / self.num_docs if self.num_docs else 0.0
+
+    def update(self, docs: List[dict] = (), deleted_ids: List[str] = ()):
+        """
+        Append one segment that adds (or replaces) docs and deletes ids.
+
+        Args:
+            docs: {"id", "text", "metadata"} dicts, replacing older copies of the same ids
+            deleted_ids: Ids to remove; a doc in the same update is kept
+        """
+        if not docs and not deleted_ids:
+            return
+        with self._lock:
+            dirs = self._segment_dirs()
+            next_id = int(dirs[-1][4:]) + 1 if dirs else 1
+            Segment.write(os.path.join(self.path, f"seg_{next_id:06d}"), docs, deleted_ids)
+            self._load()
+
+    def add_documents(self, docs: List[dict]):
+        """Append docs as a new segment (replaces older copies of the same ids)."""
+        self.update(docs=docs)
+
+    def delete_documents(self, ids: List[str]):
+        """Remove docs by id with a tombstone segment."""
+        self.update(deleted_ids=ids)
+
+    def compact(self):
+        """Merge all live docs into a single segment, dropping tombstones."""
+        with self._lock:
+            docs = [
+                segment.document(i)
+                for segment in self.segments
+                for i in np.flatnonzero(segment.live)
+            ]
+            old_dirs = self._segment_dirs()
+            next_id = int(old_dirs[-1][4:]) + 1 if old_dirs else 1
+            Segment.write(os.path.join(self.path, f"seg_{next_id:06d}"), docs)
+            for d in old_dirs:
+                shutil.rmtree(os.path.join(self.path, d))
+            self._load()
+
+    def search(self, query_tokens: List[str], top_k: int = 10) -> List[dict]:
+        """Score the partition with BM25 and return the top_k docs."""
+        return search_partitions([self], query_tokens, top_k=top_k)
+
+
+def search_partitions(partitions: List[Partition], query_tokens: List[str], top_k: int = 10) -> List[dict]:
+    """
+    Score one or more partitions as a single BM25 corpus and return the top_k docs.
+
+    Document frequencies, the document count and the average document length
+    are taken over the union of the partitions, so scores from different
+    namespaces are comparable and can be ranked together. Uses the
+    non-negative BM25 idf log(1 + (N - df + 0.5) / (df + 0.5)), since
+    corpus-wide stats make the Okapi epsilon floor unnecessary.
+
+    Returns:
+        List of {"id", "text", "metadata", "score"} dicts, best first
+    """
+    # Snapshot the segment lists (adds and compactions swap them atomically)
+    segments = [(partition, segment) for partition in partitions for segment in partition.segments]
+    num_docs = sum(segment.live_docs for _, segment in segments)
+    if not segments or not query_tokens or not num_docs:
+        return []
+    avg_doc_length = sum(segment.live_length for _, segment in segments) / num_docs
+
+    query_counts = Counter(query_tokens)
+
+    # Corpus-wide document frequency of each query term (live docs only)
+    term_postings = {}
+    for term in query_counts:
+        per_segment = [segment.postings(term) for _, segment in segments]
+        df = sum(
+            int(segment.live[p[0]].sum())
+            for (_, segment), p in zip(segments, per_segment) if p is not None
+        )
+        if df:
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            term_postings[term] = (idf, per_segment)
+
+    if not term_postings:
+        return []
+
+    candidates = []
+    for seg_idx, (_, segment) in enumerate(segments):
+        scores = np.zeros(len(segment), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * np.asarray(segment.doc_lengths) / avg_doc_length)
+
+        for term, (idf, per_segment) in term_postings.items():
+            p = per_segment[seg_idx]
+            if p is None:
+                continue
+            docs, tfs = np.asarray(p[0]), np.asarray(p[1])
+            scores[docs] += query_counts[term] * idf * tfs * (BM25_K1 + 1) / (tfs + norm[docs])
+
+        scores[~segment.live] = 0
+        hits = np.flatnonzero(scores > 0)
+        if hits.size > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k)[:top_k]]
+        candidates.extend((float(scores[i]), seg_idx, int(i)) for i in hits)
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+
+    results = []
+    for score, seg_idx, local_idx in candidates[:top_k]:
+        partition, segment = segments[seg_idx]
+        doc = segment.document(local_idx)
+        doc["metadata"].setdefault("namespace", partition.name)
+        doc["score"] = score
+        results.append(doc)
+    return results
+
+
+# ============================================================================
+# CORPUS INDEX
+# ============================================================================
+
+class SparseIndex:
+    """Corpus-wide BM25 index with one partition per namespace."""
+
+    def __init__(self, root: str = SPARSE_INDEX_DIR):
+        self.root = root
+        self.partitions: Dict[str, Partition] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        for name in sorted(os.listdir(root)):
+            if os.path.isdir(os.path.join(root, name)):
+                self.partitions[name] = Partition(os.path.join(root, name))
+
+    @classmethod
+    def load(cls, root: str = SPARSE_INDEX_DIR) -> Optional["SparseIndex"]:
+        """Open an existing index, or None if it has not been built."""
+        if not os.path.isdir(root) or not os.listdir(root):
+            return None
+        return cls(root)
+
+    def partition(self, namespace: str) -> Partition:
+        with self._lock:
+            if namespace not in self.partitions:
+                self.partitions[namespace] = Partition(os.path.join(self.root, namespace))
+            return self.partitions[namespace]
+
+    def add_documents(self, namespace: str, docs: List[dict]):
+        """Incrementally add (or replace) docs in a namespace partition."""
+        self.partition(namespace).add_documents(docs)
+
+    def delete_documents(self, namespace: str, ids: List[str]):
+        """Incrementally remove docs from a namespace partition."""
+        self.partition(namespace).delete_documents(ids)
+
+    def clear(self, namespace: str):
+        """Drop a namespace partition (files included) so it can be rebuilt."""
+        with self._lock:
+            partition = self.partitions.pop(namespace, None)
+        if partition is not None:
+            for segment in partition.segments:
+                segment.close()
+        shutil.rmtree(os.path.join(self.root, namespace), ignore_errors=True)
+
+    def compact(self, namespaces: List[str] = None):
+        """Compact the given partitions (default: all)."""
+        for name, partition in list(self.partitions.items()):
+            if namespaces is None or name in namespaces:
+                partition.compact()
+
+    def search(self, query: str, namespaces: List[str], top_k: int = 10) -> List[dict]:
+        """
+        BM25 search over one or more namespace partitions, scored as one
+        corpus so results from different namespaces rank fairly.
+
+        Args:
+            query: Search query
+            namespaces: Partitions to search
+            top_k: Number of results to return
+
+        Returns:
+            List of {"id", "text", "metadata", "score"} dicts, best first
+        """
+        partitions = [self.partitions[ns] for ns in namespaces if ns in self.partitions]
+        return search_partitions(partitions, tokenize(query), top_k=top_k)
+
+    def stats(self) -> dict:
+        return {
+            name: {"docs": p.num_docs, "segments": len(p.segments)}
+            for name, p in self.partitions.items()
+        }
+
+
+# ============================================================================
+# CANDIDATE-SET BM25 SCORER (BM25Okapi-compatible)
+# ============================================================================
+
+class TokenCache:
+    """
+    Per-chunk term-frequency vectors, cached by chunk id and text across
+    requests (ingest reuses positional ids when a book's text changes).
+
+    Tokens are mapped to integer ids in a shared vocabulary, and each chunk is
+    stored as (sorted unique term ids, counts, token count), so re-scoring a
+    chunk never re-tokenizes its text.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._vocab = {}
+        self._entries = OrderedDict()  # hash of (chunk id, text) -> (term_ids, counts, length)
+        self._lock = threading.Lock()
+
+    def term_ids(self, tokens: List[str], add: bool = False) -> np.ndarray:
+        """Map tokens to vocabulary ids (-1 for unknown tokens unless add=True)."""
+        if add:
+            with self._lock:
+                for token in tokens:
+                    if token not in self._vocab:
+                        self._vocab[token] = len(self._vocab)
+        return np.fromiter((self._vocab.get(t, -1) for t in tokens), dtype=np.int64, count=len(tokens))
+
+    def get(self, key: str, text: str):
+        """(term_ids, counts, doc_length) for a chunk, tokenizing on first use."""
+        key = hash_key(key, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        tokens = tokenize(text)
+        ids, counts = np.unique(self.term_ids(tokens, add=True), return_counts=True)
+        entry = (ids, counts.astype(np.float64), len(tokens))
+
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+
+token_cache = TokenCache()
+
+
+def bm25_score_matrix(queries: List[str], keys: List[str], texts: List[str]) -> np.ndarray:
+    """
+    Score every query against one candidate set in a single matrix operation.
+
+    The candidate set is the BM25 corpus, exactly as rank_bm25.BM25Okapi(docs)
+    would build it (Okapi idf with the epsilon floor for negative idf), so
+    row i equals BM25Okapi(docs).get_scores(tokenize(queries[i])).
+
+    Args:
+        queries: Query strings
+        keys: Stable chunk ids used for the token cache
+        texts: Chunk texts (tokenized only on a cache miss)
+
+    Returns:
+        (len(queries), len(texts)) array of BM25 scores
+    """
+    num_docs = len(texts)
+    scores = np.zeros((len(queries), num_docs))
+    if not num_docs or not queries:
+        return scores
+
+    docs = [token_cache.get(key, text) for key, text in zip(keys, texts)]
+    doc_lengths = np.array([d[2] for d in docs], dtype=np.float64)
+    avg_doc_length = doc_lengths.sum() / num_docs
+
+    # Document frequency and idf over the candidate vocabulary
+    all_ids = np.concatenate([d[0] for d in docs])
+    vocab_ids, df = np.unique(all_ids, return_counts=True)
+    if not vocab_ids.size:
+        return scores
+    idf = np.log(num_docs - df + 0.5) - np.log(df + 0.5)
+    average_idf = idf.sum() / len(idf)
+    idf[idf < 0] = BM25_EPSILON * average_idf
+
+    # Query-term count matrix Q (queries x query terms)
+    query_ids = [token_cache.term_ids(tokenize(q)) for q in queries]
+    terms = np.unique(np.concatenate(query_ids))
+    terms = terms[np.isin(terms, vocab_ids)]
+    if not terms.size:
+        return scores
+    Q = np.zeros((len(queries), terms.size))
+    for i, ids in enumerate(query_ids):
+        ids = ids[np.isin(ids, terms)]
+        np.add.at(Q[i], np.searchsorted(terms, ids), 1)
+
+    # Term-frequency matrix TF (docs x query terms)
+    TF = np.zeros((num_docs, terms.size))
+    doc_index = np.repeat(np.arange(num_docs), [d[0].size for d in docs])
+    all_counts = np.concatenate([d[1] for d in docs])
+    mask = np.isin(all_ids, terms)
+    TF[doc_index[mask], np.searchsorted(terms, all_ids[mask])] = all_counts[mask]
+
+    # BM25 weight of each (doc, term), then all queries at once
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / avg_doc_length)
+    W = idf[np.searchsorted(vocab_ids, terms)] * TF * (BM25_K1 + 1) / (TF + norm[:, None])
+    return Q @ W.T
+
+
+# ============================================================================
+# BUILD FROM PINECONE
+# ============================================================================
+
+def metadata_to_document(vector_id: str, metadata: dict, namespace: str) -> dict:
+    """Convert a Pinecone vector's metadata into a sparse index doc."""
+    from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+    try:
+        node = metadata_dict_to_node(metadata)
+        text = node.get_content()
+        doc_metadata = dict(node.metadata)
+    except Exception:
+        # Legacy records keep the chunk text under "text"
+        text = metadata.get("text", "")
+        doc_metadata = {k: v for k, v in metadata.items() if not k.startswith("_") and k != "text"}
+
+    doc_metadata.setdefault("namespace", namespace)
+    return {"id": vector_id, "text": text, "metadata": doc_metadata}
+
+
+def iter_namespace_vectors(pinecone_index, namespace: str, batch_size: int = 100):
+    """Yield (vector id, fetched vector) for every chunk of a namespace in Pinecone, in list order."""
+    for ids in pinecone_index.list(namespace=namespace):
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            response = pinecone_index.fetch(ids=batch, namespace=namespace)
+            for vector_id in batch:
+                vector = response.vectors.get(vector_id)
+                if vector is not None:
+                    yield vector_id, vector
+
+
+def export_namespace(pinecone_index, namespace: str, batch_size: int = 100) -> List[dict]:
+    """Fetch every chunk of a namespace from Pinecone as sparse index docs."""
+    return [
+        metadata_to_document(vector_id, vector.metadata, namespace)
+        for vector_id, vector in iter_namespace_vectors(pinecone_index, namespace, batch_size)
+        if vector.metadata
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Corpus-wide BM25 index")
+    parser.add_argument("command", choices=["build", "compact", "search", "stats"])
+    parser.add_argument("query", nargs="?", help="Query for the search command")
+    parser.add_argument("--namespace", help="Only this namespace (default: all active)")
+    parser.add_argument("--dir", default=SPARSE_INDEX_DIR, help="Index directory")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from rag_llamaindex import get_pinecone_index, ACTIVE_NAMESPACES
+
+        pinecone_index = get_pinecone_index()
+        index = SparseIndex(args.dir)
+        for namespace in [args.namespace] if args.namespace else ACTIVE_NAMESPACES:
+            print(f"Exporting namespace '{namespace}' from Pinecone...")
+            docs = export_namespace(pinecone_index, namespace)
+            # A full build replaces the partition
+            index.clear(namespace)
+            index.add_documents(namespace, docs)
+            print(f"  Indexed {len(docs)} chunks")
+
+    elif args.command == "compact":
+        SparseIndex(args.dir).compact()
+
+    elif args.command == "search":
+        index = SparseIndex(args.dir)
+        namespaces = [args.namespace] if args.namespace else list(index.partitions)
+        for doc in index.search(args.query or "", namespaces, top_k=10):
+            print(f"{doc['score']:.3f}  [{doc['metadata'].get('namespace')}] "
+                  f"{doc['metadata'].get('source', 'Unknown')} p.{doc['metadata'].get('page', 'N/A')}")
+
+    print(json.dumps(SparseIndex(args.dir).stats(), indent=2))
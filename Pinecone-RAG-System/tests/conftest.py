@@ -0,0 +1,46 @@
+# Shared setup for the offline tests: the pipeline runs against the local
+# stand-ins in benchmarks/fakes.py, and nothing is written into the tree
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRATCH = tempfile.mkdtemp(prefix="rag_tests_")
+
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+os.environ["WARMUP_ON_STARTUP"] = "false"
+os.environ["CONCEPT_GRAPH_PATH"] = os.path.join(SCRATCH, "concept_graph.json")
+os.environ["SPARSE_INDEX_DIR"] = os.path.join(SCRATCH, "sparse_index")
+os.environ["NAMESPACE_ROUTER_PATH"] = ""
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import fakes  # noqa: E402
+
+
+@pytest.fixture
+def services():
+    """Install fast, jitter-free fakes into rag_llamaindex and empty its caches."""
+    import rag_llamaindex
+
+    installed = fakes.install(rag_llamaindex, fakes.FakeConfig(
+        docs_per_namespace=300, jitter=0, pinecone_ms=2, embed_ms=2, embed_per_text_ms=0,
+        llm_first_token_ms=2, llm_token_ms=0, cohere_ms=2, cohere_per_doc_ms=0
+    ))
+    rag_llamaindex.corpus_bm25_index = None
+    rag_llamaindex.namespace_router = None
+    for cache in (rag_llamaindex.embedding_cache, rag_llamaindex.llm_stage_cache,
+                  rag_llamaindex.rerank_cache, rag_llamaindex.answer_cache):
+        cache.clear()
+    return installed
+
+
+@pytest.fixture
+def rag(services):
+    """rag_llamaindex running on the fakes."""
+    import rag_llamaindex
+    return rag_llamaindex
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+import fakes
+from ingest import IngestState, Progress, ingest
+from sparse_index import SparseIndex
+
+BOOK = "Test Book"
+
+
+def write_pages(books_path: str, pages: list):
+    """Write a book folder with one .txt page per string (replacing the old pages)."""
+    book_dir = os.path.join(books_path, BOOK)
+    os.makedirs(book_dir, exist_ok=True)
+    for name in os.listdir(book_dir):
+        os.remove(os.path.join(book_dir, name))
+    for i, text in enumerate(pages):
+        with open(os.path.join(book_dir, f"page_{i:04d}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+@pytest.fixture
+def library(tmp_path):
+    """Ingest runs against a fake Pinecone index, with the sparse index in tmp_path."""
+    config = fakes.FakeConfig(docs_per_namespace=0, jitter=0, embed_ms=0, embed_per_text_ms=0,
+                              upsert_ms=0, pinecone_ms=0)
+    embedder = fakes.HashedEmbedder(config.dimensions)
+    latency = fakes.Latency(config.jitter, config.seed)
+    pinecone_index = fakes.FakePineconeIndex(embedder, latency, config)
+    embed_model = fakes.FakeEmbedding(embedder, latency, config)
+    state = IngestState(str(tmp_path / "state.sqlite"))
+    sparse = SparseIndex(str(tmp_path / "sparse_index"))
+    books_path = str(tmp_path / "Books")
+
+    # The sparse index must follow the run, never be re-exported from Pinecone
+    def no_export(*args, **kwargs):
+        raise AssertionError("ingest exported a namespace from Pinecone")
+    pinecone_index.list = pinecone_index.fetch = no_export
+
+    def run(pages: list) -> dict:
+        write_pages(books_path, pages)
+        return ingest({"llm": [BOOK]}, books_path, pinecone_index, embed_model, state,
+                      workers=2, embed_batch_size=1, progress=Progress(every=0), sparse_index=sparse)
+
+    yield run, sparse
+    state.close()
+
+
+def top_ids(sparse: SparseIndex, query: str) -> list:
+    return [doc["id"] for doc in sparse.search(query, ["llm"], top_k=5)]
+
+
+def test_ingest_updates_bm25_incrementally(library):
+    run, sparse = library
+
+    summary = run(["attention heads transformer", "kangaroo tokenizer vocabulary", "retrieval embeddings"])
+    assert summary["sparse_indexed"] == 3
+    kangaroo_ids = top_ids(sparse, "kangaroo")
+    assert len(kangaroo_ids) == 1
+
+    # Changed page: same chunk id, new text
+    summary = run(["attention heads transformer", "wombat tokenizer vocabulary", "retrieval embeddings"])
+    assert summary["sparse_indexed"] == 1
+    assert top_ids(sparse, "kangaroo") == []
+    assert top_ids(sparse, "wombat") == kangaroo_ids
+
+    # Shorter book: the stale chunk is tombstoned, then compacted away
+    summary = run(["attention heads transformer", "wombat tokenizer vocabulary"])
+    assert summary["deleted"] == 1
+    assert top_ids(sparse, "retrieval") == []
+    assert sparse.stats()["llm"] == {"docs": 2, "segments": 1}
@@ -0,0 +1,40 @@
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from local_vector_store import LocalVectorStore, NamespaceShard
+
+DIM = 8
+
+
+def unit(i: int) -> list:
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[i] = 1.0
+    return vector.tolist()
+
+
+def query_ids(store: LocalVectorStore, i: int, top_k: int = 2) -> list:
+    return store.query(VectorStoreQuery(query_embedding=unit(i), similarity_top_k=top_k)).ids
+
+
+def test_add_and_delete_update_the_shard(tmp_path):
+    docs = [{"id": f"llm-{i}", "text": f"chunk {i}", "metadata": {"source": "Book", "page": i}} for i in range(3)]
+    NamespaceShard.write(str(tmp_path / "llm"), docs, np.array([unit(i) for i in range(3)]))
+    store = LocalVectorStore(namespace="llm", store_dir=str(tmp_path))
+
+    store.delete_nodes(["llm-1"])
+    assert "llm-1" not in query_ids(store, 1, top_k=3)
+
+    # Tombstones are persisted with the shard
+    assert "llm-1" not in query_ids(LocalVectorStore(namespace="llm", store_dir=str(tmp_path)), 1, top_k=3)
+
+    store.add([
+        TextNode(id_="llm-3", text="chunk 3", metadata={"source": "Book", "page": 3}, embedding=unit(3)),
+        TextNode(id_="llm-0", text="chunk 0 revised", metadata={"source": "Book", "page": 0}, embedding=unit(4)),
+    ])
+    assert query_ids(store, 3, top_k=1) == ["llm-3"]
+    assert query_ids(store, 4, top_k=1) == ["llm-0"]
+    assert len(store.client) == 3  # llm-1 dropped, llm-0 replaced, llm-3 appended
+
+    store.delete("llm-3")
+    assert "llm-3" not in query_ids(store, 3, top_k=3)
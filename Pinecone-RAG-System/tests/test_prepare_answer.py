@@ -0,0 +1,31 @@
+import time
+import threading
+
+
+def test_original_question_is_retrieved_while_multi_query_runs(rag, services, monkeypatch):
+    question = "how does agent memory work with rag retrieval"
+    multi_query_done = threading.Event()
+    retrieved_early = []
+
+    index = services["pinecone_index"]
+    query = index.query
+
+    def recording_query(*args, **kwargs):
+        retrieved_early.append(not multi_query_done.is_set())
+        return query(*args, **kwargs)
+
+    def multi_query(query, num_queries=4):
+        time.sleep(0.2)
+        multi_query_done.set()
+        return {"original": query, "queries": [query, "agent memory in llm applications"], "num_variations": 2}
+
+    # Build the retrievers first, so first-use setup doesn't delay retrieval
+    rag.query_books("warm up", use_answer_cache=False, use_multi_query=False, use_hyde=False,
+                    use_graph=False, use_rerank=False)
+    monkeypatch.setattr(index, "query", recording_query)
+    monkeypatch.setattr(rag, "generate_multi_queries", multi_query)
+    rag.query_books(question, use_answer_cache=False, use_hyde=False, use_graph=False, use_rerank=False)
+
+    # Every namespace of the original question's row was fetched before the
+    # LLM stage returned
+    assert sum(retrieved_early) == len(rag.ACTIVE_NAMESPACES)
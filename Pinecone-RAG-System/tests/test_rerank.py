@@ -0,0 +1,34 @@
+import time
+import threading
+
+
+class SlowCohere:
+    """Cohere client whose rerank call hangs until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def rerank(self, model, query, documents, top_n=None, **kwargs):
+        self.calls += 1
+        self.release.wait(5)
+        raise RuntimeError("released")
+
+
+def test_slow_cohere_falls_back_to_local_rerank(rag, monkeypatch):
+    slow = SlowCohere()
+    monkeypatch.setattr(rag, "co", slow)
+    monkeypatch.setattr(rag, "RERANK_TIMEOUT_SECONDS", 0.1)
+
+    started = time.perf_counter()
+    try:
+        result = rag.query_books("how do transformers use attention", use_answer_cache=False,
+                                 use_multi_query=False, use_hyde=False, use_graph=False)
+    finally:
+        slow.release.set()
+    elapsed = time.perf_counter() - started
+
+    assert slow.calls == 1
+    assert result["reranker"] == "mmr"
+    assert result["sources"]
+    assert elapsed < 2
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from namespace_router import NamespaceRouter, fetch_namespace_vectors
+
+QUESTION = "how do agents use memory and retrieval"
+HYDE_DOC = "aws lambda s3 ec2 sagemaker bedrock serverless region"
+
+
+@pytest.fixture
+def router(rag, services, monkeypatch):
+    """Centroids of the fake corpus; routing keeps the best two namespaces."""
+    index = services["pinecone_index"]
+    rag.namespace_router = NamespaceRouter.build({ns: index.namespaces[ns][2] for ns in rag.ACTIVE_NAMESPACES}, 4)
+    monkeypatch.setattr(rag, "ROUTER_TOP_N", 2)
+    monkeypatch.setattr(rag, "ROUTER_THRESHOLD", 0.0)
+    yield rag.namespace_router
+    rag.namespace_router = None
+
+
+def run_with_stage_order(rag, monkeypatch, first: str) -> dict:
+    """query_books with multi-query and HyDE finishing in the given order."""
+    delays = {"multi_query": 0.0, "hyde": 0.2} if first == "multi_query" else {"multi_query": 0.2, "hyde": 0.0}
+
+    def multi_query(query, num_queries=4):
+        time.sleep(delays["multi_query"])
+        return {"original": query, "queries": [query, "python decorator generator asyncio"], "num_variations": 2}
+
+    def hyde(query):
+        time.sleep(delays["hyde"])
+        return {"original": query, "hypothetical_doc": HYDE_DOC, "hyde_used": True}
+
+    monkeypatch.setattr(rag, "generate_multi_queries", multi_query)
+    monkeypatch.setattr(rag, "generate_hypothetical_document", hyde)
+    return rag.query_books(QUESTION, use_answer_cache=False, use_graph=False, use_rerank=False)
+
+
+def test_routing_does_not_depend_on_stage_order(rag, router, monkeypatch):
+    embeddings = rag.embed_queries([QUESTION, HYDE_DOC])
+    expected = rag.route_namespaces(QUESTION, embeddings[QUESTION])
+    # The HyDE document alone would route elsewhere
+    assert rag.route_namespaces(HYDE_DOC, embeddings[HYDE_DOC]) != expected
+    assert len(expected) < len(rag.ACTIVE_NAMESPACES)
+
+    hyde_first = run_with_stage_order(rag, monkeypatch, "hyde")
+    multi_query_first = run_with_stage_order(rag, monkeypatch, "multi_query")
+
+    assert hyde_first["namespaces_searched"] == expected
+    assert multi_query_first["namespaces_searched"] == expected
+    assert [s["source"] for s in hyde_first["sources"]] == [s["source"] for s in multi_query_first["sources"]]
+
+
+def test_bm25_searches_the_routed_namespaces(rag, router, monkeypatch):
+    searched = []
+
+    class SparseIndex:
+        def search(self, query, namespaces, top_k=10):
+            searched.append(tuple(namespaces))
+            return []
+
+    monkeypatch.setattr(rag, "corpus_bm25_index", SparseIndex())
+    result = run_with_stage_order(rag, monkeypatch, "hyde")
+    assert set(searched) == {tuple(result["namespaces_searched"])}
+
+
+def test_centroid_sample_spans_the_namespace(services, monkeypatch):
+    index = services["pinecone_index"]
+    fetched = []
+    fetch = index.fetch
+
+    def recording_fetch(ids, namespace=None):
+        fetched.extend(ids)
+        return fetch(ids, namespace=namespace)
+
+    monkeypatch.setattr(index, "fetch", recording_fetch)
+    vectors = fetch_namespace_vectors(index, "llm", max_vectors=60)
+    first_sample = list(fetched)
+
+    # 300 chunks in three books of 100: a uniform sample reaches all of them
+    all_ids = index.namespaces["llm"][0]
+    assert len(vectors) == 60
+    assert len(set(first_sample)) == 60
+    assert {all_ids.index(i) // 100 for i in first_sample} == {0, 1, 2}
+
+    # Fixed seed: rebuilding samples the same chunks
+    fetched.clear()
+    fetch_namespace_vectors(index, "llm", max_vectors=60)
+    assert fetched == first_sample
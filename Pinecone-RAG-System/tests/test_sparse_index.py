@@ -0,0 +1,49 @@
+import pytest
+
+from sparse_index import SparseIndex
+
+
+def doc(doc_id: str, text: str) -> dict:
+    return {"id": doc_id, "text": text, "metadata": {"source": doc_id}}
+
+
+def filler(prefix: str, count: int) -> list:
+    return [doc(f"{prefix}-{i}", f"{prefix} filler text number {i}") for i in range(count)]
+
+
+def test_namespaces_are_scored_as_one_corpus(tmp_path):
+    # "python" is common in the small namespace and rare in the large one, so
+    # per-partition idf would favour the large namespace's weaker match
+    strong = doc("small-hit", "python python python tips")
+    weak = doc("large-hit", "python list tips advice")
+    split = SparseIndex(str(tmp_path / "split"))
+    split.add_documents("small", [strong, doc("small-0", "python basics here now")])
+    split.add_documents("large", [weak] + filler("large", 99))
+
+    merged = SparseIndex(str(tmp_path / "merged"))
+    merged.add_documents("all", [strong, doc("small-0", "python basics here now"), weak] + filler("large", 99))
+
+    results = split.search("python tips", ["small", "large"], top_k=3)
+    expected = merged.search("python tips", ["all"], top_k=3)
+
+    assert results[0]["id"] == "small-hit"
+    assert [d["id"] for d in results] == [d["id"] for d in expected]
+    assert [d["score"] for d in results] == pytest.approx([d["score"] for d in expected])
+    assert {d["metadata"]["namespace"] for d in results} == {"small", "large"}
+
+
+def test_tombstones_hide_deleted_docs_until_compaction(tmp_path):
+    index = SparseIndex(str(tmp_path))
+    index.add_documents("llm", [doc("a", "python tips"), doc("b", "python tricks")])
+    index.delete_documents("llm", ["a"])
+
+    assert [d["id"] for d in index.search("python", ["llm"])] == ["b"]
+    assert index.stats()["llm"] == {"docs": 1, "segments": 2}
+
+    index.add_documents("llm", [doc("a", "python again")])
+    assert {d["id"] for d in index.search("python", ["llm"])} == {"a", "b"}
+
+    index.compact()
+    reopened = SparseIndex(str(tmp_path))
+    assert {d["id"] for d in reopened.search("python", ["llm"])} == {"a", "b"}
+    assert reopened.stats()["llm"] == {"docs": 2, "segments": 1}
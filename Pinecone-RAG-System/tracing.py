@@ -0,0 +1,67 @@
+# Per-Request Stage Tracing for the RAG Pipeline
+# Records a timing span for every pipeline stage and every namespace
+# retrieval, plus candidate counts, without any external dependencies
+
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Optional
+
+
+class Trace:
+    """
+    Timing spans and counters for one query_books call.
+
+    Spans are recorded from the request thread and from the retrieval/stage
+    pool threads, so recording is lock-protected. Start offsets are relative
+    to the trace's creation.
+    """
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []   # dicts: name, start_ms, duration_ms, + attributes
+        self.counts = {}  # e.g. candidates, reranked
+
+    def _elapsed_ms(self, since: Optional[float] = None) -> float:
+        return round((time.perf_counter() - (self._origin if since is None else since)) * 1000, 2)
+
+    def record(self, name: str, start: float, **attributes):
+        """Record a span that started at perf_counter() value `start` and ends now."""
+        span = {
+            "name": name,
+            "start_ms": round((start - self._origin) * 1000, 2),
+            "duration_ms": self._elapsed_ms(start),
+            **attributes
+        }
+        with self._lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time the enclosed block as a span."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, **attributes)
+
+    def timed(self, name: str, func, **attributes):
+        """Wrap func so each call is recorded as a span (for pool submissions)."""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def count(self, name: str, value: int):
+        with self._lock:
+            self.counts[name] = value
+
+    def summary(self) -> dict:
+        """Total time so far, spans in start order, and counters."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+            counts = dict(self.counts)
+        return {"total_ms": self._elapsed_ms(), "spans": spans, "counts": counts}